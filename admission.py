@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+🧯 Controle de admissão do RouterLLM
+Num pico, aceitar tudo faz todo mundo estourar o prazo junto. Antes de cada
+pedido que chama provedor olhamos três sinais de saturação: pedidos em
+andamento, espera na fila de prioridade e atraso do event loop.
+- acima do nível "degradar": o roteamento vai para modelos baratos e rápidos
+  e o tráfego de lote é recusado (429)
+- acima do nível "recusar": todo pedido novo é recusado na hora (503)
+Recusas saem com Retry-After; sinais e decisões vão para o /metrics
+"""
+
+import math
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from starlette.datastructures import Headers
+
+import jsoncodec
+from metrics import metrics
+
+OK, DEGRADE, SHED = 0, 1, 2
+LEVEL_NAMES = ("ok", "degrade", "shed")
+
+class AdmissionController:
+    """
+    `max_in_flight`/`degrade_in_flight`: pedidos em andamento para recusar/degradar
+    `shed_queue`/`degrade_queue`: espera (s) do pedido mais antigo na fila da faixa
+    `shed_lag`/`degrade_lag`: atraso (s) do event loop
+    `queue_delay(lane)` e `loop_lag()` vêm do escalonador e do monitor do loop
+    """
+
+    def __init__(self, queue_delay: Callable[[str], float], loop_lag: Callable[[], float],
+                 max_in_flight: int = 256, degrade_in_flight: Optional[int] = None,
+                 shed_queue: float = 2.0, degrade_queue: float = 0.5,
+                 shed_lag: float = 0.5, degrade_lag: float = 0.1, min_retry_after: int = 1):
+        self.queue_delay = queue_delay
+        self.loop_lag = loop_lag
+        self.max_in_flight = max(1, max_in_flight)
+        self.degrade_in_flight = degrade_in_flight or max(1, int(self.max_in_flight * 0.75))
+        self.shed_queue = shed_queue
+        self.degrade_queue = degrade_queue
+        self.shed_lag = shed_lag
+        self.degrade_lag = degrade_lag
+        self.min_retry_after = min_retry_after
+        self.in_flight = 0
+        self._decisions: Dict[Tuple[str, str], int] = {}
+
+    def level(self, lane: str = "interactive") -> Tuple[int, Optional[str]]:
+        """(nível, sinal que o definiu) para um pedido novo da faixa"""
+        signals = (
+            ("in_flight", self.in_flight, self.degrade_in_flight, self.max_in_flight),
+            ("queue_delay", self.queue_delay(lane), self.degrade_queue, self.shed_queue),
+            ("loop_lag", self.loop_lag(), self.degrade_lag, self.shed_lag),
+        )
+        level, reason = OK, None
+        for name, value, degrade_at, shed_at in signals:
+            if value >= shed_at:
+                return SHED, name
+            if value >= degrade_at and level == OK:
+                level, reason = DEGRADE, name
+        return level, reason
+
+    @property
+    def degraded(self) -> bool:
+        """O roteamento deve preferir modelos baratos e rápidos agora?"""
+        return self.level()[0] >= DEGRADE
+
+    def saturation(self) -> float:
+        """Maior fração sinal/limite de recusa (>= 1.0 = recusando): bom sinal para o autoscaler"""
+        return max(self.in_flight / self.max_in_flight,
+                   self.queue_delay("interactive") / self.shed_queue if self.shed_queue else 0.0,
+                   self.loop_lag() / self.shed_lag if self.shed_lag else 0.0)
+
+    def admit(self, lane: str) -> Optional[Tuple[int, str, int]]:
+        """
+        Admite o pedido (None, e ele passa a contar em andamento) ou devolve
+        (status HTTP, motivo, Retry-After em segundos) para recusar
+        """
+        level, reason = self.level(lane)
+        if level == SHED or (level == DEGRADE and lane == "bulk"):
+            status = 503 if level == SHED else 429
+            self._count("shed", reason)
+            metrics.record_admission("shed", reason, lane)
+            # Depois da fila atual esvaziar, mais ou menos
+            retry_after = max(self.min_retry_after, math.ceil(self.queue_delay(lane)))
+            return status, reason, retry_after
+        decision = "degraded" if level == DEGRADE else "admitted"
+        self._count(decision, reason or "-")
+        metrics.record_admission(decision, reason or "-", lane)
+        self.in_flight += 1
+        metrics.set_active_requests(self.in_flight)
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+        metrics.set_active_requests(self.in_flight)
+
+    def _count(self, decision: str, reason: str):
+        key = (decision, reason)
+        self._decisions[key] = self._decisions.get(key, 0) + 1
+
+    def export(self):
+        """Atualiza os gauges de saturação (chamado a cada raspagem do /metrics)"""
+        level, _ = self.level()
+        metrics.set_admission_state(level, self.saturation(),
+                                    {lane: self.queue_delay(lane) for lane in ("interactive", "bulk")})
+
+    def stats(self) -> Dict[str, Any]:
+        level, reason = self.level()
+        decisions: Dict[str, Dict[str, int]] = {}
+        for (decision, why), count in self._decisions.items():
+            decisions.setdefault(decision, {})[why] = count
+        return {
+            "level": LEVEL_NAMES[level],
+            "reason": reason,
+            "saturation": round(self.saturation(), 3),
+            "in_flight": self.in_flight,
+            "queue_delay_ms": {lane: round(self.queue_delay(lane) * 1000, 1) for lane in ("interactive", "bulk")},
+            "loop_lag_ms": round(self.loop_lag() * 1000, 1),
+            "thresholds": {
+                "degrade": {"in_flight": self.degrade_in_flight, "queue_ms": self.degrade_queue * 1000,
+                            "loop_lag_ms": self.degrade_lag * 1000},
+                "shed": {"in_flight": self.max_in_flight, "queue_ms": self.shed_queue * 1000,
+                         "loop_lag_ms": self.shed_lag * 1000},
+            },
+            "decisions": decisions,
+        }
+
+class AdmissionMiddleware:
+    """
+    🚪 Aplica o controle de admissão antes do parse do corpo (só nos caminhos que
+    chamam provedor); o pedido conta como em andamento até o último byte da resposta
+    `lane_of(headers)`: faixa do pedido pela chave de API dos cabeçalhos
+    """
+
+    def __init__(self, app, controller: AdmissionController, paths: Sequence[str] = (),
+                 lane_of: Optional[Callable[[Headers], str]] = None):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+        self.lane_of = lane_of or (lambda headers: "interactive")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        rejected = self.controller.admit(self.lane_of(Headers(scope=scope)))
+        if rejected is not None:
+            await self._reject(scope, send, *rejected)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
+
+    @staticmethod
+    async def _reject(scope, send, status: int, reason: str, retry_after: int):
+        message = f"Roteador saturado ({reason}), tente de novo em {retry_after}s"
+        if scope["path"].startswith("/v1/"):
+            # Mesmo formato de erro da OpenAI: os SDKs respeitam o Retry-After
+            body = {"error": {"message": message, "type": "server_error" if status == 503 else "rate_limit_error",
+                              "param": None, "code": "overloaded"}}
+        else:
+            body = {"detail": message}
+        content = jsoncodec.dumps(body)
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(content)).encode()),
+            (b"retry-after", str(retry_after).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": content})
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+🌙 Modo offline (Batch API) do RouterLLM
+Recebe um JSONL de ChatRequest, roteia cada item com o mesmo roteador do
+/chat e agrupa os itens por provedor/modelo em submissões às Batch APIs
+da OpenAI e da Anthropic (metade do preço, resultado em até 24 h).
+Itens roteados para provedores sem Batch API rodam pelo caminho normal.
+O estado fica em SQLite e a saída volta em JSONL na ordem da entrada
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import jsoncodec
+from conversation import last_user_text, normalize_messages
+from keypool import mask_key
+from metrics import metrics
+from router import ModelResult
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE = "pending", "running", "done"
+BATCH_PROVIDERS = ("openai", "anthropic")
+# Estados finais das submissões em cada provedor
+OPENAI_FINAL = ("completed", "failed", "expired", "cancelled")
+ANTHROPIC_FINAL = ("ended",)
+
+class BatchStore:
+    """💾 Lotes em SQLite (estado completo em JSON; chamadas síncronas, rodar em thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                data TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS batches_status ON batches(status, created_at)")
+
+    def save(self, batch: Dict[str, Any]):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO batches (id, status, created_at, data) VALUES (?, ?, ?, ?)",
+            (batch["id"], batch["status"], batch["created_at"], jsoncodec.dumps(batch).decode("utf-8")),
+        )
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT data FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        return jsoncodec.loads(row[0]) if row else None
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        rows = self._conn.execute(
+            "SELECT data FROM batches WHERE status != ? ORDER BY created_at", (DONE,)
+        ).fetchall()
+        return [jsoncodec.loads(row[0]) for row in rows]
+
+    def close(self):
+        self._conn.close()
+
+class BatchRunner:
+    """
+    📦 Submete, acompanha e junta os lotes
+    `run_direct` executa um item pelo pipeline normal (devolve o dict do ChatResponse);
+    `base_urls` troca a URL da Batch API por provedor (ex.: servidor local de teste)
+    """
+
+    def __init__(self, router, run_direct: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 db_path: Optional[str] = None, poll_interval: float = 30.0,
+                 base_urls: Optional[Dict[str, Optional[str]]] = None, ledger=None,
+                 direct_concurrency: int = 8, finished_cache: int = 100):
+        self.router = router
+        self.run_direct = run_direct
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.base_urls = {k: v for k, v in (base_urls or {}).items() if v}
+        self.ledger = ledger
+        self.direct_concurrency = direct_concurrency
+        self.finished_cache = finished_cache
+        self.store: Optional[BatchStore] = None
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._tasks = set()
+        self._poller: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._db_lock = asyncio.Lock()
+
+    @property
+    def config(self):
+        return self.router.config
+
+    async def _db(self, method: str, *args):
+        """Acesso ao SQLite fora do event loop, serializado"""
+        if self.store is None:
+            return None
+        async with self._db_lock:
+            return await asyncio.to_thread(getattr(self.store, method), *args)
+
+    async def start(self):
+        """Abre o banco, retoma os lotes em andamento e inicia o acompanhamento"""
+        self._wakeup = asyncio.Event()
+        if self.db_path:
+            self.store = await asyncio.to_thread(BatchStore, self.db_path)
+            recovered = await self._db("unfinished")
+            for batch in recovered:
+                self._batches[batch["id"]] = batch
+                # Itens diretos sem resultado rodam de novo; submissões seguem sendo acompanhadas
+                self._spawn(self._run_direct_items(batch))
+            if recovered:
+                logger.info(f"🌙 {len(recovered)} lotes retomados do SQLite")
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+            self.store = None
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _base_url(self, provider: str) -> str:
+        return self.base_urls.get(provider) or self.config.get_provider(provider)["base_url"]
+
+    @staticmethod
+    def _headers(provider: str, api_key: str) -> Dict[str, str]:
+        if provider == "anthropic":
+            return {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+        return {"Authorization": f"Bearer {api_key}"}
+
+    def _keys(self, provider: str, submission: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        Chaves do pool do provedor; o acompanhamento de uma submissão usa a chave
+        que a criou (lotes pertencem ao projeto/conta da chave), se ainda configurada
+        """
+        keys = list(self.config.get_api_keys(provider))
+        label = submission.get("key") if submission else None
+        return [key for key in keys if mask_key(key) == label] or keys
+
+    async def _request(self, provider: str, what: str, method: str, url: str,
+                       submission: Optional[Dict[str, Any]] = None, headers: Optional[Dict[str, str]] = None,
+                       **kwargs):
+        """
+        🔑 Uma chamada à Batch API com ritmo e chave do pool (429 = outra chave, como no chat)
+        Devolve (resposta, chave usada); resposta que não é 200 vira exceção
+        """
+        client = self.router.get_client()
+
+        async def send(lease):
+            response = await client.request(method, url, headers={**self._headers(provider, lease.key),
+                                                                   **(headers or {})}, **kwargs)
+            lease.observe(response)
+            if response.status_code != 200:
+                raise Exception(f"{what} erro {response.status_code}: {response.text}")
+            return response, lease.key
+        return await self.router.call_with_key(provider, self._keys(provider, submission), 0, send)
+
+    def _route(self, item: Dict[str, Any]) -> Dict[str, str]:
+        forced = item.get("force_model")
+        if forced and forced in self.config.get_available_models():
+            return {"model": forced, "reasoning": f"🎯 Modelo forçado pelo usuário: {forced}"}
+        text = last_user_text(normalize_messages(item.get("message"), item.get("messages")))
+        model, reasoning = self.router.route_request(text, item.get("user_id") or "anonymous")
+        return {"model": model, "reasoning": reasoning}
+
+    async def submit(self, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Roteia os itens, cria as submissões por provedor/modelo e devolve o lote"""
+        batch = {
+            "id": uuid.uuid4().hex,
+            "status": PENDING,
+            "created_at": time.time(),
+            "finished_at": None,
+            "items": items,
+            "routes": [self._route(item) for item in items],
+            "results": [None] * len(items),
+            "submissions": [],
+            "direct": [],
+        }
+        groups: Dict[tuple, List[int]] = {}
+        for index, route in enumerate(batch["routes"]):
+            if route["model"] == "error":
+                batch["results"][index] = self._failed(index, route, route["reasoning"])
+                continue
+            provider = self.config.models[route["model"]]["provider"]
+            if provider in BATCH_PROVIDERS:
+                # A Batch API da OpenAI exige um modelo por arquivo: agrupa por provedor + modelo
+                groups.setdefault((provider, route["model"]), []).append(index)
+            else:
+                batch["direct"].append(index)
+
+        self._batches[batch["id"]] = batch
+        for (provider, model), indices in groups.items():
+            submission = {"provider": provider, "model": model, "indices": indices,
+                          "id": None, "status": "submitting", "error": None, "key": None}
+            batch["submissions"].append(submission)
+            try:
+                if provider == "openai":
+                    await self._submit_openai(batch, submission)
+                else:
+                    await self._submit_anthropic(batch, submission)
+                metrics.record_batch_submission(provider, "submitted")
+            except Exception as e:
+                logger.error(f"❌ Falha ao submeter lote {provider}/{model}: {e}")
+                metrics.record_batch_submission(provider, "failed")
+                submission["status"] = "failed"
+                submission["error"] = str(e)
+                for index in indices:
+                    batch["results"][index] = self._failed(index, batch["routes"][index], str(e))
+
+        batch["status"] = RUNNING
+        await self._db("save", batch)
+        self._spawn(self._run_direct_items(batch))
+        await self._maybe_finish(batch)
+        return batch
+
+    def _custom_id(self, index: int) -> str:
+        return f"item-{index}"
+
+    def _item_call(self, batch: Dict[str, Any], index: int):
+        item = batch["items"][index]
+        messages = normalize_messages(item.get("message"), item.get("messages"))
+        return messages, item.get("system"), item.get("max_tokens") or 1000, item.get("temperature", 0.7)
+
+    async def _submit_openai(self, batch: Dict[str, Any], submission: Dict[str, Any]):
+        """Sobe o JSONL em /files e cria o lote em /batches"""
+        lines = []
+        for index in submission["indices"]:
+            messages, system, max_tokens, temperature = self._item_call(batch, index)
+            lines.append(jsoncodec.dumps({
+                "custom_id": self._custom_id(index),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self.router.openai_payload(submission["model"], messages, system, max_tokens, temperature),
+            }))
+        base_url = self._base_url("openai")
+        response, key = await self._request(
+            "openai", "OpenAI /files", "POST", f"{base_url}/files",
+            data={"purpose": "batch"},
+            files={"file": (f"routerllm-{batch['id']}.jsonl", b"\n".join(lines), "application/jsonl")},
+        )
+        file_id = jsoncodec.loads(response.content)["id"]
+        # O arquivo só existe na conta da chave que o subiu: o lote sai pela mesma chave
+        submission["key"] = mask_key(key)
+        response, _ = await self._request(
+            "openai", "OpenAI /batches", "POST", f"{base_url}/batches", submission,
+            headers={"Content-Type": "application/json"},
+            content=jsoncodec.dumps({"input_file_id": file_id, "endpoint": "/v1/chat/completions",
+                                     "completion_window": "24h"}),
+        )
+        data = jsoncodec.loads(response.content)
+        submission["id"] = data["id"]
+        submission["status"] = data.get("status", "validating")
+
+    async def _submit_anthropic(self, batch: Dict[str, Any], submission: Dict[str, Any]):
+        requests = []
+        for index in submission["indices"]:
+            messages, system, max_tokens, temperature = self._item_call(batch, index)
+            requests.append({
+                "custom_id": self._custom_id(index),
+                "params": self.router.anthropic_payload(submission["model"], messages, system, max_tokens, temperature),
+            })
+        response, key = await self._request(
+            "anthropic", "Anthropic /messages/batches", "POST", f"{self._base_url('anthropic')}/messages/batches",
+            headers={"Content-Type": "application/json"},
+            content=jsoncodec.dumps({"requests": requests}),
+        )
+        data = jsoncodec.loads(response.content)
+        submission["id"] = data["id"]
+        submission["key"] = mask_key(key)
+        submission["status"] = data.get("processing_status", "in_progress")
+
+    async def _run_direct_items(self, batch: Dict[str, Any]):
+        """Itens de provedores sem Batch API: pipeline normal, com concorrência limitada"""
+        indices = [i for i in batch["direct"] if batch["results"][i] is None]
+        if not indices:
+            return
+        semaphore = asyncio.Semaphore(self.direct_concurrency)
+
+        async def run(index: int):
+            async with semaphore:
+                route = batch["routes"][index]
+                try:
+                    item = {**batch["items"][index], "force_model": route["model"]}
+                    response = await self.run_direct(item)
+                    batch["results"][index] = {
+                        "index": index,
+                        "mode": "direct",
+                        "model_used": response["model_used"],
+                        "reasoning": route["reasoning"],
+                        "response": response["response"],
+                        "tokens_used": response["tokens_used"],
+                        "cost_estimate": response["cost_estimate"],
+                        "error": None,
+                    }
+                except Exception as e:
+                    batch["results"][index] = self._failed(index, route, str(e), mode="direct")
+
+        await asyncio.gather(*(run(i) for i in indices))
+        await self._db("save", batch)
+        await self._maybe_finish(batch)
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            for batch in [b for b in self._batches.values() if b["status"] == RUNNING]:
+                try:
+                    await self.poll(batch)
+                except Exception as e:
+                    logger.error(f"❌ Falha ao acompanhar o lote {batch['id']}: {e}")
+
+    def wake(self):
+        """Força uma rodada de acompanhamento agora (testes e admin)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def poll(self, batch: Dict[str, Any]):
+        changed = False
+        for submission in batch["submissions"]:
+            if submission["id"] is None or submission["status"] in OPENAI_FINAL + ANTHROPIC_FINAL:
+                continue
+            if submission["provider"] == "openai":
+                changed |= await self._poll_openai(batch, submission)
+            else:
+                changed |= await self._poll_anthropic(batch, submission)
+        if changed:
+            await self._db("save", batch)
+            await self._maybe_finish(batch)
+
+    async def _poll_openai(self, batch: Dict[str, Any], submission: Dict[str, Any]) -> bool:
+        base_url = self._base_url("openai")
+        response, _ = await self._request("openai", "OpenAI /batches", "GET",
+                                          f"{base_url}/batches/{submission['id']}", submission)
+        data = jsoncodec.loads(response.content)
+        status = data["status"]
+        if status not in OPENAI_FINAL:
+            changed = status != submission["status"]
+            submission["status"] = status
+            return changed
+        # Lotes expirados ou cancelados também podem trazer resultados parciais.
+        # Tudo baixado antes de registrar: falha no download é refeita na próxima rodada
+        contents = []
+        for key in ("output_file_id", "error_file_id"):
+            if data.get(key):
+                content, _ = await self._request("openai", "OpenAI /files", "GET",
+                                                 f"{base_url}/files/{data[key]}/content", submission)
+                contents.append(content.content)
+        for content in contents:
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                row = jsoncodec.loads(line)
+                index = int(row["custom_id"].split("-", 1)[1])
+                body = (row.get("response") or {}).get("body")
+                if row.get("error") or (row.get("response") or {}).get("status_code") != 200:
+                    error = row.get("error") or (body or {}).get("error") or "erro desconhecido"
+                    self._record_failure(batch, index, f"OpenAI: {error}")
+                else:
+                    self._record_success(batch, index, self.router.parse_openai(body))
+        self._close_submission(batch, submission, status)
+        return True
+
+    async def _poll_anthropic(self, batch: Dict[str, Any], submission: Dict[str, Any]) -> bool:
+        response, _ = await self._request(
+            "anthropic", "Anthropic /messages/batches", "GET",
+            f"{self._base_url('anthropic')}/messages/batches/{submission['id']}", submission)
+        data = jsoncodec.loads(response.content)
+        status = data["processing_status"]
+        if status not in ANTHROPIC_FINAL:
+            changed = status != submission["status"]
+            submission["status"] = status
+            return changed
+        if data.get("results_url"):
+            # Falha no download é refeita na próxima rodada (a submissão segue aberta)
+            content, _ = await self._request("anthropic", "Anthropic results", "GET", data["results_url"], submission)
+            for line in content.content.splitlines():
+                if not line.strip():
+                    continue
+                row = jsoncodec.loads(line)
+                index = int(row["custom_id"].split("-", 1)[1])
+                result = row["result"]
+                if result["type"] == "succeeded":
+                    self._record_success(batch, index, self.router.parse_anthropic(result["message"]))
+                else:
+                    self._record_failure(batch, index, f"Anthropic: {result.get('error') or result['type']}")
+        self._close_submission(batch, submission, status)
+        return True
+
+    def _close_submission(self, batch: Dict[str, Any], submission: Dict[str, Any], status: str):
+        submission["status"] = status
+        for index in submission["indices"]:
+            if batch["results"][index] is None:
+                self._record_failure(batch, index, f"sem resultado (lote {status})")
+        metrics.record_batch_submission(submission["provider"], status)
+        logger.info(f"🌙 Lote {submission['provider']} {submission['id']} terminou: {status}")
+
+    def _record_success(self, batch: Dict[str, Any], index: int, result: ModelResult):
+        route = batch["routes"][index]
+        model = route["model"]
+        cost = self.router.batch_cost(model, result)
+        metrics.record_request(model, "success")
+        metrics.record_tokens(model, result.input_tokens, result.output_tokens)
+        metrics.record_cost(model, cost)
+        if self.ledger is not None:
+            self.ledger.record(batch["items"][index].get("user_id") or "anonymous", model, "batch",
+                               result.input_tokens, result.output_tokens, result.cached_tokens, cost)
+        batch["results"][index] = {
+            "index": index,
+            "mode": "batch",
+            "model_used": model,
+            "reasoning": route["reasoning"],
+            "response": result.text,
+            "tokens_used": result.tokens_used,
+            "cost_estimate": cost,
+            "error": None,
+        }
+
+    def _record_failure(self, batch: Dict[str, Any], index: int, error: str):
+        metrics.record_request(batch["routes"][index]["model"], "error")
+        batch["results"][index] = self._failed(index, batch["routes"][index], error)
+
+    @staticmethod
+    def _failed(index: int, route: Dict[str, str], error: str, mode: str = "batch") -> Dict[str, Any]:
+        return {"index": index, "mode": mode, "model_used": route["model"], "reasoning": route["reasoning"],
+                "response": None, "tokens_used": 0, "cost_estimate": 0.0, "error": error}
+
+    async def _maybe_finish(self, batch: Dict[str, Any]):
+        if batch["status"] == DONE or any(r is None for r in batch["results"]):
+            return
+        batch["status"] = DONE
+        batch["finished_at"] = time.time()
+        await self._db("save", batch)
+        self._forget_old_batches()
+
+    def _forget_old_batches(self):
+        """Só os lotes recentes ficam em memória; os antigos ficam no SQLite (se houver)"""
+        if self.store is None:
+            return
+        finished = [b for b in self._batches.values() if b["status"] == DONE]
+        for batch in finished[:max(0, len(finished) - self.finished_cache)]:
+            del self._batches[batch["id"]]
+
+    async def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            batch = await self._db("get", batch_id)
+        return batch
+
+    @staticmethod
+    def summary(batch: Dict[str, Any]) -> Dict[str, Any]:
+        results = [r for r in batch["results"] if r is not None]
+        return {
+            "batch_id": batch["id"],
+            "status": batch["status"],
+            "created_at": batch["created_at"],
+            "finished_at": batch["finished_at"],
+            "items": len(batch["items"]),
+            "completed": len(results),
+            "failed": sum(1 for r in results if r["error"]),
+            "direct_items": len(batch["direct"]),
+            "cost_estimate": sum(r["cost_estimate"] for r in results),
+            "submissions": [
+                {k: s[k] for k in ("provider", "model", "id", "status", "error")} | {"items": len(s["indices"])}
+                for s in batch["submissions"]
+            ],
+        }
+
+    @staticmethod
+    def output_jsonl(batch: Dict[str, Any]) -> bytes:
+        """Um resultado por linha, na ordem da entrada"""
+        return b"".join(jsoncodec.dumps(result) + b"\n" for result in batch["results"])
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for batch in self._batches.values():
+            counts[batch["status"]] = counts.get(batch["status"], 0) + 1
+        return {"persistent": self.store is not None, "poll_interval": self.poll_interval, "by_status": counts}
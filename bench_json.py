@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark de CPU por requisição no /chat (JSON de ponta a ponta)
+Compara o codec rápido (orjson) com o json da biblioteca padrão
+para prompts de 1 KB, 100 KB e 1 MB, com o provedor simulado em memória
+"""
+
+import asyncio
+import os
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", "")
+os.environ["ANTHROPIC_API_KEY"] = "sk-ant-bench"
+
+import httpx
+
+import jsoncodec
+import main
+
+SIZES = {"1 KB": 1024, "100 KB": 100 * 1024, "1 MB": 1024 * 1024}
+REQUESTS = {"1 KB": 300, "100 KB": 60, "1 MB": 10}
+
+def fake_anthropic(request: httpx.Request) -> httpx.Response:
+    """Provedor simulado: devolve uma resposta de ~2 KB"""
+    body = jsoncodec.dumps({
+        "content": [{"type": "text", "text": "Resumo da análise. " * 100}],
+        "stop_reason": "end_turn",
+        "usage": {"input_tokens": len(request.content) // 4, "output_tokens": 500},
+    })
+    return httpx.Response(200, content=body, headers={"content-type": "application/json"})
+
+async def run_size(client: httpx.AsyncClient, size: int, count: int) -> float:
+    prompt = ("Analise o contrato a seguir e aponte riscos. " * (size // 46 + 1))[:size]
+    body = jsoncodec.dumps({"message": prompt, "force_model": "claude-3-5-sonnet"})
+    headers = {"content-type": "application/json", "accept-encoding": "gzip"}
+    # Aquecimento
+    await client.post("/chat", content=body, headers=headers)
+    start = time.process_time()
+    for _ in range(count):
+        response = await client.post("/chat", content=body, headers=headers)
+        assert response.status_code == 200, response.text
+    return (time.process_time() - start) / count
+
+async def main_async():
+    main.config.reload(reload_env=False)
+    main.router._client = httpx.AsyncClient(transport=httpx.MockTransport(fake_anthropic))
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print("⏱️  CPU por requisição no /chat")
+        print("=" * 50)
+        print(f"{'prompt':>8} | {'json':>10} | {'orjson':>10} | ganho")
+        for label, size in SIZES.items():
+            results = {}
+            for backend in ("json", "orjson"):
+                jsoncodec.set_backend(backend)
+                results[backend] = await run_size(client, size, REQUESTS[label])
+            gain = results["json"] / results["orjson"] if results["orjson"] else 0
+            print(f"{label:>8} | {results['json'] * 1000:8.2f}ms | {results['orjson'] * 1000:8.2f}ms | {gain:.1f}x")
+        if jsoncodec.orjson is None:
+            print("⚠️  orjson não instalado: as duas colunas usam o json padrão")
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
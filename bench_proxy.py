@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark do overhead do /v1/chat/completions (repasse direto)
+Compara, no mesmo processo e pela mesma pilha ASGI, uma rota que só devolve
+a resposta pronta do "provedor" com o /v1 repassando para o provedor simulado
+em memória. A diferença é o que o proxy acrescenta: parse dos campos de
+roteamento, troca do "model" nos bytes, escolha de endpoint/chave, o cliente
+HTTP até o provedor e o repasse.
+Overhead medido por pares: cada pedido ao proxy vai colado a um pedido à base
+(ordem alternada) e o overhead do par é a diferença dos dois; os percentis
+saem dessas diferenças. Várias rodadas depois do aquecimento, com coleta de
+lixo entre pares (fora da medição); vale a mediana das rodadas
+"""
+
+import asyncio
+import gc
+import os
+import statistics
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("LOG_FILE", "")
+os.environ.setdefault("USAGE_DB_PATH", "")
+os.environ.setdefault("BATCH_DB_PATH", "")
+os.environ["OPENAI_API_KEY"] = "sk-bench-000000000000"
+# Só o provedor simulado: o "auto" não pode cair num provedor de verdade do .env
+for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "GOOGLE_API_KEYS", "OPENAI_API_KEYS"):
+    os.environ[name] = ""
+
+import httpx
+from fastapi.responses import Response, StreamingResponse
+
+import jsoncodec
+import main
+
+WARMUP = 300
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "5"))
+PAIRS = int(os.getenv("BENCH_PAIRS", "1000"))
+BUDGET_MS = 1.0
+
+COMPLETION = jsoncodec.dumps({
+    "id": "chatcmpl-bench", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "Resposta do provedor. " * 40},
+                 "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 200, "completion_tokens": 200, "total_tokens": 400},
+})
+STREAM = b"".join(
+    b'data: {"id":"chatcmpl-bench","object":"chat.completion.chunk","choices":[{"index":0,"delta":{"content":"tok "}}]}\n\n'
+    for _ in range(50)
+) + b"data: [DONE]\n\n"
+PROMPT = {"messages": [{"role": "system", "content": "Você é um assistente."},
+                       {"role": "user", "content": "Resuma o texto a seguir. " * 50}],
+          "max_tokens": 200}
+
+def fake_openai(request: httpx.Request) -> httpx.Response:
+    """Provedor simulado: resposta pronta, sem latência"""
+    if b'"stream":true' in request.content:
+        return httpx.Response(200, content=STREAM, headers={"content-type": "text/event-stream"})
+    return httpx.Response(200, content=COMPLETION, headers={"content-type": "application/json"})
+
+async def baseline_completion():
+    return Response(content=COMPLETION, media_type="application/json")
+
+async def baseline_stream():
+    async def chunks():
+        yield STREAM
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+async def timed(client: httpx.AsyncClient, path: str, body: bytes) -> float:
+    start = time.perf_counter()
+    response = await client.post(path, content=body)
+    await response.aread()
+    elapsed = time.perf_counter() - start
+    assert response.status_code == 200, response.text
+    return elapsed
+
+async def measure_pairs(client: httpx.AsyncClient, baseline_path: str, body: bytes, pairs: int) -> tuple:
+    """(tempos da base, tempos do proxy, overhead de cada par) em segundos"""
+    base, proxied, deltas = [], [], []
+    for i in range(pairs):
+        # Coleta entre os pares: uma coleta completa caindo num pedido só mede o coletor
+        gc.collect(0 if i % 100 else 2)
+        gc.disable()
+        try:
+            if i % 2:
+                proxy_time = await timed(client, "/v1/chat/completions", body)
+                base_time = await timed(client, baseline_path, body)
+            else:
+                base_time = await timed(client, baseline_path, body)
+                proxy_time = await timed(client, "/v1/chat/completions", body)
+        finally:
+            gc.enable()
+        base.append(base_time)
+        proxied.append(proxy_time)
+        deltas.append(proxy_time - base_time)
+    return base, proxied, deltas
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def main_async():
+    main.config.reload(reload_env=False)
+    main.router._client = httpx.AsyncClient(transport=httpx.MockTransport(fake_openai))
+    main.app.add_api_route("/bench/completion", baseline_completion, methods=["POST"])
+    main.app.add_api_route("/bench/stream", baseline_stream, methods=["POST"])
+    transport = httpx.ASGITransport(app=main.app)
+    print("⏱️  Overhead do proxy /v1/chat/completions (repasse direto)")
+    print("=" * 78)
+    print(f"{'caso':>18} | {'base p50':>9} | {'proxy p50':>9} | {'overhead p50':>12} | "
+          f"{'overhead p99':>12} | p99 por rodada (ms)")
+    failed = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        cases = [
+            ("modelo explícito", {"model": "gpt-4o-mini"}, "/bench/completion"),
+            ("model=auto", {"model": "auto"}, "/bench/completion"),
+            ("streaming", {"model": "gpt-4o-mini", "stream": True}, "/bench/stream"),
+        ]
+        for label, extra, baseline_path in cases:
+            body = jsoncodec.dumps({**extra, **PROMPT})
+            await measure_pairs(client, baseline_path, body, WARMUP)
+            base, proxied, p50s, p99s = [], [], [], []
+            for _ in range(ROUNDS):
+                round_base, round_proxied, deltas = await measure_pairs(client, baseline_path, body, PAIRS)
+                base += round_base
+                proxied += round_proxied
+                p50s.append(statistics.median(deltas) * 1000)
+                p99s.append(percentile(deltas, 0.99) * 1000)
+            overhead_p99 = statistics.median(p99s)
+            if overhead_p99 >= BUDGET_MS:
+                failed.append(label)
+            print(f"{label:>18} | {statistics.median(base) * 1000:7.3f}ms | {statistics.median(proxied) * 1000:7.3f}ms"
+                  f" | {statistics.median(p50s):10.3f}ms | {overhead_p99:10.3f}ms | "
+                  + " ".join(f"{p:.2f}" for p in p99s))
+    await main.router.aclose()
+    print()
+    summary = f"overhead p99 (mediana de {ROUNDS} rodadas × {PAIRS} pares)"
+    if failed:
+        print(f"❌ {summary} >= {BUDGET_MS} ms em: {', '.join(failed)}")
+    else:
+        print(f"✅ {summary} < {BUDGET_MS} ms em todos os casos")
+
+if __name__ == "__main__":
+    asyncio.run(main_async())
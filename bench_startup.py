@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+⏱️ Benchmark de cold start do RouterLLM
+Mede o tempo de import do main.py e o tempo até a primeira resposta,
+simulando o cold start de uma função serverless (Vercel)
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+RUNS = int(os.getenv("BENCH_RUNS", "5"))
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import main
+print(time.perf_counter() - t0)
+"""
+
+FIRST_RESPONSE_SCRIPT = """
+import time
+t0 = time.perf_counter()
+import main
+from starlette.testclient import TestClient
+client = TestClient(main.app)
+response = client.get("/status")
+assert response.status_code == 200, response.status_code
+print(time.perf_counter() - t0)
+"""
+
+LAZY_MODULES_SCRIPT = """
+import sys
+import main
+print(",".join(m for m in ("jinja2", "prometheus_client", "httpx", "uvicorn") if m in sys.modules))
+"""
+
+def run_python(code: str) -> str:
+    """Executa um trecho em um processo novo (cold start real)"""
+    env = {**os.environ, "VERCEL": "1", "LOG_LEVEL": "WARNING"}
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ""
+
+def measure(code: str) -> list:
+    return [float(run_python(code)) for _ in range(RUNS)]
+
+def snapshot_files() -> dict:
+    """Lista arquivos e mtimes do projeto para detectar escritas no import"""
+    files = {}
+    for root, dirs, names in os.walk(BASE_DIR):
+        dirs[:] = [d for d in dirs if d not in (".git", "__pycache__")]
+        for name in names:
+            path = os.path.join(root, name)
+            files[path] = os.path.getmtime(path)
+    return files
+
+def main():
+    print("⏱️  Benchmark de cold start do RouterLLM")
+    print("=" * 50)
+
+    before = snapshot_files()
+    import_times = measure(IMPORT_SCRIPT)
+    after = snapshot_files()
+
+    print(f"📦 Import do main.py ({RUNS} execuções)")
+    print(f"   mediana: {statistics.median(import_times) * 1000:.1f} ms | min: {min(import_times) * 1000:.1f} ms")
+
+    first_response = measure(FIRST_RESPONSE_SCRIPT)
+    print(f"🚀 Tempo até a primeira resposta (GET /status)")
+    print(f"   mediana: {statistics.median(first_response) * 1000:.1f} ms | min: {min(first_response) * 1000:.1f} ms")
+
+    loaded = run_python(LAZY_MODULES_SCRIPT)
+    print(f"💤 Módulos pesados carregados no import: {loaded or 'nenhum'}")
+
+    written = [path for path in after if before.get(path) != after[path]]
+    if written:
+        print(f"❌ Arquivos escritos durante o import: {written}")
+    else:
+        print("✅ Nenhum arquivo escrito durante o import")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+🪜 Cascata de custo do RouterLLM
+Responde primeiro com o modelo mais barato da categoria e só escala para o
+premium quando uma checagem local de qualidade reprova a resposta
+"""
+
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+# Frases que indicam recusa ou resposta evasiva (comparadas em minúsculas)
+DEFAULT_REFUSAL_PHRASES = (
+    "não posso ajudar", "não consigo ajudar", "não sou capaz", "não tenho como",
+    "i can't help", "i cannot help", "i'm unable to", "i am unable to", "as an ai",
+    "como uma ia", "como um modelo de linguagem",
+)
+DEFAULT_HEDGE_PHRASES = (
+    "não tenho certeza", "talvez", "possivelmente", "não sei ao certo", "pode ser que",
+    "i'm not sure", "i am not sure", "it depends", "possibly", "i don't know",
+)
+
+def check_answer(text: str, avg_logprob: Optional[float], settings: Mapping[str, Any]) -> Optional[str]:
+    """
+    ✅ Checagem barata da resposta do modelo econômico
+    Devolve o motivo da reprovação (None = resposta aceita)
+    """
+    stripped = text.strip()
+    if len(stripped) < settings.get("min_response_chars", 20):
+        return "resposta curta"
+    lowered = stripped.lower()
+    if any(phrase in lowered for phrase in settings.get("refusal_phrases", DEFAULT_REFUSAL_PHRASES)):
+        return "recusa"
+    hedges = sum(lowered.count(phrase) for phrase in settings.get("hedge_phrases", DEFAULT_HEDGE_PHRASES))
+    if hedges > settings.get("max_hedges", 1):
+        return "hesitação"
+    min_logprob = settings.get("min_avg_logprob")
+    if avg_logprob is not None and min_logprob is not None and avg_logprob < min_logprob:
+        return "baixa confiança"
+    return None
+
+class CascadeStats:
+    """📊 Estatísticas da cascata por categoria: economia x latência das escaladas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._categories: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, category: str, failure: Optional[str], saved_cost: float, added_latency: float):
+        """`saved_cost` é negativo quando a escalada desperdiçou a tentativa barata"""
+        with self._lock:
+            stats = self._categories.setdefault(category, {
+                "attempts": 0,
+                "accepted": 0,
+                "escalated": 0,
+                "cost_saved": 0.0,
+                "escalation_latency_added": 0.0,
+                "failure_reasons": {},
+            })
+            stats["attempts"] += 1
+            stats["cost_saved"] += saved_cost
+            if failure is None:
+                stats["accepted"] += 1
+            else:
+                stats["escalated"] += 1
+                stats["escalation_latency_added"] += added_latency
+                stats["failure_reasons"][failure] = stats["failure_reasons"].get(failure, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for category, stats in self._categories.items():
+                escalated = stats["escalated"]
+                result[category] = {
+                    **stats,
+                    "failure_reasons": dict(stats["failure_reasons"]),
+                    "acceptance_rate": stats["accepted"] / stats["attempts"],
+                    "avg_escalation_latency": stats["escalation_latency_added"] / escalated if escalated else 0.0,
+                }
+            return result
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+📚 Catálogo declarativo de modelos e regras do RouterLLM
+Lê o routing.json, valida e compila em uma tabela de roteamento imutável
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing.json")
+
+# Tipo de provedor para servidores de inferência próprios (compatíveis com OpenAI)
+LOCAL = "local"
+
+# Marcador no pool de um servidor próprio sem chave ("local:sem-chave"): nunca vai no cabeçalho
+NO_KEY_SUFFIX = ":sem-chave"
+
+# Categorias que as regras manuais (LLMRouter._categorize_by_rules) podem devolver
+RULE_CATEGORIES = ("code", "simple", "long_text", "creative", "general")
+
+class CatalogError(ValueError):
+    """Catálogo inválido - a tabela anterior continua em uso"""
+
+@dataclass(frozen=True)
+class RoutingTable:
+    """
+    🗂️ Tabela de roteamento compilada (somente leitura)
+    Trocada inteira de uma vez; requisições em andamento seguem na tabela antiga
+    """
+    version: str
+    source: str
+    loaded_at: float
+    providers: Mapping[str, Mapping[str, Any]]
+    models: Mapping[str, Mapping[str, Any]]
+    categories: Mapping[str, Mapping[str, Any]]
+    rules: Mapping[str, Any]
+    settings: Mapping[str, Any]
+    available_providers: Tuple[str, ...]
+    available_models: Mapping[str, Mapping[str, Any]]
+    default_model: str
+    fallback_model: str
+    cascade: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    embedding_models: Mapping[str, Mapping[str, Any]] = field(default_factory=lambda: MappingProxyType({}))
+    available_embedding_models: Tuple[str, ...] = ()
+    api_keys: Mapping[str, str] = field(repr=False, default_factory=lambda: MappingProxyType({}))
+    api_key_pools: Mapping[str, Tuple[str, ...]] = field(repr=False, default_factory=lambda: MappingProxyType({}))
+    # Endpoints de cada modelo disponível, com chaves já resolvidas
+    model_endpoints: Mapping[str, Tuple[Mapping[str, Any], ...]] = field(
+        repr=False, default_factory=lambda: MappingProxyType({}))
+    # Provedores próprios ("type": "local"): disponíveis pela URL, roteáveis pela sonda de saúde
+    local_providers: Tuple[str, ...] = ()
+
+def _freeze(value):
+    """Converte dicts/listas do JSON em estruturas imutáveis"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+def _is_configured(key: Optional[str], placeholder: str) -> bool:
+    return bool(key and key.strip() and not key.startswith(placeholder))
+
+def _key_pool(env: Mapping[str, str], env_key: str, placeholder: str) -> Tuple[str, ...]:
+    """Uma chave (OPENAI_API_KEY) e/ou várias (OPENAI_API_KEYS=sk-a,sk-b), sem repetidas"""
+    candidates = [env.get(env_key)] + env.get(env_key + "S", "").split(",")
+    pool = []
+    for key in candidates:
+        key = (key or "").strip()
+        if _is_configured(key, placeholder) and key not in pool:
+            pool.append(key)
+    return tuple(pool)
+
+def validate_catalog(data: Dict[str, Any]) -> List[str]:
+    """✅ Retorna a lista de problemas encontrados (vazia = catálogo válido)"""
+    if not isinstance(data, dict):
+        return ["o catálogo deve ser um objeto JSON"]
+    problems = []
+    for section in ("providers", "models", "categories", "rules"):
+        if not isinstance(data.get(section), dict) or not data[section]:
+            problems.append(f"seção '{section}' ausente ou vazia")
+    if problems:
+        return problems
+
+    providers = data["providers"]
+    for name, provider in providers.items():
+        if not isinstance(provider, dict):
+            problems.append(f"provider '{name}' deve ser um objeto")
+            continue
+        if "type" in provider and provider["type"] != LOCAL:
+            problems.append(f"provider '{name}': 'type' desconhecido (só '{LOCAL}')")
+        if provider.get("type") == LOCAL:
+            # Servidor próprio: chave opcional; URL fixa e/ou de uma variável de ambiente
+            if not any(isinstance(provider.get(k), str) and provider[k] for k in ("base_url", "base_url_env")):
+                problems.append(f"provider '{name}': 'base_url' ou 'base_url_env' obrigatório")
+            for key in ("env_key", "base_url", "base_url_env"):
+                if key in provider and (not isinstance(provider[key], str) or not provider[key]):
+                    problems.append(f"provider '{name}': '{key}' deve ser texto")
+            if "max_concurrency" in provider and (not isinstance(provider["max_concurrency"], int)
+                                                  or provider["max_concurrency"] <= 0):
+                problems.append(f"provider '{name}': 'max_concurrency' deve ser inteiro > 0")
+        else:
+            for key in ("env_key", "base_url"):
+                if not isinstance(provider.get(key), str) or not provider[key]:
+                    problems.append(f"provider '{name}': campo '{key}' obrigatório")
+        multiplier = provider.get("batch_cost_multiplier", 1.0)
+        if not isinstance(multiplier, (int, float)) or not 0 < multiplier <= 1:
+            problems.append(f"provider '{name}': 'batch_cost_multiplier' deve estar em (0, 1]")
+
+    models = data["models"]
+    for name, model in models.items():
+        if not isinstance(model, dict):
+            problems.append(f"modelo '{name}' deve ser um objeto")
+            continue
+        if model.get("provider") not in providers:
+            problems.append(f"modelo '{name}': provider '{model.get('provider')}' desconhecido")
+        cost = model.get("cost_per_1k_tokens")
+        if not isinstance(cost, (int, float)) or cost < 0:
+            problems.append(f"modelo '{name}': 'cost_per_1k_tokens' deve ser número >= 0")
+        if not isinstance(model.get("max_tokens"), int) or model["max_tokens"] <= 0:
+            problems.append(f"modelo '{name}': 'max_tokens' deve ser inteiro > 0")
+        if not isinstance(model.get("api_model"), str) or not model["api_model"]:
+            problems.append(f"modelo '{name}': 'api_model' obrigatório")
+        for key in ("cached_input_multiplier", "cache_write_multiplier"):
+            if key in model and (not isinstance(model[key], (int, float)) or model[key] < 0):
+                problems.append(f"modelo '{name}': '{key}' deve ser número >= 0")
+        if "endpoints" in model:
+            problems.extend(_validate_endpoints(name, model["endpoints"]))
+
+    for name in RULE_CATEGORIES:
+        if name not in data["categories"]:
+            problems.append(f"categoria '{name}' ausente (as regras de roteamento podem escolhê-la)")
+    for name, category in data["categories"].items():
+        preferred = category.get("preferred") if isinstance(category, dict) else None
+        if not isinstance(preferred, list) or not preferred:
+            problems.append(f"categoria '{name}': 'preferred' deve ser uma lista não vazia")
+            continue
+        for model in preferred:
+            if model not in models:
+                problems.append(f"categoria '{name}': modelo '{model}' não existe no catálogo")
+        if not isinstance(category.get("reasoning"), str):
+            problems.append(f"categoria '{name}': 'reasoning' obrigatório")
+
+    rules = data["rules"]
+    for key in ("code_keywords", "simple_patterns", "creative_keywords"):
+        if not isinstance(rules.get(key), list) or not all(isinstance(k, str) for k in rules.get(key, [])):
+            problems.append(f"regras: '{key}' deve ser uma lista de textos")
+    for key in ("simple_text_threshold", "long_text_threshold"):
+        if not isinstance(rules.get(key), int) or rules[key] < 0:
+            problems.append(f"regras: '{key}' deve ser inteiro >= 0")
+
+    cascade = data.get("cascade", {})
+    if not isinstance(cascade, dict):
+        problems.append("seção 'cascade' deve ser um objeto")
+    else:
+        for name in cascade.get("categories", []):
+            if name not in data["categories"]:
+                problems.append(f"cascade: categoria '{name}' desconhecida")
+        for key in ("refusal_phrases", "hedge_phrases"):
+            if key in cascade and not (isinstance(cascade[key], list)
+                                       and all(isinstance(p, str) for p in cascade[key])):
+                problems.append(f"cascade: '{key}' deve ser uma lista de textos")
+        for key in ("min_response_chars", "max_hedges", "min_avg_logprob"):
+            if key in cascade and not isinstance(cascade[key], (int, float)):
+                problems.append(f"cascade: '{key}' deve ser número")
+
+    embedding_models = data.get("embedding_models", {})
+    if not isinstance(embedding_models, dict):
+        problems.append("seção 'embedding_models' deve ser um objeto")
+        embedding_models = {}
+    for name, model in embedding_models.items():
+        if not isinstance(model, dict) or model.get("provider") not in providers:
+            problems.append(f"embedding '{name}': provider desconhecido")
+            continue
+        cost = model.get("cost_per_1k_tokens")
+        if not isinstance(cost, (int, float)) or cost < 0:
+            problems.append(f"embedding '{name}': 'cost_per_1k_tokens' deve ser número >= 0")
+        if not isinstance(model.get("max_batch"), int) or model["max_batch"] <= 0:
+            problems.append(f"embedding '{name}': 'max_batch' deve ser inteiro > 0")
+        if not isinstance(model.get("api_model"), str) or not model["api_model"]:
+            problems.append(f"embedding '{name}': 'api_model' obrigatório")
+
+    for section in ("defaults", "settings"):
+        if not isinstance(data.get(section, {}), dict):
+            problems.append(f"seção '{section}' deve ser um objeto")
+    if problems:
+        return problems
+    defaults = data.get("defaults", {})
+    for key in ("default_priority", "fallback_priority", "embedding_priority"):
+        if not isinstance(defaults.get(key, []), list):
+            problems.append(f"defaults: '{key}' deve ser uma lista")
+    if problems:
+        return problems
+    for key in ("default_priority", "fallback_priority"):
+        for entry in defaults.get(key, []):
+            if not (isinstance(entry, list) and len(entry) == 2 and entry[0] in providers and entry[1] in models):
+                problems.append(f"defaults: entrada inválida em '{key}': {entry}")
+    for entry in defaults.get("embedding_priority", []):
+        if not (isinstance(entry, list) and len(entry) == 2 and entry[0] in providers
+                and entry[1] in embedding_models):
+            problems.append(f"defaults: entrada inválida em 'embedding_priority': {entry}")
+    return problems
+
+def _validate_endpoints(model: str, endpoints: Any) -> List[str]:
+    if not isinstance(endpoints, list) or not endpoints:
+        return [f"modelo '{model}': 'endpoints' deve ser uma lista não vazia"]
+    problems, names = [], set()
+    for endpoint in endpoints:
+        if not isinstance(endpoint, dict) or not isinstance(endpoint.get("name"), str) or not endpoint["name"]:
+            problems.append(f"modelo '{model}': todo endpoint precisa de 'name'")
+            continue
+        where = f"modelo '{model}', endpoint '{endpoint['name']}'"
+        if endpoint["name"] in names:
+            problems.append(f"{where}: nome repetido")
+        names.add(endpoint["name"])
+        for key in ("base_url", "env_key"):
+            if key in endpoint and (not isinstance(endpoint[key], str) or not endpoint[key]):
+                problems.append(f"{where}: '{key}' deve ser texto")
+        weight = endpoint.get("weight", 1)
+        if not isinstance(weight, (int, float)) or weight <= 0:
+            problems.append(f"{where}: 'weight' deve ser número > 0")
+        if "max_concurrency" in endpoint and (not isinstance(endpoint["max_concurrency"], int)
+                                              or endpoint["max_concurrency"] <= 0):
+            problems.append(f"{where}: 'max_concurrency' deve ser inteiro > 0")
+    return problems
+
+def _compile_endpoints(model: Mapping[str, Any], provider_name: str, provider: Mapping[str, Any],
+                       provider_keys: Tuple[str, ...], env: Mapping[str, str]) -> List[Dict[str, Any]]:
+    """
+    Resolve URL e chaves de cada endpoint (sem 'endpoints' = um só, o do provedor)
+    Endpoint sem chave utilizável fica de fora
+    """
+    compiled = []
+    for endpoint in model.get("endpoints") or [{"name": provider_name}]:
+        if "env_key" in endpoint:
+            keys = _key_pool(env, endpoint["env_key"], provider.get("placeholder", "..."))
+            pool = f"{provider_name}:{endpoint['name']}"
+        else:
+            keys, pool = provider_keys, provider_name
+        if not keys:
+            continue
+        compiled.append({
+            "name": endpoint["name"],
+            "base_url": endpoint.get("base_url", provider["base_url"]),
+            "weight": endpoint.get("weight", 1),
+            "max_concurrency": endpoint.get("max_concurrency", provider.get("max_concurrency")),
+            "keys": keys,
+            "pool": pool,  # chaves próprias = ritmo (rate limit) próprio
+        })
+    return compiled
+
+def _resolve_local_providers(providers: Dict[str, Any], env: Mapping[str, str]
+                             ) -> Tuple[Dict[str, Any], Tuple[str, ...]]:
+    """
+    🏠 URL dos provedores locais (a variável `base_url_env` vence o `base_url` fixo)
+    Com URL o provedor local entra (e fala o formato da OpenAI); sem URL fica indisponível
+    """
+    resolved, local = {}, []
+    for name, provider in providers.items():
+        resolved[name] = provider
+        if provider.get("type") != LOCAL:
+            continue
+        base_url = (env.get(provider.get("base_url_env", "")) or provider.get("base_url") or "").strip().rstrip("/")
+        if base_url:
+            resolved[name] = {**provider, "base_url": base_url, "openai_compatible": True}
+            local.append(name)
+    return resolved, tuple(local)
+
+def compile_table(data: Dict[str, Any], env: Mapping[str, str] = os.environ,
+                  source: str = "<memória>") -> RoutingTable:
+    """⚙️ Valida o catálogo e resolve as chaves de API do ambiente"""
+    problems = validate_catalog(data)
+    if problems:
+        raise CatalogError("; ".join(problems))
+
+    providers, local_providers = _resolve_local_providers(data["providers"], env)
+
+    # Uma chave (OPENAI_API_KEY) e/ou várias (OPENAI_API_KEYS=sk-a,sk-b): tudo vira o pool do provedor
+    api_keys, api_key_pools = {}, {}
+    for name, provider in providers.items():
+        if provider.get("type") == LOCAL:
+            # Servidor próprio não precisa de chave: o "pool" é a chave opcional ou um marcador
+            pool = _key_pool(env, provider["env_key"], provider.get("placeholder", "...")) \
+                if provider.get("env_key") else ()
+            pool = (pool or (f"{name}{NO_KEY_SUFFIX}",)) if name in local_providers else ()
+        else:
+            pool = _key_pool(env, provider["env_key"], provider.get("placeholder", "..."))
+        if pool:
+            api_keys[name] = pool[0]
+            api_key_pools[name] = pool
+    available_providers = tuple(name for name in providers if name in api_keys)
+
+    # Modelo disponível = algum endpoint com chave (do provedor ou própria)
+    model_endpoints = {}
+    for name, model in data["models"].items():
+        provider = model["provider"]
+        endpoints = _compile_endpoints(model, provider, providers[provider],
+                                       api_key_pools.get(provider, ()), env)
+        if endpoints:
+            model_endpoints[name] = endpoints
+    available_models = {name: model for name, model in data["models"].items() if name in model_endpoints}
+
+    defaults = data.get("defaults", {})
+    # Se nenhuma API disponível, usa o primeiro modelo (será tratado como erro)
+    default_model = next(iter(data["models"]))
+    for provider, model in defaults.get("default_priority", []):
+        if provider in available_providers:
+            default_model = model
+            break
+    fallback_model = default_model
+    for provider, model in defaults.get("fallback_priority", []):
+        if provider in available_providers:
+            fallback_model = model
+            break
+
+    # Embeddings na ordem de preferência do catálogo, só de provedores com chave
+    embedding_models = data.get("embedding_models", {})
+    available_embedding_models = tuple(
+        model for provider, model in defaults.get("embedding_priority", [[m["provider"], n] for n, m in embedding_models.items()])
+        if provider in available_providers
+    )
+
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    version = hashlib.sha256(canonical + ",".join(available_providers).encode()).hexdigest()[:12]
+
+    return RoutingTable(
+        version=version,
+        source=source,
+        loaded_at=time.time(),
+        providers=_freeze(providers),
+        models=_freeze(data["models"]),
+        categories=_freeze(data["categories"]),
+        rules=_freeze(data["rules"]),
+        settings=_freeze(data.get("settings", {})),
+        available_providers=available_providers,
+        available_models=_freeze(available_models),
+        default_model=default_model,
+        fallback_model=fallback_model,
+        cascade=_freeze(data.get("cascade", {})),
+        embedding_models=_freeze(embedding_models),
+        available_embedding_models=available_embedding_models,
+        api_keys=MappingProxyType(api_keys),
+        api_key_pools=MappingProxyType(api_key_pools),
+        model_endpoints=_freeze(model_endpoints),
+        local_providers=local_providers,
+    )
+
+def load_table(path: str = DEFAULT_CATALOG_PATH, env: Mapping[str, str] = os.environ) -> RoutingTable:
+    """Lê e compila o arquivo de catálogo"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CatalogError(f"não foi possível ler {path}: {e}")
+    try:
+        return compile_table(data, env, source=path)
+    except CatalogError:
+        raise
+    except Exception as e:
+        # Forma inesperada que a validação deixou passar: nunca derruba quem recarrega
+        raise CatalogError(f"{path}: {type(e).__name__}: {e}") from e
+
+class CatalogWatcher:
+    """
+    👀 Observa arquivos (catálogo, .env) e dispara o reload quando mudam
+    Polling de mtime: simples e funciona em qualquer sistema de arquivos
+    """
+
+    def __init__(self, paths: List[str], on_change: Callable[[], Any], interval: float = 2.0):
+        self.paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._mtimes = self._snapshot()
+        self._task: Optional[asyncio.Task] = None
+
+    def _snapshot(self) -> Dict[str, float]:
+        mtimes = {}
+        for path in self.paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                mtimes[path] = 0.0
+        return mtimes
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            current = self._snapshot()
+            if current != self._mtimes:
+                self._mtimes = current
+                try:
+                    self.on_change()
+                except CatalogError as e:
+                    logger.error(f"❌ Catálogo inválido, mantendo a tabela atual: {e}")
+                except Exception:
+                    # O observador continua vivo para o próximo salvamento
+                    logger.exception("❌ Falha ao recarregar o catálogo")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+🧮 Roteador aprendido (opcional) do RouterLLM
+Features de n-gramas com hashing + regressão logística, pontuado em NumPy
+
+Treino offline a partir de um JSONL rotulado ({"message": ..., "category": ...}):
+    python classifier.py train exemplos.jsonl router_model.npz
+
+Para ativar no servidor: ROUTER_MODEL_PATH=router_model.npz
+"""
+
+import json
+import logging
+import os
+import re
+import sys
+import zlib
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError as e:  # dependência opcional, fora do requirements.txt (pesa no cold start)
+    raise ImportError("O classificador aprendido precisa do NumPy: pip install numpy") from e
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Faixas de tamanho (em caracteres) usadas como feature - as regras manuais
+# também dependem do tamanho da mensagem
+LENGTH_BUCKETS = (100, 300, 1000, 4000)
+
+class HashedNgramFeaturizer:
+    """
+    🔢 Converte texto em índices de features (unigramas + bigramas de palavras)
+    Usa crc32 em vez de hash() para ser estável entre processos (treino x produção)
+    """
+
+    def __init__(self, n_features: int = 2 ** 16, max_tokens: int = 256):
+        if n_features & (n_features - 1):
+            raise ValueError("n_features deve ser potência de 2")
+        self.n_features = n_features
+        self.max_tokens = max_tokens
+        self._mask = n_features - 1
+
+    def indices(self, text: str) -> List[int]:
+        """Índices das features de uma mensagem (sempre ao menos uma)"""
+        tokens = _TOKEN_RE.findall(text.lower())[:self.max_tokens]
+        bucket = sum(1 for limit in LENGTH_BUCKETS if len(text) >= limit)
+        features = [f"len:{bucket}"]
+        features.extend("w:" + token for token in tokens)
+        features.extend(f"b:{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        mask = self._mask
+        return [zlib.crc32(feature.encode("utf-8")) & mask for feature in features]
+
+    def batch(self, texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Formato esparso (estilo CSR) para um lote de mensagens:
+        índices concatenados, pesos de cada feature e offsets de início de cada linha
+        """
+        rows = [self.indices(text) for text in texts]
+        lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+        offsets = np.zeros(len(rows), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        indices = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=int(lengths.sum()))
+        # Normalização 1/sqrt(n) para que textos longos não dominem os logits
+        values = np.repeat((1.0 / np.sqrt(lengths)).astype(np.float32), lengths)
+        return indices, values, offsets
+
+class LearnedRouter:
+    """
+    🧠 Modelo logístico multinomial sobre as categorias de roteamento
+    Pesos guardados em .npz compacto (float16, comprimido)
+    """
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, categories: Sequence[str],
+                 featurizer: HashedNgramFeaturizer, threshold: float = 0.6):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float32)
+        self.bias = np.asarray(bias, dtype=np.float32)
+        self.categories = list(categories)
+        self.featurizer = featurizer
+        self.threshold = threshold
+
+    def _logits(self, indices: np.ndarray, values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        contributions = self.weights[indices] * values[:, None]
+        return np.add.reduceat(contributions, offsets, axis=0) + self.bias
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict(self, message: str) -> Tuple[str, float]:
+        """Categoria mais provável e sua confiança para uma mensagem"""
+        idx = self.featurizer.indices(message)
+        scale = np.float32(1.0 / np.sqrt(len(idx)))
+        logits = self.weights[idx].sum(axis=0) * scale + self.bias
+        probs = self._softmax(logits)
+        best = int(probs.argmax())
+        return self.categories[best], float(probs[best])
+
+    def predict_batch(self, messages: Sequence[str]) -> List[Tuple[str, float]]:
+        """📦 Pontuação vetorizada para cargas em lote"""
+        if not messages:
+            return []
+        probs = self._softmax(self._logits(*self.featurizer.batch(messages)))
+        best = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(messages)), best]
+        return [(self.categories[b], float(c)) for b, c in zip(best.tolist(), confidence.tolist())]
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path,
+            weights=self.weights.astype(np.float16),
+            bias=self.bias,
+            categories=np.array(self.categories),
+            n_features=np.int64(self.featurizer.n_features),
+            max_tokens=np.int64(self.featurizer.max_tokens),
+            threshold=np.float32(self.threshold),
+        )
+
+    @classmethod
+    def load(cls, path: str, threshold: Optional[float] = None) -> "LearnedRouter":
+        with np.load(path, allow_pickle=False) as data:
+            featurizer = HashedNgramFeaturizer(int(data["n_features"]), int(data["max_tokens"]))
+            return cls(
+                weights=data["weights"],
+                bias=data["bias"],
+                categories=[str(c) for c in data["categories"]],
+                featurizer=featurizer,
+                threshold=float(data["threshold"]) if threshold is None else threshold,
+            )
+
+    @classmethod
+    def train(cls, messages: Sequence[str], labels: Sequence[str], n_features: int = 2 ** 16,
+              epochs: int = 20, learning_rate: float = 0.5, l2: float = 1e-6,
+              batch_size: int = 64, threshold: float = 0.6, seed: int = 0) -> "LearnedRouter":
+        """
+        🏋️ Treino por mini-batch SGD (softmax + entropia cruzada)
+        O gradiente é acumulado direto nos índices esparsos com np.add.at
+        """
+        categories = sorted(set(labels))
+        label_ids = np.array([categories.index(label) for label in labels], dtype=np.int64)
+        featurizer = HashedNgramFeaturizer(n_features)
+        model = cls(np.zeros((n_features, len(categories)), dtype=np.float32),
+                    np.zeros(len(categories), dtype=np.float32), categories, featurizer, threshold)
+        rng = np.random.default_rng(seed)
+        messages = list(messages)
+
+        for _ in range(epochs):
+            order = rng.permutation(len(messages))
+            for start in range(0, len(order), batch_size):
+                batch_ids = order[start:start + batch_size]
+                indices, values, offsets = featurizer.batch([messages[i] for i in batch_ids])
+                probs = cls._softmax(model._logits(indices, values, offsets))
+                probs[np.arange(len(batch_ids)), label_ids[batch_ids]] -= 1.0
+                probs /= len(batch_ids)
+                lengths = np.diff(np.append(offsets, len(indices)))
+                row_grad = np.repeat(probs, lengths, axis=0) * values[:, None]
+                grad = np.zeros_like(model.weights)
+                np.add.at(grad, indices, row_grad)
+                model.weights -= learning_rate * (grad + l2 * model.weights)
+                model.bias -= learning_rate * probs.sum(axis=0)
+        return model
+
+def load_learned_router(path: Optional[str] = None) -> Optional[LearnedRouter]:
+    """
+    Carrega o modelo indicado em ROUTER_MODEL_PATH (se houver)
+    Qualquer problema só gera um aviso - o roteador continua com as regras
+    """
+    path = path or os.getenv("ROUTER_MODEL_PATH")
+    if not path:
+        return None
+    threshold = os.getenv("ROUTER_MODEL_THRESHOLD")
+    try:
+        model = LearnedRouter.load(path, float(threshold) if threshold else None)
+    except Exception as e:
+        logger.warning(f"⚠️ Classificador de roteamento não carregado ({path}): {e}")
+        return None
+    logger.info(f"🧮 Classificador de roteamento carregado: {path} ({', '.join(model.categories)})")
+    return model
+
+def read_labelled_jsonl(path: str) -> Tuple[List[str], List[str]]:
+    messages, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            messages.append(item["message"])
+            labels.append(item["category"])
+    return messages, labels
+
+def evaluate(model: LearnedRouter, messages: Iterable[str], labels: Iterable[str]) -> Tuple[float, float]:
+    """Acurácia geral e cobertura (fração acima do limiar de confiança)"""
+    predictions = model.predict_batch(list(messages))
+    labels = list(labels)
+    if not labels:
+        return 0.0, 0.0
+    correct = sum(1 for (category, _), label in zip(predictions, labels) if category == label)
+    covered = sum(1 for _, confidence in predictions if confidence >= model.threshold)
+    return correct / len(labels), covered / len(labels)
+
+def main(argv: List[str]):
+    if len(argv) < 3 or argv[0] != "train":
+        print("Uso: python classifier.py train <exemplos.jsonl> <saida.npz> [epochs] [limiar]")
+        sys.exit(1)
+    epochs = int(argv[3]) if len(argv) > 3 else 20
+    threshold = float(argv[4]) if len(argv) > 4 else 0.6
+
+    messages, labels = read_labelled_jsonl(argv[1])
+    print(f"📚 {len(messages)} exemplos, categorias: {sorted(set(labels))}")
+
+    # Separar 10% para validação
+    split = max(1, len(messages) // 10) if len(messages) >= 10 else 0
+    model = LearnedRouter.train(messages[split:], labels[split:], epochs=epochs, threshold=threshold)
+    if split:
+        accuracy, coverage = evaluate(model, messages[:split], labels[:split])
+        print(f"✅ Validação: acurácia {accuracy:.1%} | cobertura acima do limiar {coverage:.1%}")
+    model.save(argv[2])
+    print(f"💾 Modelo salvo em {argv[2]} ({os.path.getsize(argv[2]) / 1024:.0f} KB)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
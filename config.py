@@ -1,125 +1,167 @@
 #!/usr/bin/env python3
 """
 ⚙️ Configurações do RouterLLM
-Aqui você define modelos, custos e regras
+Modelos, custos e regras vêm do catálogo declarativo (routing.json)
+e podem ser recarregados sem reiniciar o processo
 """
 
 import os
-from typing import Dict, List, Optional
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from catalog import DEFAULT_CATALOG_PATH, RoutingTable, load_table
+
+# Tabela "fixada" pela requisição em andamento (ver RouterConfig.pin)
+_pinned_table: ContextVar[Optional[RoutingTable]] = ContextVar("pinned_routing_table", default=None)
 
 class RouterConfig:
-    def __init__(self):
-        # 🔑 Detectar APIs disponíveis baseado nas chaves configuradas
-        self.available_providers = self._detect_available_providers()
-        # 🤖 Modelos disponíveis e suas características
-        self.models = {
-            "gpt-4o-mini": {
-                "provider": "openai",
-                "cost_per_1k_tokens": 0.00015,
-                "max_tokens": 16000,
-                "speed": "fast",
-                "quality": "good",
-                "use_case": "Perguntas simples, respostas rápidas"
-            },
-            "gpt-4": {
-                "provider": "openai", 
-                "cost_per_1k_tokens": 0.03,
-                "max_tokens": 8000,
-                "speed": "medium",
-                "quality": "excellent",
-                "use_case": "Código, raciocínio complexo, precisão"
-            },
-            "claude-3-haiku": {
-                "provider": "anthropic",
-                "cost_per_1k_tokens": 0.00025,
-                "max_tokens": 200000,
-                "speed": "fast",
-                "quality": "very_good",
-                "use_case": "Balanceado - boa qualidade, bom preço"
-            },
-            "claude-3-5-sonnet": {
-                "provider": "anthropic",
-                "cost_per_1k_tokens": 0.003,
-                "max_tokens": 200000,
-                "speed": "medium",
-                "quality": "excellent",
-                "use_case": "Textos longos, análises profundas"
-            },
-            "gemini-1.5-pro": {
-                "provider": "google",
-                "cost_per_1k_tokens": 0.00125,
-                "max_tokens": 1000000,
-                "speed": "medium",
-                "quality": "excellent",
-                "use_case": "Criatividade, contexto gigante"
-            }
-        }
-
-        # 🎯 Regras de roteamento (para referência)
-        self.routing_rules = {
-            "code_detection": ["código", "code", "python", "javascript", "debug"],
-            "simple_questions": ["o que é", "como", "quando", "onde"],
-            "creative_content": ["criativo", "marketing", "história", "poema"],
-            "long_text_threshold": 1000,
-            "simple_text_threshold": 100
-        }
-
-        # 🔧 Configurações gerais (dinâmicas baseadas nas APIs disponíveis)
-        self.default_model = self._get_default_model()
-        self.fallback_model = self._get_fallback_model()
-        self.max_retries = 3
-        self.timeout_seconds = 30
-    
-    def _detect_available_providers(self) -> List[str]:
-        """Detecta quais provedores estão disponíveis baseado nas chaves de API"""
-        providers = []
-        
-        # Verifica OpenAI
-        openai_key = os.getenv('OPENAI_API_KEY')
-        if openai_key and openai_key.strip() and not openai_key.startswith('sk-...'):
-            providers.append('openai')
-        
-        # Verifica Anthropic
-        anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-        if anthropic_key and anthropic_key.strip() and not anthropic_key.startswith('sk-ant-...'):
-            providers.append('anthropic')
-        
-        # Verifica Google
-        google_key = os.getenv('GOOGLE_API_KEY')
-        if google_key and google_key.strip() and google_key != '...':
-            providers.append('google')
-        
-        return providers
-    
-    def _get_default_model(self) -> str:
-        """Retorna o modelo padrão baseado nas APIs disponíveis"""
-        # Prioridade: Anthropic > OpenAI > Google
-        if 'anthropic' in self.available_providers:
-            return 'claude-3-haiku'
-        elif 'openai' in self.available_providers:
-            return 'gpt-4o-mini'
-        elif 'google' in self.available_providers:
-            return 'gemini-1.5-pro'
-        else:
-            # Se nenhuma API disponível, retorna o primeiro modelo (será tratado como erro)
-            return 'gpt-4o-mini'
-    
-    def _get_fallback_model(self) -> str:
-        """Retorna o modelo de fallback baseado nas APIs disponíveis"""
-        # Se OpenAI disponível, usa como fallback
-        if 'openai' in self.available_providers:
-            return 'gpt-4o-mini'
-        # Senão, usa o mesmo que o padrão
-        return self.default_model
-    
+    def __init__(self, catalog_path: Optional[str] = None):
+        # 📚 Catálogo de modelos, regras e provedores (arquivo declarativo)
+        self.catalog_path = catalog_path or os.getenv("ROUTING_CONFIG_PATH", DEFAULT_CATALOG_PATH)
+        self._reload_lock = threading.Lock()
+        # Valores do .env já aplicados: no reload só o que mudou no arquivo
+        # sobrescreve o ambiente (variáveis reais do processo são preservadas)
+        self._env_file_values = self._read_env_file()
+        # 🔑 As chaves de API são lidas do ambiente a cada compilação da tabela
+        self._table = load_table(self.catalog_path)
+
+    @property
+    def table(self) -> RoutingTable:
+        """Tabela da requisição atual (se fixada) ou a mais recente"""
+        return _pinned_table.get() or self._table
+
+    @contextmanager
+    def pin(self, table: Optional[RoutingTable] = None):
+        """
+        📌 Fixa a tabela atual (ou `table`, ex.: a de uma política em sombra) durante uma requisição
+        Um reload no meio do caminho não afeta quem já começou
+        """
+        table = table or self.table
+        token = _pinned_table.set(table)
+        try:
+            yield table
+        finally:
+            _pinned_table.reset(token)
+
+    def reload(self, reload_env: bool = True) -> RoutingTable:
+        """
+        🔄 Recarrega catálogo (e .env) e troca a tabela atomicamente
+        Se o arquivo for inválido, levanta CatalogError e a tabela antiga continua
+        """
+        with self._reload_lock:
+            if reload_env:
+                self._apply_env_file_changes()
+            table = load_table(self.catalog_path)
+            self._table = table
+            return table
+
+    @staticmethod
+    def _read_env_file() -> Dict[str, Optional[str]]:
+        if not os.path.exists(".env"):
+            return {}
+        from dotenv import dotenv_values
+        return dotenv_values(".env")
+
+    def _apply_env_file_changes(self):
+        values = self._read_env_file()
+        for key, value in values.items():
+            if value is not None and value != self._env_file_values.get(key):
+                os.environ[key] = value
+        for key, old_value in self._env_file_values.items():
+            # Removida do .env (ex.: chave vazada ou rotacionada): sai do ambiente também,
+            # a menos que o valor atual não tenha vindo do arquivo
+            if values.get(key) is None and old_value is not None and os.environ.get(key) == old_value:
+                del os.environ[key]
+        self._env_file_values = values
+
+    # 🤖 Visões da tabela atual (mesma interface de antes)
+    @property
+    def models(self):
+        return self.table.models
+
+    @property
+    def routing_categories(self):
+        return self.table.categories
+
+    @property
+    def routing_rules(self):
+        return self.table.rules
+
+    @property
+    def available_providers(self) -> List[str]:
+        return list(self.table.available_providers)
+
+    @property
+    def default_model(self) -> str:
+        return self.table.default_model
+
+    @property
+    def fallback_model(self) -> str:
+        return self.table.fallback_model
+
+    @property
+    def embedding_models(self):
+        return self.table.embedding_models
+
+    @property
+    def available_embedding_models(self) -> List[str]:
+        """Modelos de embedding utilizáveis, na ordem de preferência"""
+        return list(self.table.available_embedding_models)
+
+    @property
+    def cascade(self):
+        return self.table.cascade
+
+    @property
+    def max_retries(self) -> int:
+        return self.table.settings.get("max_retries", 3)
+
+    @property
+    def timeout_seconds(self) -> float:
+        return self.table.settings.get("timeout_seconds", 30)
+
     def get_available_models(self) -> Dict[str, dict]:
         """Retorna apenas os modelos dos provedores disponíveis"""
-        available_models = {}
-        for model_name, model_config in self.models.items():
-            if model_config['provider'] in self.available_providers:
-                available_models[model_name] = model_config
-        return available_models
-    
+        return self.table.available_models
+
     def is_provider_available(self, provider: str) -> bool:
         """Verifica se um provedor específico está disponível"""
-        return provider in self.available_providers
+        return provider in self.table.available_providers
+
+    def get_api_key(self, provider: str) -> Optional[str]:
+        """Chave de API do provedor (None se não configurada)"""
+        return self.table.api_keys.get(provider)
+
+    def get_api_keys(self, provider: str) -> Tuple[str, ...]:
+        """Todas as chaves do provedor (pool para rotação); a primeira é a de get_api_key"""
+        return self.table.api_key_pools.get(provider, ())
+
+    def get_key_pools(self) -> Dict[str, Tuple[str, ...]]:
+        """Pools de chaves em uso: os dos provedores e os de endpoints com chave própria"""
+        pools = dict(self.table.api_key_pools)
+        for endpoints in self.table.model_endpoints.values():
+            for endpoint in endpoints:
+                pools.setdefault(endpoint["pool"], endpoint["keys"])
+        return pools
+
+    def get_endpoints(self, model: str) -> Tuple[Mapping[str, Any], ...]:
+        """Endpoints do modelo (URL, chaves, peso); vazio se nenhum tem chave"""
+        return self.table.model_endpoints.get(model, ())
+
+    @property
+    def model_endpoints(self) -> Mapping[str, Tuple[Mapping[str, Any], ...]]:
+        return self.table.model_endpoints
+
+    @property
+    def local_providers(self) -> List[str]:
+        """Provedores próprios ("type": "local") com URL configurada"""
+        return list(self.table.local_providers)
+
+    def is_local(self, provider: str) -> bool:
+        return provider in self.table.local_providers
+
+    def get_provider(self, provider: str) -> dict:
+        """Configuração do provedor (env_key, base_url...)"""
+        return self.table.providers.get(provider, {})
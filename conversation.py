@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+💬 Representação de conversas do RouterLLM
+Normaliza mensagens (texto simples ou multi-partes) para os adaptadores dos provedores
+"""
+
+import hashlib
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Formato interno: [{"role": "user"|"assistant", "content": [{"type": "text", "text": ..., "cache": bool}]}]
+Message = Dict[str, Any]
+
+def text_part(text: str, cache: bool = False) -> Dict[str, Any]:
+    return {"type": "text", "text": text, "cache": cache}
+
+def normalize_messages(message: Optional[str] = None, messages: Optional[List[Any]] = None) -> List[Message]:
+    """
+    Converte a entrada da API em mensagens com conteúdo em partes
+    `messages` pode conter dicts ou modelos pydantic; `message` vira o último turno do usuário
+    """
+    normalized = []
+    for item in messages or []:
+        if hasattr(item, "model_dump"):
+            item = item.model_dump()
+        content = item["content"]
+        if isinstance(content, str):
+            parts = [text_part(content)]
+        else:
+            parts = [text_part(p["text"], bool(p.get("cache"))) for p in content if p.get("type", "text") == "text"]
+        normalized.append({"role": item["role"], "content": parts})
+    if message:
+        normalized.append({"role": "user", "content": [text_part(message)]})
+    return normalized
+
+def message_text(message: Message) -> str:
+    return "\n".join(part["text"] for part in message["content"])
+
+def last_user_text(messages: List[Message]) -> str:
+    """Texto do último turno do usuário (é o que o roteador analisa)"""
+    for message in reversed(messages):
+        if message["role"] == "user":
+            return message_text(message)
+    return ""
+
+def conversation_text(messages: List[Message], system: Optional[str] = None) -> str:
+    texts = [system] if system else []
+    texts.extend(message_text(m) for m in messages)
+    return "\n".join(texts)
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), suficiente para orçamentos"""
+    return max(1, len(text) // 4) if text else 0
+
+def prefix_key(system: Optional[str], messages: List[Message], min_tokens: int) -> Optional[str]:
+    """
+    🔑 Identifica o "template" do prompt: system prompt + partes marcadas como cache
+    Só prefixos grandes o bastante para o provedor cachear recebem chave
+    """
+    stable = [system] if system else []
+    for message in messages:
+        stable.extend(part["text"] for part in message["content"] if part.get("cache"))
+    if not stable or estimate_tokens("".join(stable)) < min_tokens:
+        return None
+    digest = hashlib.sha256()
+    for text in stable:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:16]
+
+class PrefixCacheTracker:
+    """
+    ♨️ Lembra qual modelo tem cada prefixo "quente" no cache do provedor
+    O cache dos provedores expira em minutos, então as entradas têm TTL
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[str, float]] = {}
+
+    def mark(self, key: Optional[str], model: str):
+        if not key:
+            return
+        if len(self._entries) >= self.max_entries and key not in self._entries:
+            # Descarta a entrada mais antiga (dicts preservam ordem de inserção)
+            self._entries.pop(next(iter(self._entries)))
+        self._entries.pop(key, None)
+        self._entries[key] = (model, time.monotonic())
+
+    def warm_model(self, key: Optional[str]) -> Optional[str]:
+        if not key or key not in self._entries:
+            return None
+        model, marked_at = self._entries[key]
+        if time.monotonic() - marked_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        return model
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+⏳ Prazos por requisição do RouterLLM
+O prazo do cliente (timeout_ms ou cabeçalho X-Timeout-Ms) fica num contextvar,
+então vale para tudo que a requisição fizer: fila de prioridade, roteamento
+e cada chamada ao provedor, sem precisar passar o valor de função em função
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("routerllm_deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    """O prazo do cliente acabou - vira 504, nunca uma resposta simulada"""
+
+@contextmanager
+def deadline_scope(timeout_seconds: Optional[float]):
+    """Define o prazo (relógio monotônico) para o bloco; prazos aninhados só encurtam"""
+    with deadline_at(time.monotonic() + timeout_seconds if timeout_seconds is not None else None):
+        yield
+
+@contextmanager
+def deadline_at(deadline: Optional[float]):
+    """
+    Reentra num prazo absoluto já calculado (ex.: `current_deadline()` guardado
+    antes de um gerador de streaming rodar fora do bloco que o definiu)
+    """
+    if deadline is None:
+        yield
+        return
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[float]:
+    """Prazo absoluto (relógio monotônico) da requisição atual, se houver"""
+    return _deadline.get()
+
+def remaining() -> Optional[float]:
+    """Segundos até o prazo (None = sem prazo); levanta DeadlineExceeded se já passou"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Prazo da requisição esgotado")
+    return left
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    """
+    Aguarda respeitando o prazo atual; ao estourar, a tarefa é cancelada
+    (o httpx fecha a conexão do provedor e libera a vaga no pool)
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Prazo da requisição esgotado") from None
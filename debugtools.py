@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+🩺 Ferramentas de diagnóstico do RouterLLM
+- Profiler por amostragem sob demanda: lê a pilha da thread do event loop
+  a cada poucos ms e devolve as pilhas no formato "collapsed" (flamegraph)
+- Monitor de atraso do event loop: mede o atraso de agendamento e, quando um
+  callback bloqueia o loop além do limite, registra a pilha de quem bloqueou
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def _collapse(frame) -> str:
+    """Pilha da raiz até a folha: 'main (main.py);run_chat (main.py);...'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.005) -> Counter:
+    """
+    🔬 Amostra a pilha da thread `thread_id` por `seconds` segundos
+    Roda em outra thread: o loop continua atendendo enquanto é observado
+    """
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            counts[_collapse(frame)] += 1
+        del frame
+        time.sleep(interval)
+    return counts
+
+def collapsed(counts: Counter) -> str:
+    """Formato aceito por flamegraph.pl, speedscope e inferno"""
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+class LoopLagMonitor:
+    """
+    ⏲️ Mede o atraso do event loop e denuncia callbacks que bloqueiam
+    Uma tarefa no loop dorme `interval` e mede quanto acordou atrasada;
+    uma thread vigia o batimento e, se o loop passar de `stall_threshold`
+    sem bater, registra no log a pilha do código que está bloqueando
+    """
+
+    def __init__(self, interval: float = 0.25, stall_threshold: float = 0.25):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self._heartbeat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            metrics.record_loop_lag(lag)
+
+    def _watch(self):
+        """Thread vigia: uma pilha por travamento (não repete enquanto durar)"""
+        reported_for = None
+        while not self._stop.wait(self.stall_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.stall_threshold or reported_for == heartbeat:
+                continue
+            reported_for = heartbeat
+            self.stalls += 1
+            metrics.record_loop_stall()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(pilha indisponível)"
+            del frame
+            logger.warning(f"🐌 Event loop bloqueado há {blocked * 1000:.0f} ms. Pilha:\n{stack}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "interval": self.interval,
+            "stall_threshold": self.stall_threshold,
+            "last_lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "stalls": self.stalls,
+        }
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+🧬 Embeddings do RouterLLM com micro-lotes
+Pedidos simultâneos de embedding para o mesmo modelo esperam uma janela
+curta (ou até juntar N textos) e sobem numa única chamada ao provedor.
+Textos repetidos viram um só item do lote, e o resultado de cada texto
+fica no cache de respostas. Os vetores circulam como float32 compactado
+"""
+
+import asyncio
+import base64
+import logging
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+import jsoncodec
+from metrics import metrics
+from response_cache import ResponseCache
+from conversation import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+def pack_floats(values: List[float]) -> bytes:
+    """Lista de floats → float32 little-endian (o mesmo formato do base64 da OpenAI)"""
+    packed = array("f", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+def unpack_floats(raw: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(raw)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+def encode_vector(raw: bytes, encoding_format: str = "base64"):
+    """Formato de saída: base64 do float32 (compacto) ou lista de floats"""
+    if encoding_format == "float":
+        return unpack_floats(raw)
+    return base64.b64encode(raw).decode("ascii")
+
+@dataclass
+class EmbeddingResult:
+    vectors: List[bytes]
+    input_tokens: int = 0
+    cached: int = 0
+    deduplicated: int = 0
+
+class EmbeddingBatcher:
+    """
+    📦 Junta textos de várias requisições em lotes por modelo
+    O lote sobe quando a janela `window` vence ou quando chega a `max_items`
+    textos distintos (respeitando o `max_batch` do modelo no catálogo)
+    """
+
+    def __init__(self, router, cache: Optional[ResponseCache] = None,
+                 window: float = 0.005, max_items: int = 256):
+        self.router = router
+        self.cache = cache
+        self.window = window
+        self.max_items = max_items
+        self._pending: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._inflight: Dict[str, Dict[str, asyncio.Future]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats_counters = {"requests": 0, "texts": 0, "cache_hits": 0,
+                               "deduplicated": 0, "upstream_texts": 0, "batches": 0}
+
+    @property
+    def config(self):
+        return self.router.config
+
+    def select_model(self, requested: Optional[str] = None) -> str:
+        """Modelo pedido (se configurado) ou o primeiro saudável da prioridade do catálogo"""
+        available = self.config.available_embedding_models
+        if requested:
+            if requested not in self.config.embedding_models:
+                raise ValueError(f"Modelo de embedding desconhecido: {requested}")
+            if requested not in available:
+                raise ValueError(f"Modelo de embedding sem chave configurada: {requested}")
+            return requested
+        if not available:
+            raise ValueError("Nenhum modelo de embedding disponível")
+        health_check = self.router.health_check
+        for model in available:
+            if health_check is None or health_check(self.config.embedding_models[model]["provider"]):
+                return model
+        return available[0]
+
+    def cost(self, model: str, tokens: int) -> float:
+        return tokens / 1000 * self.config.embedding_models[model]["cost_per_1k_tokens"]
+
+    def _cache_key(self, model: str, text: str) -> str:
+        return ResponseCache.key("embedding", model, text)
+
+    async def embed(self, model: str, texts: List[str]) -> EmbeddingResult:
+        """
+        Vetores na ordem de `texts`
+        `input_tokens` estima só o que esta chamada mandou ao provedor
+        (hits de cache e textos que já estavam num lote não contam)
+        """
+        loop = asyncio.get_running_loop()
+        pending = self._pending.setdefault(model, {})
+        inflight = self._inflight.setdefault(model, {})
+        result = EmbeddingResult(vectors=[])
+        resolved: Dict[str, object] = {}
+        for text in texts:
+            if text in resolved:
+                result.deduplicated += 1
+                continue
+            cached = self.cache.get(self._cache_key(model, text)) if self.cache is not None else None
+            if cached is not None:
+                resolved[text] = cached
+                result.cached += 1
+                continue
+            future = pending.get(text) or inflight.get(text)
+            if future is not None:
+                result.deduplicated += 1
+            else:
+                future = pending[text] = loop.create_future()
+                result.input_tokens += estimate_tokens(text)
+            resolved[text] = future
+
+        self.stats_counters["requests"] += 1
+        self.stats_counters["texts"] += len(texts)
+        self.stats_counters["cache_hits"] += result.cached
+        self.stats_counters["deduplicated"] += result.deduplicated
+        if result.cached:
+            metrics.record_embedding_texts(model, "cache", result.cached)
+        if result.deduplicated:
+            metrics.record_embedding_texts(model, "dedup", result.deduplicated)
+
+        limit = min(self.max_items, self.config.embedding_models[model]["max_batch"])
+        if len(pending) >= limit:
+            self._flush(model)
+        elif pending and model not in self._timers:
+            self._timers[model] = loop.call_later(self.window, self._flush, model)
+
+        futures = [f for f in resolved.values() if isinstance(f, asyncio.Future)]
+        if futures:
+            # asyncio.wait não cancela os futures: outro chamador pode estar esperando o mesmo texto
+            await asyncio.wait(futures)
+        result.vectors = [
+            value.result() if isinstance(value, asyncio.Future) else value
+            for value in (resolved[text] for text in texts)
+        ]
+        return result
+
+    def _flush(self, model: str):
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(model, None)
+        if not batch:
+            return
+        self._inflight.setdefault(model, {}).update(batch)
+        task = asyncio.create_task(self._send(model, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, model: str, batch: Dict[str, asyncio.Future]):
+        try:
+            await self._send_chunks(model, batch)
+        finally:
+            # Nenhum chamador fica esperando para sempre (ex.: tarefa cancelada no shutdown)
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("Lote de embeddings interrompido"))
+                    future.exception()
+
+    async def _send_chunks(self, model: str, batch: Dict[str, asyncio.Future]):
+        max_batch = self.config.embedding_models[model]["max_batch"]
+        texts = list(batch)
+        inflight = self._inflight.get(model, {})
+        for start in range(0, len(texts), max_batch):
+            chunk = texts[start:start + max_batch]
+            try:
+                vectors, tokens = await self._request(model, chunk)
+                if len(vectors) != len(chunk):
+                    # zip cortaria em silêncio e os textos sem vetor ficariam esperando
+                    raise ValueError(f"Provedor devolveu {len(vectors)} vetores para {len(chunk)} textos")
+                self.stats_counters["batches"] += 1
+                self.stats_counters["upstream_texts"] += len(chunk)
+                metrics.record_embedding_batch(model, len(chunk))
+                metrics.record_embedding_texts(model, "upstream", len(chunk))
+                metrics.record_tokens(model, tokens, 0)
+                metrics.record_cost(model, self.cost(model, tokens))
+                for text, vector in zip(chunk, vectors):
+                    if self.cache is not None:
+                        self.cache.set(self._cache_key(model, text), vector)
+                    batch[text].set_result(vector)
+            except Exception as e:
+                logger.error(f"❌ Lote de embeddings falhou ({model}, {len(chunk)} textos): {e}")
+                metrics.record_api_error(self.config.embedding_models[model]["provider"], type(e).__name__)
+                for text in chunk:
+                    if not batch[text].done():
+                        batch[text].set_exception(e)
+                        # Marca como lida: quem desistiu de esperar não gera aviso no log
+                        batch[text].exception()
+            finally:
+                for text in chunk:
+                    if inflight.get(text) is batch[text]:
+                        del inflight[text]
+
+    async def _request(self, model: str, texts: List[str]) -> Tuple[List[bytes], int]:
+        model_config = self.config.embedding_models[model]
+        provider = model_config["provider"]
+        base_url = self.config.get_provider(provider)["base_url"]
+        client = self.router.get_client()
+
+        async def post(lease):
+            vectors, tokens = await self._post(provider, model_config, base_url, client, lease, texts)
+            lease.tokens = tokens
+            return vectors, tokens
+        # Mesmo ritmo e rotação de chaves das chamadas de chat (429 = outra chave)
+        return await self.router.call_with_key(provider, self.config.get_api_keys(provider),
+                                               sum(estimate_tokens(t) for t in texts), post)
+
+    async def _post(self, provider: str, model_config, base_url: str, client, lease,
+                    texts: List[str]) -> Tuple[List[bytes], int]:
+        """Uma chamada de lote ao provedor com a chave emprestada do pool"""
+        if provider == "openai":
+            response = await client.post(
+                f"{base_url}/embeddings",
+                headers={"Authorization": f"Bearer {lease.key}", "Content-Type": "application/json"},
+                content=jsoncodec.dumps({"model": model_config["api_model"], "input": texts,
+                                         "encoding_format": "base64"}),
+            )
+            lease.observe(response)
+            if response.status_code != 200:
+                raise Exception(f"OpenAI API erro {response.status_code}: {response.text}")
+            data = jsoncodec.loads(response.content)
+            items = sorted(data["data"], key=lambda item: item["index"])
+            vectors = [
+                base64.b64decode(item["embedding"]) if isinstance(item["embedding"], str)
+                else pack_floats(item["embedding"])
+                for item in items
+            ]
+            tokens = (data.get("usage") or {}).get("prompt_tokens") or sum(estimate_tokens(t) for t in texts)
+            return vectors, tokens
+
+        if provider == "google":
+            api_model = model_config["api_model"]
+            response = await client.post(
+                f"{base_url}/models/{api_model}:batchEmbedContents?key={lease.key}",
+                headers={"Content-Type": "application/json"},
+                content=jsoncodec.dumps({"requests": [
+                    {"model": f"models/{api_model}", "content": {"parts": [{"text": text}]}}
+                    for text in texts
+                ]}),
+            )
+            lease.observe(response)
+            if response.status_code != 200:
+                raise Exception(f"Google API erro {response.status_code}: {response.text}")
+            data = jsoncodec.loads(response.content)
+            # O batchEmbedContents não devolve contagem de tokens
+            return [pack_floats(e["values"]) for e in data["embeddings"]], sum(estimate_tokens(t) for t in texts)
+
+        raise ValueError(f"Provider {provider} não suporta embeddings")
+
+    def stats(self) -> Dict[str, object]:
+        counters = self.stats_counters
+        return {
+            **counters,
+            "window_ms": self.window * 1000,
+            "max_items": self.max_items,
+            "avg_batch_size": counters["upstream_texts"] / counters["batches"] if counters["batches"] else 0.0,
+            "pending": sum(len(p) for p in self._pending.values()),
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
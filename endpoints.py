@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+⚖️ Balanceamento entre endpoints do mesmo modelo
+Um modelo pode ter vários endpoints no catálogo (api.openai.com, deploys
+regionais compatíveis...), cada um com URL, chaves, peso e capacidade.
+Cada chamada escolhe o endpoint por "power of two choices": sorteia dois
+(pelo peso) e fica com o de menor latência × chamadas em andamento.
+Endpoint que falha seguidamente (5xx, conexão) sai da rotação por um tempo
+que cresce a cada ejeção, sem nunca ejetar mais que a fração configurada
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+from deadlines import DeadlineExceeded
+from metrics import metrics
+
+@dataclass
+class EndpointState:
+    model: str
+    name: str
+    in_flight: int = 0
+    requests: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    latency_ewma: Optional[float] = None
+    ejected_until: float = 0.0
+    ejections: int = 0          # ejeções seguidas (multiplica o tempo fora)
+    total_ejections: int = 0
+
+    def ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+class EndpointPick:
+    """
+    Uma chamada num endpoint (usar com `with`)
+    `fail(status)` marca o erro; o código HTTP separa falha do endpoint (5xx, rede)
+    de erro do pedido ou da chave (4xx, 429)
+    """
+
+    def __init__(self, balancer: "EndpointBalancer", state: EndpointState, endpoint: Mapping[str, Any]):
+        self.balancer = balancer
+        self.state = state
+        self.endpoint = endpoint
+        self.status: Optional[int] = None
+        self.errored = False
+        self.started = time.monotonic()
+
+    def fail(self, status: Optional[int]):
+        self.status = status
+        self.errored = True
+
+    @property
+    def endpoint_failure(self) -> bool:
+        return self.errored and (self.status is None or self.status >= 500)
+
+    def __enter__(self) -> "EndpointPick":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.balancer.release(self, exc)
+        return False
+
+class EndpointBalancer:
+    """
+    `strategy`: "p2c" (latência × carga) ou "least_outstanding" (menos chamadas em andamento)
+    `eject_after`: falhas seguidas até ejetar; `eject_seconds`: tempo base fora da rotação
+    `max_ejected_fraction`: fração máxima de endpoints de um modelo fora ao mesmo tempo
+    """
+
+    def __init__(self, strategy: str = "p2c", eject_after: int = 5, eject_seconds: float = 30.0,
+                 max_ejected_fraction: float = 0.5, latency_alpha: float = 0.3):
+        if strategy not in ("p2c", "least_outstanding"):
+            raise ValueError(f"Estratégia de balanceamento desconhecida: {strategy}")
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.max_ejected_fraction = max_ejected_fraction
+        self.latency_alpha = latency_alpha
+        self._states: Dict[tuple, EndpointState] = {}
+        self._random = random.Random()
+
+    def _state(self, model: str, name: str) -> EndpointState:
+        state = self._states.get((model, name))
+        if state is None:
+            state = self._states[(model, name)] = EndpointState(model, name)
+        return state
+
+    def _score(self, state: EndpointState, weight: float, default_latency: float) -> float:
+        latency = state.latency_ewma if state.latency_ewma is not None else default_latency
+        return (state.in_flight + 1) * latency / weight
+
+    def pick(self, model: str, endpoints: Sequence[Mapping[str, Any]],
+             exclude: Sequence[str] = ()) -> EndpointPick:
+        """Escolhe o endpoint da próxima chamada (`exclude`: já tentados nesta chamada)"""
+        if not endpoints:
+            raise ValueError(f"Nenhum endpoint configurado para {model}")
+        now = time.monotonic()
+        candidates = [e for e in endpoints if e["name"] not in exclude] or list(endpoints)
+        states = {e["name"]: self._state(model, e["name"]) for e in candidates}
+        # Fora: ejetados e os que estão na capacidade máxima (a menos que não sobre ninguém)
+        usable = [e for e in candidates if not states[e["name"]].ejected(now)] or candidates
+        usable = [e for e in usable
+                  if not e.get("max_concurrency") or states[e["name"]].in_flight < e["max_concurrency"]] or usable
+        if len(usable) == 1:
+            chosen = usable[0]
+        elif self.strategy == "least_outstanding":
+            chosen = min(usable, key=lambda e: (states[e["name"]].in_flight + 1) / e["weight"])
+        else:
+            known = [states[e["name"]].latency_ewma for e in usable if states[e["name"]].latency_ewma is not None]
+            # Sem medição ainda: conta como o mais rápido conhecido (é experimentado logo)
+            default_latency = min(known) if known else 1.0
+            first = self._weighted_choice(usable)
+            second = self._weighted_choice([e for e in usable if e is not first])
+            chosen = min((first, second), key=lambda e: self._score(states[e["name"]], e["weight"], default_latency))
+        state = states[chosen["name"]]
+        state.in_flight += 1
+        metrics.set_endpoint_in_flight(model, state.name, state.in_flight)
+        return EndpointPick(self, state, chosen)
+
+    def saturated(self, model: str, endpoints: Sequence[Mapping[str, Any]]) -> bool:
+        """Todos os endpoints do modelo estão na capacidade máxima (`max_concurrency`)?"""
+        if not endpoints:
+            return False
+        for endpoint in endpoints:
+            limit = endpoint.get("max_concurrency")
+            if not limit:
+                return False
+            state = self._states.get((model, endpoint["name"]))
+            if state is None or state.in_flight < limit:
+                return False
+        return True
+
+    def _weighted_choice(self, endpoints: List[Mapping[str, Any]]) -> Mapping[str, Any]:
+        return self._random.choices(endpoints, weights=[e["weight"] for e in endpoints])[0]
+
+    def release(self, pick: EndpointPick, exc: Optional[BaseException]):
+        state = pick.state
+        state.in_flight -= 1
+        metrics.set_endpoint_in_flight(state.model, state.name, state.in_flight)
+        if isinstance(exc, (asyncio.CancelledError, GeneratorExit, DeadlineExceeded)):
+            # Quem desistiu foi o cliente: não diz nada sobre o endpoint
+            return
+        if exc is not None and not pick.errored:
+            pick.fail(None)
+        latency = time.monotonic() - pick.started
+        state.requests += 1
+        # 5xx ou erro sem resposta (rede, timeout do cliente) contam contra o endpoint
+        if pick.endpoint_failure:
+            state.failures += 1
+            state.consecutive_failures += 1
+            metrics.record_endpoint_request(state.model, state.name, "failure", latency)
+            if state.consecutive_failures >= self.eject_after:
+                self._eject(state)
+            return
+        metrics.record_endpoint_request(state.model, state.name, "error" if pick.errored else "success", latency)
+        state.consecutive_failures = 0
+        if not pick.errored:
+            state.ejections = 0
+            if state.latency_ewma is None:
+                state.latency_ewma = latency
+            else:
+                state.latency_ewma += self.latency_alpha * (latency - state.latency_ewma)
+
+    def _eject(self, state: EndpointState):
+        now = time.monotonic()
+        if state.ejected(now):
+            return
+        siblings = [s for (model, _), s in self._states.items() if model == state.model]
+        ejected = sum(1 for s in siblings if s.ejected(now))
+        if (ejected + 1) > self.max_ejected_fraction * len(siblings):
+            return
+        state.ejections += 1
+        state.total_ejections += 1
+        state.consecutive_failures = 0
+        state.ejected_until = now + self.eject_seconds * min(state.ejections, 10)
+        metrics.record_endpoint_ejection(state.model, state.name)
+
+    def stats(self, endpoints: Mapping[str, Sequence[Mapping[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Estado dos endpoints por modelo (só modelos com mais de um endpoint)"""
+        now = time.monotonic()
+        result = {}
+        for model, model_endpoints in endpoints.items():
+            if len(model_endpoints) < 2:
+                continue
+            result[model] = []
+            for endpoint in model_endpoints:
+                state = self._state(model, endpoint["name"])
+                result[model].append({
+                    "endpoint": endpoint["name"],
+                    "weight": endpoint["weight"],
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "failures": state.failures,
+                    "latency_ewma_ms": round(state.latency_ewma * 1000, 1) if state.latency_ewma is not None else None,
+                    "ejected": state.ejected(now),
+                    "ejected_seconds": round(max(0.0, state.ejected_until - now), 1),
+                    "ejections": state.total_ejections,
+                })
+        return result
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 🔧 Script para corrigir o endpoint /chat
+Com o servidor no ar, tenta primeiro o reload a quente (POST /admin/reload)
 """
 
 import requests
@@ -17,6 +18,23 @@ def check_server_running():
     except:
         return False
 
+def hot_reload():
+    """Recarrega catálogo e chaves sem derrubar o processo (requer ADMIN_TOKEN)"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        print("⚠️  ADMIN_TOKEN não definido: sem reload a quente")
+        return False
+    try:
+        response = requests.post("http://localhost:8000/admin/reload",
+                                 headers={"X-Admin-Token": token}, timeout=5)
+        if response.status_code == 200:
+            print(f"✅ Reload a quente concluído (versão {response.json()['version']})")
+            return True
+        print(f"⚠️  Reload a quente falhou: {response.status_code} {response.text}")
+    except Exception as e:
+        print(f"⚠️  Servidor não respondeu ao reload: {e}")
+    return False
+
 def kill_existing_servers():
     """Mata processos Python existentes"""
     try:
@@ -86,8 +104,10 @@ def main():
         if test_chat_endpoint():
             print("🎉 Endpoint /chat já está funcionando!")
             return
-        else:
-            print("⚠️  Endpoint com problema, reiniciando servidor...")
+        if "--force" not in sys.argv and hot_reload() and test_chat_endpoint():
+            print("🎉 Endpoint /chat corrigido com reload a quente!")
+            return
+        print("⚠️  Endpoint com problema, reiniciando servidor...")
     else:
         print("❌ Servidor não está rodando")
     
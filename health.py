@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+🩺 Sondagem ativa dos provedores do RouterLLM
+De tempos em tempos (com jitter) faz um GET barato em /models de cada
+provedor configurado e guarda alcance e latência num buffer circular.
+O resultado alimenta o /status, o gauge de disponibilidade e o roteamento
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from keypool import bearer_headers
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def probe_request(provider: str, base_url: str, api_key: str) -> Tuple[str, Dict[str, str]]:
+    """URL e cabeçalhos de uma chamada barata (listar modelos, sem gerar tokens)"""
+    if provider == "anthropic":
+        return f"{base_url}/models", {"x-api-key": api_key, "anthropic-version": "2023-06-01"}
+    if provider == "google":
+        return f"{base_url}/models?key={api_key}", {}
+    # OpenAI e compatíveis (servidor próprio sem chave: sem Authorization)
+    return f"{base_url}/models", bearer_headers(api_key)
+
+async def check_key(client, provider: str, base_url: str, api_key: str,
+                    timeout: float = 5.0) -> Dict[str, Any]:
+    """
+    🔑 Testa uma chave com a chamada barata
+    401/403 = chave inválida; 429 = chave válida mas limitada; 5xx = provedor com problema
+    """
+    url, headers = probe_request(provider, base_url, api_key)
+    start = time.monotonic()
+    try:
+        response = await client.get(url, headers=headers, timeout=timeout)
+    except Exception as e:
+        return {"ok": False, "reachable": False, "status_code": None,
+                "latency": time.monotonic() - start, "error": f"{type(e).__name__}: {e}"}
+    latency = time.monotonic() - start
+    status = response.status_code
+    ok = status < 400 or status == 429
+    error = None if ok else (f"chave inválida (HTTP {status})" if status in (401, 403) else f"HTTP {status}")
+    return {"ok": ok, "reachable": status < 500, "status_code": status, "latency": latency, "error": error}
+
+def _percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class HealthProber:
+    """
+    Sondas em segundo plano, limitadas para não competir com o tráfego real:
+    no máximo `max_per_minute` sondas no total, uma por provedor por vez,
+    e nenhuma enquanto `is_busy()` disser que a capacidade está tomada
+    """
+
+    def __init__(self, config, client_factory: Callable[[], Any], interval: float = 30.0,
+                 jitter: float = 0.2, timeout: float = 5.0, history: int = 20,
+                 max_per_minute: int = 12, failure_threshold: int = 2,
+                 is_busy: Optional[Callable[[], bool]] = None):
+        self.config = config
+        self.client_factory = client_factory
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.history = history
+        self.max_per_minute = max_per_minute
+        self.failure_threshold = failure_threshold
+        self.is_busy = is_busy or (lambda: False)
+        self._results: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._failures: Dict[str, int] = {}
+        self._next_due: Dict[str, float] = {}
+        self._recent_probes: Deque[float] = deque()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _jittered(self) -> float:
+        return self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _allowed(self, now: float) -> bool:
+        """Limite global de sondas por minuto (janela deslizante)"""
+        while self._recent_probes and now - self._recent_probes[0] > 60:
+            self._recent_probes.popleft()
+        return len(self._recent_probes) < self.max_per_minute
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            providers = self.config.available_providers
+            for provider in providers:
+                # Primeira sonda espalhada no primeiro intervalo (sem rajada no startup);
+                # provedor local logo de cara, porque só recebe tráfego depois de responder
+                first = 0.0 if self.config.is_local(provider) else random.uniform(0, self.interval * self.jitter)
+                self._next_due.setdefault(provider, now + first)
+            due = [p for p in providers if self._next_due[p] <= now]
+            for provider in due:
+                if self.is_busy() or not self._allowed(now):
+                    # Adia um pouco: o tráfego real tem prioridade
+                    self._next_due[provider] = now + random.uniform(1.0, 5.0)
+                    continue
+                self._recent_probes.append(now)
+                self._next_due[provider] = now + self._jittered()
+                await self.probe(provider)
+            wait = min((self._next_due[p] for p in providers), default=now + self.interval) - time.monotonic()
+            await asyncio.sleep(min(max(wait, 0.05), self.interval))
+
+    async def probe(self, provider: str) -> Dict[str, Any]:
+        api_key = self.config.get_api_key(provider)
+        base_url = self.config.get_provider(provider).get("base_url", "")
+        if not api_key:
+            return {}
+        result = await check_key(self.client_factory(), provider, base_url, api_key, self.timeout)
+        result["checked_at"] = time.time()
+        self._results.setdefault(provider, deque(maxlen=self.history)).append(result)
+        if result["ok"]:
+            if self._failures.get(provider):
+                logger.info(f"💚 {provider} voltou a responder")
+            self._failures[provider] = 0
+        else:
+            self._failures[provider] = self._failures.get(provider, 0) + 1
+            if self._failures[provider] == self.failure_threshold:
+                logger.warning(f"💔 {provider} falhou {self.failure_threshold} sondas seguidas: {result['error']}")
+        metrics.record_probe(provider, result["ok"], result["latency"])
+        healthy = self.is_healthy(provider)
+        for model, model_config in self.config.models.items():
+            if model_config["provider"] == provider:
+                metrics.set_model_availability(model, healthy)
+        return result
+
+    def is_healthy(self, provider: str) -> bool:
+        """
+        Sem sondas ainda = saudável; só falhas seguidas tiram o provedor do roteamento
+        Provedor local (sem chave que diga se está no ar) só entra depois de uma sonda ok
+        """
+        if self.config.is_local(provider) and not any(r["ok"] for r in self._results.get(provider, ())):
+            return False
+        return self._failures.get(provider, 0) < self.failure_threshold
+
+    def status(self, provider: str) -> Dict[str, Any]:
+        results = list(self._results.get(provider, ()))
+        latencies = [r["latency"] for r in results if r["ok"]]
+        last = results[-1] if results else None
+        return {
+            "healthy": self.is_healthy(provider),
+            "local": self.config.is_local(provider),
+            "probed": bool(results),
+            "reachable": last["reachable"] if last else None,
+            "last_checked": last["checked_at"] if last else None,
+            "last_error": last["error"] if last else None,
+            "consecutive_failures": self._failures.get(provider, 0),
+            "success_rate": sum(r["ok"] for r in results) / len(results) if results else None,
+            "latency_p50_ms": round(_percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+            "latency_p95_ms": round(_percentile(latencies, 0.95) * 1000, 1) if latencies else None,
+        }
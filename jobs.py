@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+📬 Jobs assíncronos do RouterLLM
+Fila limitada em memória, drenada por um pool de workers, com persistência
+em SQLite para que os jobs sobrevivam a reinícios do processo
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import jsoncodec
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+class QueueFullError(Exception):
+    """Fila cheia - o cliente deve tentar mais tarde (backpressure)"""
+
+class JobStoreError(Exception):
+    """Não foi possível gravar o job no SQLite - o job não foi aceito"""
+
+class JobStore:
+    """💾 Persistência dos jobs em SQLite (chamadas síncronas, rodar em thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                request TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+
+    def insert(self, job: Dict[str, Any]):
+        self._conn.execute(
+            "INSERT INTO jobs (id, status, request, created_at) VALUES (?, ?, ?, ?)",
+            (job["id"], job["status"], jsoncodec.dumps(job["request"]).decode("utf-8"), job["created_at"]),
+        )
+
+    def update(self, job: Dict[str, Any]):
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, started_at = ?, finished_at = ? WHERE id = ?",
+            (
+                job["status"],
+                jsoncodec.dumps(job["result"]).decode("utf-8") if job.get("result") is not None else None,
+                job.get("error"),
+                job.get("started_at"),
+                job.get("finished_at"),
+                job["id"],
+            ),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT id, status, request, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def unfinished(self):
+        """Jobs que não terminaram (inclusive os que estavam rodando quando o processo caiu)"""
+        rows = self._conn.execute(
+            "SELECT id, status, request, result, error, created_at, started_at, finished_at "
+            "FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (PENDING, RUNNING),
+        ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "status": row[1],
+            "request": jsoncodec.loads(row[2]),
+            "result": jsoncodec.loads(row[3]) if row[3] else None,
+            "error": row[4],
+            "created_at": row[5],
+            "started_at": row[6],
+            "finished_at": row[7],
+        }
+
+    def close(self):
+        self._conn.close()
+
+class JobQueue:
+    """
+    ⚙️ Fila de jobs com backpressure
+    `handler` recebe o corpo da requisição (dict) e devolve o resultado (dict)
+    """
+
+    def __init__(self, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+                 db_path: Optional[str] = None, max_queue: int = 100, workers: int = 4,
+                 finished_cache: int = 1000):
+        self.handler = handler
+        self.db_path = db_path
+        self.max_queue = max_queue
+        self.worker_count = workers
+        self.finished_cache = finished_cache
+        self.store: Optional[JobStore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, asyncio.Event] = {}
+        self._workers = []
+        self._db_lock = asyncio.Lock()
+
+    async def _db(self, method: str, *args):
+        """Acesso ao SQLite fora do event loop, serializado"""
+        if self.store is None:
+            return None
+        async with self._db_lock:
+            return await asyncio.to_thread(getattr(self.store, method), *args)
+
+    async def start(self):
+        """Abre o banco, reenfileira jobs pendentes e inicia os workers"""
+        self._queue = asyncio.Queue()
+        if self.db_path:
+            self.store = await asyncio.to_thread(JobStore, self.db_path)
+            recovered = await self._db("unfinished")
+            for job in recovered:
+                job["status"] = PENDING
+                job["started_at"] = None
+                self._jobs[job["id"]] = job
+                self._events[job["id"]] = asyncio.Event()
+                self._queue.put_nowait(job["id"])
+            if recovered:
+                logger.info(f"📬 {len(recovered)} jobs recuperados do SQLite")
+        metrics.set_job_queue_depth(self._queue.qsize())
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self.store is not None:
+            await asyncio.to_thread(self.store.close)
+            self.store = None
+
+    async def submit(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Enfileira um job; levanta QueueFullError se a fila estiver cheia"""
+        if self._queue is None:
+            raise RuntimeError("Fila de jobs não iniciada")
+        if self._queue.qsize() >= self.max_queue:
+            metrics.record_job("rejected")
+            raise QueueFullError(f"Fila cheia ({self.max_queue} jobs)")
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": PENDING,
+            "request": request,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        # Grava antes de expor: job visível é job que sobrevive a um reinício
+        try:
+            await self._db("insert", job)
+        except sqlite3.Error as e:
+            logger.error(f"❌ Não foi possível gravar o job: {e}")
+            metrics.record_job("rejected")
+            raise JobStoreError(f"Não foi possível gravar o job: {e}") from e
+        self._jobs[job["id"]] = job
+        self._events[job["id"]] = asyncio.Event()
+        self._queue.put_nowait(job["id"])
+        metrics.record_job("submitted")
+        metrics.set_job_queue_depth(self._queue.qsize())
+        return job
+
+    async def get(self, job_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """Estado do job; com `wait` > 0 faz long-poll até terminar ou o tempo acabar"""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return await self._db("get", job_id)
+        event = self._events.get(job_id)
+        if wait > 0 and event is not None and not event.is_set():
+            try:
+                await asyncio.wait_for(event.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            metrics.set_job_queue_depth(self._queue.qsize())
+            try:
+                await self._run(self._jobs[job_id])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Falha fora do handler (ex.: SQLite travado): o job falha, o worker continua
+                logger.exception(f"❌ Job {job_id} falhou fora do handler")
+                await self._fail(job_id, f"Erro interno: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]):
+        job["status"] = RUNNING
+        job["started_at"] = time.time()
+        await self._db("update", job)
+        try:
+            job["result"] = await self.handler(job["request"])
+            job["status"] = DONE
+        except asyncio.CancelledError:
+            # Processo encerrando: o job volta a "pending" no próximo start
+            raise
+        except Exception as e:
+            logger.error(f"❌ Job {job['id']} falhou: {e}")
+            job["status"] = FAILED
+            job["error"] = str(e)
+        job["finished_at"] = time.time()
+        await self._db("update", job)
+        self._finish(job)
+
+    async def _fail(self, job_id: str, error: str):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job["status"] = FAILED
+        job["result"] = None
+        job["error"] = error
+        job["finished_at"] = time.time()
+        job["started_at"] = job["started_at"] or job["finished_at"]
+        try:
+            await self._db("update", job)
+        except Exception as e:
+            logger.error(f"❌ Job {job_id}: estado final não gravado ({e})")
+        self._finish(job)
+
+    def _finish(self, job: Dict[str, Any]):
+        metrics.record_job(job["status"], job["finished_at"] - job["created_at"],
+                           job["started_at"] - job["created_at"])
+        event = self._events.pop(job["id"], None)
+        if event is not None:
+            event.set()
+        self._forget_old_jobs()
+
+    def _forget_old_jobs(self):
+        """Mantém só os jobs recentes em memória; os antigos ficam no SQLite (se houver)"""
+        finished = [j for j in self._jobs.values() if j["status"] in (DONE, FAILED)]
+        for job in finished[:max(0, len(finished) - self.finished_cache)]:
+            del self._jobs[job["id"]]
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "workers": self.worker_count,
+            "persistent": self.store is not None,
+            "by_status": counts,
+        }
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+⚡ Codec JSON rápido do RouterLLM
+Usa orjson quando disponível (bytes direto, sem cópias de str intermediárias)
+e cai para o json da biblioteca padrão caso contrário
+
+Use sempre via módulo (jsoncodec.dumps), para respeitar set_backend
+"""
+
+import json
+from collections.abc import Mapping
+from typing import Any, Callable
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+def _std_loads(data) -> Any:
+    return json.loads(data)
+
+def _default(obj: Any) -> Any:
+    """Tipos que o orjson não conhece (tabelas imutáveis do catálogo, modelos pydantic)"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if hasattr(obj, "model_dump"):
+        return obj.model_dump()
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+def _orjson_dumps(obj: Any) -> bytes:
+    return orjson.dumps(obj, default=_default)
+
+def _std_dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+dumps: Callable[[Any], bytes] = _std_dumps
+loads: Callable[[Any], Any] = _std_loads
+backend = "json"
+
+def set_backend(name: str):
+    """Troca o backend ("orjson" ou "json") - usado pelo benchmark"""
+    global dumps, loads, backend
+    if name == "orjson" and orjson is not None:
+        dumps, loads, backend = _orjson_dumps, orjson.loads, "orjson"
+    else:
+        dumps, loads, backend = _std_dumps, _std_loads, "json"
+
+set_backend("orjson")
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+🔑 Pool de chaves de API por provedor
+Com várias chaves (ex.: OPENAI_API_KEYS=sk-a,sk-b) cada chamada usa a chave
+menos carregada: menos chamadas em andamento e mais folga nos limites que o
+provedor informa nos cabeçalhos. Chave que recebe 429 descansa até o
+Retry-After (ou o cooldown padrão). Nas métricas a chave aparece mascarada
+"""
+
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from catalog import NO_KEY_SUFFIX
+from metrics import metrics
+
+def bearer_headers(key: str) -> Dict[str, str]:
+    """Authorization: Bearer da chave; servidor próprio sem chave vai sem o cabeçalho"""
+    return {} if key.endswith(NO_KEY_SUFFIX) else {"Authorization": f"Bearer {key}"}
+
+def mask_key(key: Optional[str]) -> Optional[str]:
+    """Mesmo formato do /api-config/status: começo e fim da chave"""
+    return key[:10] + "..." + key[-4:] if key else None
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def _seconds_until(value: Optional[str], now: float) -> Optional[float]:
+    """Reset em duração da OpenAI ("6m0s", "20ms") ou data RFC 3339 da Anthropic"""
+    if not value:
+        return None
+    parts = _DURATION.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _UNITS[u] for n, u in parts)
+    try:
+        return max(0.0, datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() - now)
+    except ValueError:
+        return None
+
+def _int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def header_dict(headers) -> Dict[str, str]:
+    """
+    Cabeçalhos do httpx num dict de nomes minúsculos, numa passada só
+    (cada busca no httpx.Headers percorre e decodifica a lista inteira)
+    """
+    raw = getattr(headers, "raw", None)
+    if raw is None:
+        return headers
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in raw}
+
+def parse_rate_limit_headers(headers, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    📏 Limites informados pelo provedor (campos ausentes = None)
+    OpenAI: x-ratelimit-*; Anthropic: anthropic-ratelimit-*; ambos: retry-after
+    """
+    now = time.time() if now is None else now
+    headers = header_dict(headers)
+    if "anthropic-ratelimit-requests-remaining" in headers or "anthropic-ratelimit-tokens-remaining" in headers:
+        prefix, names = "anthropic-ratelimit-", ("requests-limit", "requests-remaining", "requests-reset",
+                                                 "tokens-limit", "tokens-remaining", "tokens-reset")
+    else:
+        prefix, names = "x-ratelimit-", ("limit-requests", "remaining-requests", "reset-requests",
+                                         "limit-tokens", "remaining-tokens", "reset-tokens")
+    values = [headers.get(prefix + name) for name in names]
+    retry_after = headers.get("retry-after")
+    return {
+        "limit_requests": _int(values[0]),
+        "remaining_requests": _int(values[1]),
+        "reset_requests": _seconds_until(values[2], now),
+        "limit_tokens": _int(values[3]),
+        "remaining_tokens": _int(values[4]),
+        "reset_tokens": _seconds_until(values[5], now),
+        "retry_after": float(retry_after) if retry_after and retry_after.replace(".", "", 1).isdigit() else None,
+    }
+
+@dataclass
+class KeyState:
+    provider: str
+    key: str
+    label: str
+    in_flight: int = 0
+    requests: int = 0
+    tokens: int = 0
+    rate_limited: int = 0
+    limit_requests: Optional[int] = None
+    remaining_requests: Optional[int] = None
+    limit_tokens: Optional[int] = None
+    remaining_tokens: Optional[int] = None
+    budget_reset_at: float = 0.0
+    cooldown_until: float = 0.0
+    last_used: float = 0.0
+
+    def headroom(self, now: float) -> float:
+        """Fração do limite ainda livre (1.0 se o provedor não informou ou já resetou)"""
+        if now >= self.budget_reset_at:
+            return 1.0
+        fractions = [
+            remaining / limit
+            for remaining, limit in ((self.remaining_requests, self.limit_requests),
+                                     (self.remaining_tokens, self.limit_tokens))
+            if remaining is not None and limit
+        ]
+        return min(fractions) if fractions else 1.0
+
+    def cooling(self, now: float) -> bool:
+        return now < self.cooldown_until or self.headroom(now) <= 0.0
+
+class KeyLease:
+    """
+    Uma chamada com uma chave do pool (usar com `with`)
+    `observe(response)` lê os limites; `tokens` conta o uso da chave
+    """
+
+    def __init__(self, pools: "KeyPools", state: KeyState):
+        self.pools = pools
+        self.state = state
+        self.key = state.key
+        self.status: Optional[int] = None
+        self.tokens = 0
+
+    def observe(self, response):
+        self.status = response.status_code
+        self.pools.observe(self.state, response.status_code, response.headers)
+
+    def __enter__(self) -> "KeyLease":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pools.release(self, exc is not None)
+        return False
+
+class KeyPools:
+    """🗝️ Estado de todas as chaves, indexado pela própria chave (sobrevive a reloads do catálogo)"""
+
+    def __init__(self, cooldown: float = 30.0):
+        self.cooldown = cooldown
+        self._states: Dict[str, KeyState] = {}
+
+    def _state(self, provider: str, key: str) -> KeyState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = KeyState(provider, key, mask_key(key))
+        return state
+
+    def lease(self, provider: str, keys: Sequence[str]) -> KeyLease:
+        """Escolhe a chave menos carregada; se todas estão em cooldown, a que volta primeiro"""
+        if not keys:
+            raise ValueError(f"Chave de {provider} não configurada")
+        now = time.time()
+        states = [self._state(provider, key) for key in keys]
+        ready = [s for s in states if not s.cooling(now)]
+        if ready:
+            state = min(ready, key=lambda s: (s.in_flight / max(s.headroom(now), 0.01), s.last_used))
+        else:
+            state = min(states, key=lambda s: max(s.cooldown_until, s.budget_reset_at))
+        state.in_flight += 1
+        state.last_used = now
+        return KeyLease(self, state)
+
+    def get(self, key: str) -> Optional[KeyState]:
+        return self._states.get(key)
+
+    def has_ready(self, keys: Sequence[str]) -> bool:
+        """Alguma chave fora de cooldown?"""
+        now = time.time()
+        return any(key not in self._states or not self._states[key].cooling(now) for key in keys)
+
+    def observe(self, state: KeyState, status_code: int, headers):
+        now = time.time()
+        limits = parse_rate_limit_headers(headers, now)
+        for name in ("limit_requests", "remaining_requests", "limit_tokens", "remaining_tokens"):
+            if limits[name] is not None:
+                setattr(state, name, limits[name])
+        resets = [r for r in (limits["reset_requests"], limits["reset_tokens"]) if r is not None]
+        if resets:
+            state.budget_reset_at = now + max(resets)
+        if status_code == 429:
+            state.rate_limited += 1
+            state.cooldown_until = now + (limits["retry_after"] or self.cooldown)
+            metrics.record_api_key_cooldown(state.provider, state.label)
+        for kind, value in (("requests", state.remaining_requests), ("tokens", state.remaining_tokens)):
+            if value is not None:
+                metrics.set_api_key_remaining(state.provider, state.label, kind, value)
+
+    def release(self, lease: KeyLease, failed: bool):
+        state = lease.state
+        state.in_flight -= 1
+        state.requests += 1
+        state.tokens += lease.tokens
+        status = str(lease.status) if lease.status is not None else ("error" if failed else "ok")
+        metrics.record_api_key_request(state.provider, state.label, status, lease.tokens)
+
+    def stats(self, pools: Dict[str, Sequence[str]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Estado das chaves configuradas (mascaradas), por provedor"""
+        now = time.time()
+        result = {}
+        for provider, keys in pools.items():
+            result[provider] = []
+            for key in keys:
+                state = self._state(provider, key)
+                result[provider].append({
+                    "key": state.label,
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "tokens": state.tokens,
+                    "rate_limited": state.rate_limited,
+                    "cooling_down": state.cooling(now),
+                    "cooldown_seconds": round(max(0.0, state.cooldown_until - now), 1),
+                    "remaining_requests": state.remaining_requests,
+                    "remaining_tokens": state.remaining_tokens,
+                    "headroom": round(state.headroom(now), 3),
+                })
+        return result
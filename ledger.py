@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+💰 Livro-razão de uso e custo do RouterLLM
+Cada chamada vira um evento gravado em SQLite (WAL) em lotes assíncronos;
+os totais por minuto, hora e dia são mantidos incrementalmente (upsert),
+então as consultas leem só os agregados, mesmo com meses de histórico
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = {"minute": 60, "hour": 3600, "day": 86400}
+GROUP_COLUMNS = ("user_id", "model")
+COUNTERS = ("requests", "input_tokens", "output_tokens", "cached_tokens", "cost")
+
+class UsageStore:
+    """💾 Eventos e agregados em SQLite (chamadas síncronas, rodar em thread)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS usage_events (
+                ts REAL NOT NULL,
+                user_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                status TEXT NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                cost REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS usage_rollups (
+                granularity TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                cost REAL NOT NULL,
+                PRIMARY KEY (granularity, bucket, user_id, model)
+            ) WITHOUT ROWID"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS usage_rollups_user ON usage_rollups(granularity, user_id, bucket)"
+        )
+
+    def insert_batch(self, events: Sequence[Dict[str, Any]]):
+        """Grava os eventos e soma nos agregados, tudo numa transação"""
+        rollups: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0, 0, 0, 0.0])
+        for event in events:
+            for granularity, seconds in GRANULARITIES.items():
+                key = (granularity, int(event["ts"] // seconds * seconds), event["user_id"], event["model"])
+                totals = rollups[key]
+                totals[0] += 1
+                totals[1] += event["input_tokens"]
+                totals[2] += event["output_tokens"]
+                totals[3] += event["cached_tokens"]
+                totals[4] += event["cost"]
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO usage_events (ts, user_id, model, status, input_tokens, output_tokens, cached_tokens, cost) "
+                "VALUES (:ts, :user_id, :model, :status, :input_tokens, :output_tokens, :cached_tokens, :cost)",
+                events,
+            )
+            self._conn.executemany(
+                """INSERT INTO usage_rollups
+                   (granularity, bucket, user_id, model, requests, input_tokens, output_tokens, cached_tokens, cost)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (granularity, bucket, user_id, model) DO UPDATE SET
+                       requests = requests + excluded.requests,
+                       input_tokens = input_tokens + excluded.input_tokens,
+                       output_tokens = output_tokens + excluded.output_tokens,
+                       cached_tokens = cached_tokens + excluded.cached_tokens,
+                       cost = cost + excluded.cost""",
+                [key + tuple(totals) for key, totals in rollups.items()],
+            )
+
+    def query(self, granularity: str, start: float, end: float, user_id: Optional[str] = None,
+              model: Optional[str] = None, group_by: Sequence[str] = GROUP_COLUMNS) -> List[Dict[str, Any]]:
+        """Totais por balde de tempo (e por usuário/modelo, conforme `group_by`) no intervalo [start, end)"""
+        seconds = GRANULARITIES[granularity]
+        where = ["granularity = ?", "bucket >= ?", "bucket < ?"]
+        params: List[Any] = [granularity, int(start // seconds * seconds), end]
+        if user_id is not None:
+            where.append("user_id = ?")
+            params.append(user_id)
+        if model is not None:
+            where.append("model = ?")
+            params.append(model)
+        columns = ["bucket"] + [c for c in GROUP_COLUMNS if c in group_by]
+        sums = ", ".join(f"SUM({c})" for c in COUNTERS)
+        rows = self._conn.execute(
+            f"SELECT {', '.join(columns)}, {sums} FROM usage_rollups WHERE {' AND '.join(where)} "
+            f"GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}",
+            params,
+        ).fetchall()
+        return [dict(zip(columns + list(COUNTERS), row)) for row in rows]
+
+    def cost_by_model_since(self, since: float) -> Dict[str, float]:
+        rows = self._conn.execute(
+            "SELECT model, SUM(cost) FROM usage_rollups WHERE granularity = 'minute' AND bucket >= ? GROUP BY model",
+            (int(since // 60 * 60),),
+        ).fetchall()
+        return dict(rows)
+
+    def prune(self, granularity: str, before: float):
+        """Remove agregados antigos de uma granularidade (os mais finos crescem rápido)"""
+        self._conn.execute("DELETE FROM usage_rollups WHERE granularity = ? AND bucket < ?", (granularity, before))
+
+    def close(self):
+        self._conn.close()
+
+class UsageLedger:
+    """
+    📒 Fila de eventos de uso drenada em lotes por uma tarefa de fundo
+    `record()` nunca espera o disco: o /chat só adiciona o evento ao buffer
+    """
+
+    def __init__(self, db_path: Optional[str] = None, batch_size: int = 200,
+                 flush_interval: float = 1.0, minute_retention_days: float = 7.0, max_retries: int = 5):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.minute_retention_days = minute_retention_days
+        self.max_retries = max_retries
+        self.store: Optional[UsageStore] = None
+        self._buffer: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._db_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._failures = 0  # tentativas seguidas do lote da frente
+        self._last_prune = 0.0
+        self._gauge_models = set()
+        self._closing = False
+        self.recorded = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    async def _db(self, method: str, *args):
+        """Acesso ao SQLite fora do event loop, serializado"""
+        async with self._db_lock:
+            return await asyncio.to_thread(getattr(self.store, method), *args)
+
+    async def start(self):
+        if not self.db_path:
+            return
+        self.store = await asyncio.to_thread(UsageStore, self.db_path)
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            # Sem cancelar: um lote no meio da gravação não se perde
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        if self.store is not None:
+            # Grava o que ficou no buffer antes de fechar
+            try:
+                await self._flush()
+            except Exception as e:
+                self._drop(len(self._buffer), f"gravação final falhou: {e}")
+                self._buffer = []
+            await asyncio.to_thread(self.store.close)
+            self.store = None
+
+    def record(self, user_id: str, model: str, status: str, input_tokens: int = 0,
+               output_tokens: int = 0, cached_tokens: int = 0, cost: float = 0.0):
+        if self.store is None:
+            return
+        if len(self._buffer) >= self.batch_size * 50:
+            # Disco travado: melhor perder eventos do que a memória do processo
+            self._drop(1)
+            return
+        self._buffer.append({
+            "ts": time.time(),
+            "user_id": user_id or "anonymous",
+            "model": model,
+            "status": status,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cached_tokens": cached_tokens,
+            "cost": cost,
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                await self._maintain()
+            except Exception as e:
+                logger.error(f"❌ Falha ao gravar o livro-razão de uso: {e}")
+
+    async def _flush(self):
+        """
+        Grava o buffer em lotes; lote que falha fica na frente e é refeito na
+        próxima rodada (a gravação é uma transação), até `max_retries` vezes
+        """
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                try:
+                    await self._db("insert_batch", batch)
+                except Exception as e:
+                    self._failures += 1
+                    if self._failures >= self.max_retries:
+                        del self._buffer[:len(batch)]
+                        self._failures = 0
+                        self._drop(len(batch), f"lote descartado após {self.max_retries} tentativas: {e}")
+                    raise
+                # Só agora sai do buffer (record() só acrescenta no fim)
+                del self._buffer[:len(batch)]
+                self._failures = 0
+                self.recorded += len(batch)
+
+    def _drop(self, count: int, reason: Optional[str] = None):
+        """Conta eventos perdidos (log só para lotes; o transbordo do buffer vai só para a métrica)"""
+        if not count:
+            return
+        self.dropped += count
+        metrics.record_usage_dropped(count)
+        if reason:
+            logger.error(f"❌ Livro-razão: {count} eventos de uso perdidos ({reason})")
+
+    async def _maintain(self):
+        """Atualiza o gauge de custo da última hora e poda os agregados por minuto"""
+        now = time.time()
+        costs = await self._db("cost_by_model_since", now - 3600)
+        # Modelos sem uso na última hora voltam a zero
+        for model in self._gauge_models | costs.keys():
+            metrics.set_cost_per_hour(model, costs.get(model, 0.0))
+        self._gauge_models = set(costs)
+        if now - self._last_prune > 3600:
+            self._last_prune = now
+            await self._db("prune", "minute", now - self.minute_retention_days * 86400)
+
+    async def query(self, granularity: str, start: float, end: float, user_id: Optional[str] = None,
+                    model: Optional[str] = None, group_by: Sequence[str] = GROUP_COLUMNS) -> List[Dict[str, Any]]:
+        # Inclui o que ainda está no buffer, para a consulta não "atrasar" 1 s
+        try:
+            await self._flush()
+        except Exception as e:
+            logger.warning(f"⚠️ Livro-razão: buffer não gravado antes da consulta ({e})")
+        return await self._db("query", granularity, start, end, user_id, model, group_by)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "persistent": self.store is not None,
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "failed_attempts": self._failures,
+        }
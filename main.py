@@ -4,60 +4,143 @@
 Criado para otimizar custo e performance automaticamente
 """
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, Response
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
-import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Header
+from fastapi.responses import HTMLResponse, Response, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, Dict, Any, List, Literal, Union
 import asyncio
-import httpx
+import hmac
 import time
 import logging
 import os
-from datetime import datetime
-from dotenv import load_dotenv
+import threading
+from datetime import datetime, timezone
 
-from router import LLMRouter
+import jsoncodec
+from router import Attempt, LLMRouter, ModelResult
 from config import RouterConfig
+from catalog import CatalogError, CatalogWatcher
 from metrics import metrics
+from responses import CompressionMiddleware, FastJSONResponse, FastJSONRoute
+from conversation import (
+    conversation_text, estimate_tokens, normalize_messages, last_user_text, prefix_key, text_part
+)
+from deadlines import DeadlineExceeded, current_deadline, deadline_at, deadline_scope, within_deadline
+import profiling
+from sessions import Session, SessionStore, compact_history, with_summary
+from shadow import ShadowRouter, parse_policies
+from jobs import JobQueue, JobStoreError, QueueFullError
+from scheduler import BULK, INTERACTIVE, PriorityScheduler, parse_weights
+from debugtools import LoopLagMonitor, collapsed, sample_stacks
+from admission import AdmissionController, AdmissionMiddleware
+from ledger import GRANULARITIES, GROUP_COLUMNS, UsageLedger
+from health import HealthProber, check_key
+from embeddings import EmbeddingBatcher, encode_vector
+from response_cache import ResponseCache
+from batches import BatchRunner
+from keypool import bearer_headers, header_dict, mask_key
+from openai_compat import (
+    FINISH_REASONS, SSE_DONE, CompatError, chunk_event, completion_body, completion_id, error_body,
+    replace_model, stream_usage, to_internal, usage_body
+)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ☁️ Em serverless (Vercel/Lambda) o sistema de arquivos é somente leitura
+# e as variáveis já vêm do ambiente: nada de .env nem arquivo de log
+IS_SERVERLESS = bool(os.getenv("VERCEL") or os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
 
 # Carregar variáveis de ambiente do arquivo .env
-load_dotenv()
+if not IS_SERVERLESS:
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Setup logging
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+log_handlers = [logging.StreamHandler()]
+log_file = os.getenv("LOG_FILE", "" if IS_SERVERLESS else "router_llm.log")
+if log_file:
+    # delay=True: o arquivo só é aberto no primeiro log, nunca no import
+    log_handlers.append(logging.FileHandler(log_file, delay=True))
 logging.basicConfig(
     level=getattr(logging, log_level),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('router_llm.log')
-    ]
+    handlers=log_handlers
 )
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="RouterLLM - Seu Roteador Inteligente",
     description="Roteador que escolhe o melhor modelo LLM para cada tarefa",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
+# ⚡ Corpo das requisições com o codec JSON rápido e respostas grandes comprimidas
+app.router.route_class = FastJSONRoute
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")))
+
+class LazyStaticFiles:
+    """📁 Monta os arquivos estáticos só na primeira requisição a /static"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._app = None
+
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            from fastapi.staticfiles import StaticFiles
+            self._app = StaticFiles(directory=self.directory)
+        await self._app(scope, receive, send)
+
+_templates = None
 
-# Configurar arquivos estáticos e templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+def get_templates():
+    """🖼️ Carrega o Jinja2 só quando uma página HTML é pedida"""
+    global _templates
+    if _templates is None:
+        from fastapi.templating import Jinja2Templates
+        _templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "templates"))
+    return _templates
+
+# Configurar arquivos estáticos (templates são carregados sob demanda)
+app.mount("/static", LazyStaticFiles(os.path.join(BASE_DIR, "static")), name="static")
 
 # Inicializar o roteador
 config = RouterConfig()
 router = LLMRouter(config)
 
+# 🗂️ Sessões de conversa (histórico no servidor)
+session_store = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "1000")),
+    spill_dir=os.getenv("SESSION_SPILL_DIR") or None
+)
+
+class ContentPart(BaseModel):
+    type: Literal["text"] = "text"
+    text: str
+    cache: Optional[bool] = False  # Marca um trecho estável para o cache de prompt do provedor
+
+class ChatMessage(BaseModel):
+    role: Literal["user", "assistant"]
+    content: Union[str, List[ContentPart]]
+
 class ChatRequest(BaseModel):
-    message: str
+    message: Optional[str] = None
+    messages: Optional[List[ChatMessage]] = None  # Conversa multi-turno / multi-partes
+    system: Optional[str] = None  # Instruções de sistema (prefixo estável, cacheável)
     user_id: Optional[str] = "anonymous"
     max_tokens: Optional[int] = 1000
     temperature: Optional[float] = 0.7
     force_model: Optional[str] = None  # Para forçar um modelo específico
+    session_id: Optional[str] = None  # Histórico guardado no servidor: envie só os turnos novos
+    priority: Optional[Literal["interactive", "bulk"]] = None  # Faixa de prioridade (padrão: interactive no /chat, bulk em /jobs)
+    timeout_ms: Optional[int] = Field(None, gt=0)  # Prazo total: estourou, a chamada ao provedor é cancelada (504)
+
+    @model_validator(mode="after")
+    def check_content(self):
+        if not self.message and not self.messages:
+            raise ValueError("Informe 'message' ou 'messages'")
+        return self
 
 class ChatResponse(BaseModel):
     response: str
@@ -66,13 +149,248 @@ class ChatResponse(BaseModel):
     cost_estimate: float
     response_time: float
     tokens_used: int
+    cached_tokens: int = 0
+    session_id: Optional[str] = None
+    attempts: Optional[List[Dict[str, Any]]] = None  # Tentativas da cascata (barato → premium)
+
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str]]
+    model: Optional[str] = None  # Padrão: o primeiro disponível em defaults.embedding_priority
+    user_id: Optional[str] = "anonymous"
+    encoding_format: Literal["base64", "float"] = "base64"  # base64 = float32 compactado
+
+    @model_validator(mode="after")
+    def check_input(self):
+        if not self.input or (isinstance(self.input, list) and not all(self.input)):
+            raise ValueError("'input' não pode ser vazio")
+        return self
+
+# 👥 Políticas de roteamento candidatas, avaliadas em sombra no tráfego real
+shadow_router = ShadowRouter(
+    router, config, parse_policies(os.getenv("SHADOW_POLICIES", "")),
+    sample_rate=float(os.getenv("SHADOW_SAMPLE_RATE", "0")),
+    budget_usd=float(os.getenv("SHADOW_BUDGET_USD_PER_DAY", "1")),
+    max_concurrency=int(os.getenv("SHADOW_MAX_CONCURRENCY", "2"))
+)
+
+def reload_catalog():
+    """Catálogo real e catálogos das políticas em sombra"""
+    table = router.reload()
+    shadow_router.reload()
+    return table
+
+# 👀 Recarrega o catálogo automaticamente quando routing.json, .env ou as políticas em sombra mudam
+catalog_watcher = CatalogWatcher(
+    [config.catalog_path, os.path.join(os.getcwd(), ".env"), *shadow_router.paths.values()],
+    on_change=reload_catalog,
+    interval=float(os.getenv("ROUTING_CONFIG_POLL_SECONDS", "2"))
+)
+
+def require_admin(x_admin_token: Optional[str]):
+    """🔐 Endpoints administrativos exigem o cabeçalho X-Admin-Token = ADMIN_TOKEN"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Endpoints administrativos desativados: configure ADMIN_TOKEN")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=401, detail="Token administrativo inválido")
+
+# 🚦 Faixas de prioridade na frente das chamadas aos provedores
+scheduler = PriorityScheduler(
+    capacity=int(os.getenv("SCHEDULER_CAPACITY", "32")),
+    mode=os.getenv("SCHEDULER_MODE", "weighted"),
+    weights=parse_weights(os.getenv("SCHEDULER_WEIGHTS", "interactive=4,bulk=1")),
+    reserved_interactive=float(os.getenv("SCHEDULER_INTERACTIVE_RESERVED", "0.25")),
+    aging_seconds=float(os.getenv("SCHEDULER_AGING_SECONDS", "10"))
+)
+
+def parse_api_key_lanes(spec: str) -> Dict[str, str]:
+    """PRIORITY_API_KEYS='chave1:bulk,chave2:interactive' → {chave: faixa}"""
+    lanes = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, lane = item.rpartition(":")
+        if key and lane in (INTERACTIVE, BULK):
+            lanes[key] = lane
+    return lanes
+
+API_KEY_LANES = parse_api_key_lanes(os.getenv("PRIORITY_API_KEYS", ""))
+
+def resolve_priority(request: ChatRequest, api_key: Optional[str], default: str) -> str:
+    """A faixa da chave de API manda; sem chave mapeada vale o campo `priority`"""
+    if api_key and api_key in API_KEY_LANES:
+        return API_KEY_LANES[api_key]
+    return request.priority or default
+
+# Intervalo para checar se o cliente do /chat fechou a conexão
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+
+def request_timeout(request: Optional[ChatRequest], x_timeout_ms: Optional[str]) -> Optional[float]:
+    """⏳ Prazo em segundos: o menor entre `timeout_ms` e o cabeçalho X-Timeout-Ms"""
+    values = [request.timeout_ms] if request is not None and request.timeout_ms else []
+    if x_timeout_ms:
+        try:
+            values.append(int(x_timeout_ms))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="X-Timeout-Ms deve ser um inteiro em milissegundos")
+        if values[-1] <= 0:
+            raise HTTPException(status_code=400, detail="X-Timeout-Ms deve ser positivo")
+    return min(values) / 1000 if values else None
+
+async def cancel_on_disconnect(http_request: Request, coro):
+    """🔌 Roda `coro` e cancela a chamada ao provedor se o cliente fechar a conexão"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                logger.info("🔌 Cliente desconectou: chamada ao provedor cancelada")
+                # 499 (convenção do nginx): ninguém vai ler esta resposta
+                raise HTTPException(status_code=499, detail="Cliente desconectou")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def record_cancellation(user_id: str, model: str, reason: str, messages, system: Optional[str], sent: bool):
+    """Desperdício estimado: o prompt já enviado ao provedor é cobrado mesmo cancelado"""
+    wasted_tokens = estimate_tokens(conversation_text(messages, system)) if sent else 0
+    wasted_cost = router.calculate_cost(model, wasted_tokens)
+    metrics.record_cancelled(model, reason, wasted_tokens, wasted_cost)
+    metrics.record_request(model, reason)
+    if sent:
+        usage_ledger.record(user_id, model, reason, input_tokens=wasted_tokens, cost=wasted_cost)
+
+async def run_job(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Executa um job da fila com o mesmo pipeline do /chat (faixa bulk por padrão)"""
+    request = ChatRequest.model_validate(body)
+    with config.pin(), deadline_scope(request.timeout_ms / 1000 if request.timeout_ms else None):
+        response = await handle_chat(request, request.priority or BULK)
+    return response.model_dump()
+
+# 📬 Jobs assíncronos para prompts longos (persistidos em SQLite)
+job_queue = JobQueue(
+    handler=run_job,
+    db_path=os.getenv("JOBS_DB_PATH", "" if IS_SERVERLESS else "router_jobs.db") or None,
+    max_queue=int(os.getenv("JOBS_MAX_QUEUE", "100")),
+    workers=int(os.getenv("JOBS_WORKERS", "4"))
+)
+
+# 💰 Livro-razão de uso e custo (SQLite, agregados por minuto/hora/dia)
+usage_ledger = UsageLedger(
+    db_path=os.getenv("USAGE_DB_PATH", "" if IS_SERVERLESS else "router_usage.db") or None,
+    batch_size=int(os.getenv("USAGE_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("USAGE_FLUSH_SECONDS", "1")),
+    minute_retention_days=float(os.getenv("USAGE_MINUTE_RETENTION_DAYS", "7")),
+    max_retries=int(os.getenv("USAGE_MAX_RETRIES", "5"))
+)
+
+# 🩺 Sondas baratas (GET /models) para saber se cada provedor responde
+health_prober = HealthProber(
+    config,
+    client_factory=router.get_client,
+    interval=float(os.getenv("HEALTH_PROBE_INTERVAL_SECONDS", "30")),
+    jitter=float(os.getenv("HEALTH_PROBE_JITTER", "0.2")),
+    timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT_SECONDS", "5")),
+    max_per_minute=int(os.getenv("HEALTH_PROBE_MAX_PER_MINUTE", "12")),
+    # Sem sondas enquanto todas as vagas de chamada estão ocupadas
+    is_busy=lambda: scheduler.in_use >= scheduler.capacity
+)
+router.health_check = health_prober.is_healthy
+
+# ⏲️ Atraso do event loop + pilha de quem bloquear além do limite
+loop_monitor = LoopLagMonitor(
+    interval=float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.25")),
+    stall_threshold=float(os.getenv("LOOP_STALL_THRESHOLD_MS", "250")) / 1000
+)
+_profile_lock = asyncio.Lock()
+
+def header_lane(headers) -> str:
+    """Faixa pela chave de API dos cabeçalhos (X-API-Key ou Authorization: Bearer)"""
+    key = headers.get("x-api-key")
+    authorization = headers.get("authorization")
+    if not key and authorization and authorization[:7].lower() == "bearer ":
+        key = authorization[7:]
+    return API_KEY_LANES.get(key, INTERACTIVE) if key else INTERACTIVE
+
+# 🧯 Controle de admissão: sob sobrecarga degrada para modelos baratos e depois recusa cedo
+admission = AdmissionController(
+    queue_delay=scheduler.queue_delay,
+    loop_lag=lambda: loop_monitor.last_lag,
+    max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256")),
+    degrade_in_flight=int(os.getenv("ADMISSION_DEGRADE_IN_FLIGHT", "0")) or None,
+    degrade_queue=float(os.getenv("ADMISSION_DEGRADE_QUEUE_MS", "500")) / 1000,
+    shed_queue=float(os.getenv("ADMISSION_SHED_QUEUE_MS", "2000")) / 1000,
+    degrade_lag=float(os.getenv("ADMISSION_DEGRADE_LAG_MS", "100")) / 1000,
+    shed_lag=float(os.getenv("ADMISSION_SHED_LAG_MS", "500")) / 1000
+)
+if os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes", "on"):
+    router.degrade_check = lambda: admission.degraded
+    # Adicionado por último = mais externo: recusa antes de qualquer parse ou compressão
+    app.add_middleware(
+        AdmissionMiddleware, controller=admission, lane_of=header_lane,
+        paths=[path.strip() for path in os.getenv("ADMISSION_PATHS", "/chat,/v1/chat/completions,/embeddings").split(",")]
+    )
+
+# 🗄️ Cache de respostas (hoje: embeddings por modelo + texto)
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+)
+
+# 🧬 Embeddings em micro-lotes: pedidos simultâneos viram uma chamada só
+embedding_batcher = EmbeddingBatcher(
+    router,
+    cache=response_cache,
+    window=float(os.getenv("EMBEDDINGS_BATCH_WINDOW_MS", "5")) / 1000,
+    max_items=int(os.getenv("EMBEDDINGS_BATCH_MAX", "256"))
+)
+
+# 🌙 Modo offline: JSONL de chats pelas Batch APIs (preço com desconto)
+batch_runner = BatchRunner(
+    router,
+    run_direct=run_job,
+    db_path=os.getenv("BATCH_DB_PATH", "" if IS_SERVERLESS else "router_batches.db") or None,
+    poll_interval=float(os.getenv("BATCH_POLL_SECONDS", "30")),
+    # Ex.: http://localhost:9100/v1 para o stub_batch_server.py
+    base_urls={"openai": os.getenv("OPENAI_BATCH_BASE_URL"),
+               "anthropic": os.getenv("ANTHROPIC_BATCH_BASE_URL")},
+    ledger=usage_ledger
+)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50000"))
+
+@app.on_event("startup")
+async def startup():
+    """Inicia as tarefas de fundo"""
+    for model, model_config in config.models.items():
+        metrics.set_model_availability(model, config.is_provider_available(model_config["provider"]))
+    if not IS_SERVERLESS:
+        catalog_watcher.start()
+        loop_monitor.start()
+        health_prober.start()
+    await usage_ledger.start()
+    await job_queue.start()
+    await batch_runner.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Fecha o pool de conexões com os provedores"""
+    await job_queue.stop()
+    await batch_runner.stop()
+    await shadow_router.drain()
+    await usage_ledger.stop()
+    await health_prober.stop()
+    await loop_monitor.stop()
+    await catalog_watcher.stop()
+    await router.aclose()
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     available_models_config = config.get_available_models()
     configured_count = len(available_models_config)
     
-    return templates.TemplateResponse("home.html", {
+    return get_templates().TemplateResponse("home.html", {
         "request": request,
         "message": "🚀 RouterLLM está rodando!",
         "version": "1.0.0",
@@ -116,10 +434,10 @@ async def get_api_status():
     """Verifica o status das chaves de API configuradas usando a configuração flexível"""
     
     # Usar a configuração flexível para detectar providers
-    all_providers = ["openai", "anthropic", "google"]
+    all_providers = config.table.providers
     api_status = {}
     
-    for provider in all_providers:
+    for provider, provider_config in all_providers.items():
         # Obter modelos deste provider
         provider_models = [model for model, config_data in config.models.items() 
                           if config_data["provider"] == provider]
@@ -127,7 +445,9 @@ async def get_api_status():
         api_status[provider] = {
             "configured": config.is_provider_available(provider),
             "models": provider_models,
-            "env_var": f"{provider.upper()}_API_KEY"
+            "env_var": provider_config.get("env_key"),
+            # 🩺 Resultado das sondas: responde? com que latência?
+            "health": health_prober.status(provider) if config.is_provider_available(provider) else None
         }
     
     configured_providers = config.available_providers
@@ -143,81 +463,729 @@ async def get_api_status():
     }
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, x_api_key: Optional[str] = Header(None),
+               x_timeout_ms: Optional[str] = Header(None)):
     """Endpoint principal para chat com roteamento inteligente"""
-    start_time = time.time()
+    lane = resolve_priority(request, x_api_key, INTERACTIVE)
+    # A requisição inteira usa a mesma tabela de roteamento, mesmo se houver reload,
+    # e o mesmo prazo (fila de prioridade + chamada ao provedor)
+    with config.pin(), deadline_scope(request_timeout(request, x_timeout_ms)), \
+            profiling.profile_request() as phases:
+        response = await cancel_on_disconnect(http_request, handle_chat(request, lane))
+        # Já validado pelo ChatResponse: serializa direto, sem passar pelo jsonable_encoder
+        with profiling.span("serialize"):
+            http_response = FastJSONResponse(response.model_dump())
+    if phases is not None:
+        # ⏱️ Fases da requisição visíveis no DevTools do navegador
+        http_response.headers["Server-Timing"] = profiling.server_timing(phases)
+    return http_response
+
+async def handle_chat(request: ChatRequest, lane: str = INTERACTIVE) -> ChatResponse:
+    """Roteia, chama o modelo e registra métricas de uma requisição de chat"""
+    if request.session_id:
+        session = await session_store.get_or_create(request.session_id, request.user_id)
+        if session.user_id != request.user_id:
+            raise HTTPException(status_code=403, detail="Sessão pertence a outro usuário")
+        # Turnos da mesma sessão são processados em ordem
+        async with session.lock:
+            return await run_chat(request, session, lane)
+    return await run_chat(request, lane=lane)
+
+async def run_chat(request: ChatRequest, session: Optional[Session] = None,
+                   lane: str = INTERACTIVE) -> ChatResponse:
+    start_time = time.monotonic()
 
     try:
-        # Escolher o modelo baseado na entrada
-        if request.force_model:
-            selected_model = request.force_model
-            reasoning = f"Modelo forçado pelo usuário: {request.force_model}"
-        else:
-            selected_model, reasoning = router.route_request(
-                message=request.message,
-                user_id=request.user_id
-            )
+        with profiling.span("routing"):
+            new_turns = normalize_messages(request.message, request.messages)
+            routing_text = last_user_text(new_turns)
+            system = request.system
+            if session is not None:
+                # Histórico do servidor + turnos novos, compactado para o orçamento de tokens
+                system = system or session.system
+                history, summary = compact_history(
+                    session.messages + new_turns, session.summary,
+                    config.table.settings.get("session_history_budget_tokens", 6000)
+                )
+                conversation = with_summary(history, summary)
+            else:
+                conversation = new_turns
+            # Template do prompt (system + trechos marcados) para preferir um cache quente
+            cache_key = prefix_key(system, conversation,
+                                   config.table.settings.get("prompt_cache_min_tokens", 1024))
 
-        # Fazer a chamada para o modelo escolhido
-        response_text, tokens_used = await router.call_model(
-            model=selected_model,
-            message=request.message,
-            max_tokens=request.max_tokens,
-            temperature=request.temperature
-        )
+            # Escolher o modelo baseado na entrada
+            cascade_plan = None
+            categorized = None  # categorize() roda uma vez só por pedido
+            routed = False  # decisão do roteador (não forçada nem fixada pela sessão): vale a sombra
+            if request.force_model:
+                selected_model = request.force_model
+                reasoning = f"Modelo forçado pelo usuário: {request.force_model}"
+            elif session is not None and session.model in config.get_available_models():
+                # Sessão fica no mesmo modelo para aproveitar o cache de prompt do provedor
+                selected_model = session.model
+                reasoning = f"📌 Sessão fixa em {session.model} (cache do provedor)"
+            else:
+                categorized = router.categorize(routing_text)
+                selected_model, reasoning = router.route_request(
+                    message=routing_text,
+                    user_id=request.user_id,
+                    prefix_key=cache_key,
+                    categorized=categorized
+                )
+                routed = True
+                # 🪜 Cascata: tenta antes o modelo mais barato da categoria
+                cascade_plan = router.plan_cascade(routing_text, selected_model, categorized)
+            # 📐 Categoria que guarda o tamanho das respostas (para o max_tokens previsto)
+            output_category = None
+            if router.output_budget is not None:
+                output_category = (categorized or router.categorize(routing_text))[0] or "default"
+
+        # Fazer a chamada para o modelo escolhido (esperando vaga na faixa de prioridade)
+        sent = False
+        try:
+            async with scheduler.slot(lane):
+                sent = True
+                call_kwargs = dict(
+                    messages=conversation,
+                    system=system,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature
+                )
+                if cascade_plan is not None:
+                    cheap_model, category = cascade_plan
+                    attempts = await router.call_with_cascade(cheap_model, selected_model, category, **call_kwargs)
+                else:
+                    attempts = [Attempt(selected_model, await router.call_model(
+                        model=selected_model, category=output_category, **call_kwargs))]
+        except DeadlineExceeded:
+            record_cancellation(request.user_id, selected_model, "deadline", conversation, system, sent)
+            raise
+        except asyncio.CancelledError:
+            record_cancellation(request.user_id, selected_model, "cancelled", conversation, system, sent)
+            raise
+        premium_model = selected_model
+        selected_model, result = attempts[-1].model, attempts[-1].result
+        if cascade_plan is not None:
+            first = attempts[0]
+            if first.failure is None:
+                reasoning = f"🪜 Cascata ({category}): {first.model} aprovado, sem escalar para {premium_model}"
+            else:
+                reasoning = f"{reasoning} · 🪜 cascata: {first.model} reprovado ({first.failure})"
+            metrics.record_cascade(category, first.failure or "accepted",
+                                   first.latency if first.failure else None)
+        if not result.error:
+            router.prefix_cache.mark(cache_key, selected_model)
+            if session is not None:
+                session.messages = history + [{"role": "assistant", "content": [text_part(result.text)]}]
+                session.summary = summary
+                session.system = system
+                session.model = selected_model
+                session.updated_at = time.time()
 
-        # Calcular métricas
-        response_time = time.time() - start_time
-        cost_estimate = router.calculate_cost(selected_model, tokens_used)
+        # Calcular métricas (a cascata cobra as duas tentativas)
+        response_time = time.monotonic() - start_time
+        cost_estimate = sum(router.result_cost(a.model, a.result) for a in attempts)
+        tokens_used = sum(a.result.tokens_used for a in attempts)
 
-        # Registrar métricas
-        metrics.record_request(selected_model, "success")
-        metrics.record_tokens(selected_model, len(request.message.split()), len(response_text.split()))
-        metrics.record_cost(selected_model, cost_estimate)
-        metrics.record_duration(selected_model, response_time)
-        metrics.record_response_time(selected_model, response_time)
-        metrics.record_routing_decision(reasoning, selected_model)
+        # Registrar métricas de cada tentativa
+        with profiling.span("metrics"):
+            for attempt in attempts:
+                attempt_result = attempt.result
+                attempt_cost = router.result_cost(attempt.model, attempt_result)
+                status = "success" if attempt.failure is None else "escalated"
+                metrics.record_request(attempt.model, status)
+                metrics.record_tokens(attempt.model, attempt_result.input_tokens, attempt_result.output_tokens)
+                metrics.record_cache_tokens(attempt.model, attempt_result.cached_tokens, attempt_result.cache_write_tokens)
+                metrics.record_cost(attempt.model, attempt_cost)
+                # 💰 Livro-razão persistente (gravação em lote, fora do caminho da resposta)
+                usage_ledger.record(
+                    request.user_id, attempt.model, status,
+                    input_tokens=attempt_result.input_tokens,
+                    output_tokens=attempt_result.output_tokens,
+                    cached_tokens=attempt_result.cached_tokens,
+                    cost=attempt_cost
+                )
+            metrics.record_duration(selected_model, response_time)
+            metrics.record_response_time(selected_model, response_time)
+            metrics.record_routing_decision(reasoning, selected_model)
+
+        # 👥 Políticas em sombra decidem em segundo plano, com a resposta já pronta
+        if routed and not result.error and shadow_router.enabled:
+            shadow_router.submit(routing_text, cache_key, premium_model, cost_estimate, result.tokens_used,
+                                 response_time, conversation, system, request.max_tokens or 1000,
+                                 request.temperature)
 
         # Log da transação
-        logger.info(f"✅ Request completed | User: {request.user_id} | Model: {selected_model} | Tokens: {tokens_used} | Cost: ${cost_estimate:.4f} | Time: {response_time:.2f}s")
+        logger.info(f"✅ Request completed | User: {request.user_id} | Model: {selected_model} | Tokens: {tokens_used} (cache: {result.cached_tokens}) | Cost: ${cost_estimate:.4f} | Time: {response_time:.2f}s")
 
         return ChatResponse(
-            response=response_text,
+            response=result.text,
             model_used=selected_model,
             reasoning=reasoning,
             cost_estimate=cost_estimate,
             response_time=response_time,
-            tokens_used=tokens_used
+            tokens_used=tokens_used,
+            cached_tokens=result.cached_tokens,
+            session_id=session.session_id if session is not None else None,
+            attempts=[
+                {
+                    "model": a.model,
+                    "tokens_used": a.result.tokens_used,
+                    "cost_estimate": router.result_cost(a.model, a.result),
+                    "latency": a.latency,
+                    "failure": a.failure
+                }
+                for a in attempts
+            ] if cascade_plan is not None else None
         )
 
+    except HTTPException:
+        raise
+
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Prazo da requisição esgotado antes da resposta do modelo")
+
     except Exception as e:
         logger.error(f"Erro no chat: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.post("/jobs", status_code=202)
+async def create_job(request: ChatRequest, x_api_key: Optional[str] = Header(None)):
+    """📬 Enfileira um chat longo e devolve o ID do job na hora"""
+    request.priority = resolve_priority(request, x_api_key, BULK)
+    try:
+        job = await job_queue.submit(request.model_dump(exclude_none=True))
+    except QueueFullError as e:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"{e}. Tente novamente em instantes."},
+            headers={"Retry-After": "5"}
+        )
+    except JobStoreError as e:
+        return JSONResponse(status_code=503, content={"detail": f"{e}. Tente novamente em instantes."},
+                            headers={"Retry-After": "5"})
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "queue_depth": job_queue.queue_depth()
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0.0):
+    """
+    Estado de um job. Com ?wait=N (até 60 s) a resposta só volta quando
+    o job terminar ou o tempo acabar (long-poll, sem webhooks)
+    """
+    job = await job_queue.get(job_id, wait=min(max(wait, 0.0), 60.0))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+
+@app.post("/batches", status_code=202)
+async def create_batch(http_request: Request):
+    """
+    🌙 Lote offline: corpo em JSONL, um ChatRequest por linha
+    Cada item é roteado como no /chat e vai para a Batch API do provedor
+    """
+    items = []
+    for number, line in enumerate((await http_request.body()).splitlines(), start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(ChatRequest.model_validate_json(line).model_dump(exclude_none=True))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Linha {number} inválida: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="Envie ao menos um item (JSONL)")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo de {BATCH_MAX_ITEMS} itens por lote")
+    with config.pin():
+        batch = await batch_runner.submit(items)
+    return {**batch_runner.summary(batch), "status_url": f"/batches/{batch['id']}",
+            "output_url": f"/batches/{batch['id']}/output"}
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Andamento do lote (por submissão a cada provedor)"""
+    batch = await batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    return batch_runner.summary(batch)
+
+@app.get("/batches/{batch_id}/output")
+async def get_batch_output(batch_id: str):
+    """Resultados em JSONL, na ordem da entrada (só quando o lote termina)"""
+    batch = await batch_runner.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    if batch["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Lote ainda em andamento ({batch['status']})")
+    return Response(content=batch_runner.output_jsonl(batch), media_type="application/x-ndjson")
+
+@app.post("/embeddings")
+async def create_embeddings(request: EmbeddingRequest):
+    """
+    🧬 Embeddings (formato da OpenAI) roteados pelo catálogo
+    Textos de requisições simultâneas sobem juntos num lote ao provedor
+    """
+    texts = [request.input] if isinstance(request.input, str) else request.input
+    with config.pin():
+        try:
+            model = embedding_batcher.select_model(request.model)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            result = await embedding_batcher.embed(model, texts)
+        except Exception as e:
+            metrics.record_request(model, "error")
+            raise HTTPException(status_code=502, detail=f"Falha ao gerar embeddings: {e}")
+        cost = embedding_batcher.cost(model, result.input_tokens)
+    metrics.record_request(model, "success")
+    if usage_ledger.enabled:
+        usage_ledger.record(request.user_id, model, "success", input_tokens=result.input_tokens, cost=cost)
+    return FastJSONResponse({
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": encode_vector(vector, request.encoding_format)}
+            for i, vector in enumerate(result.vectors)
+        ],
+        "model": model,
+        "usage": {"prompt_tokens": result.input_tokens, "total_tokens": result.input_tokens},
+        "cached": result.cached,
+        "cost_estimate": cost
+    })
+
+# 🔌 Fachada compatível com a API da OpenAI (SDKs oficiais com base_url=.../v1)
+# Cabeçalhos da resposta do provedor que seguem para o cliente no repasse direto
+PASSTHROUGH_HEADERS = ("content-type", "content-length", "x-request-id", "openai-processing-ms")
+# No streaming repassado, só o fim é guardado (é onde vem o uso, se o cliente pediu)
+STREAM_TAIL_BYTES = 4096
+# URL do /chat/completions de cada endpoint já parseada (o parse do httpx pesa no overhead)
+_completions_urls: Dict[str, Any] = {}
+
+def openai_error(status_code: int, message: str, error_type: str = "invalid_request_error",
+                 code: Optional[str] = None) -> JSONResponse:
+    return FastJSONResponse(error_body(message, error_type, code), status_code=status_code)
+
+def resolve_compat_model(body: Dict[str, Any], user_id: str) -> tuple:
+    """`model`: "auto" (roteador decide), nome do catálogo ou nome do provedor (api_model)"""
+    requested = body.get("model") or "auto"
+    available = config.get_available_models()
+    if requested == "auto":
+        messages = body.get("messages") or []
+        last_user = next((m.get("content") for m in reversed(messages) if m.get("role") == "user"), "")
+        if isinstance(last_user, list):
+            last_user = "\n".join(part.get("text", "") for part in last_user if part.get("type") == "text")
+        return router.route_request(message=last_user or "", user_id=user_id)
+    if requested in available:
+        return requested, f"Modelo pedido pelo cliente: {requested}"
+    for name, model_config in available.items():
+        if model_config["api_model"] == requested:
+            return name, f"Modelo pedido pelo cliente: {requested}"
+    raise CompatError(f"Modelo '{requested}' não existe ou não tem chave configurada", 404, "model_not_found")
+
+def record_compat_usage(user_id: str, model: str, reasoning: str, result: ModelResult, started: float):
+    """Métricas e livro-razão de uma chamada do /v1 (o repasse direto não passa pelo call_model)"""
+    cost = router.result_cost(model, result)
+    elapsed = time.monotonic() - started
+    metrics.record_request(model, "success")
+    metrics.record_tokens(model, result.input_tokens, result.output_tokens)
+    metrics.record_cache_tokens(model, result.cached_tokens, result.cache_write_tokens)
+    metrics.record_cost(model, cost)
+    metrics.record_duration(model, elapsed)
+    metrics.record_response_time(model, elapsed)
+    metrics.record_routing_decision(reasoning, model)
+    if usage_ledger.enabled:
+        usage_ledger.record(user_id, model, "success", input_tokens=result.input_tokens,
+                            output_tokens=result.output_tokens, cached_tokens=result.cached_tokens, cost=cost)
+
+async def proxy_openai(model: str, payload: bytes, tokens: int, stream: bool, lane: str,
+                       user_id: str, reasoning: str, started: float):
+    """
+    Repasse direto: os bytes do pedido e da resposta não passam por parse
+    Rende (status, cabeçalhos) e depois os trechos do corpo como chegaram do provedor
+    """
+    def build(endpoint, key):
+        url = _completions_urls.get(endpoint["base_url"])
+        if url is None:
+            import httpx
+            url = _completions_urls[endpoint["base_url"]] = httpx.URL(f"{endpoint['base_url']}/chat/completions")
+        return router.get_client().build_request(
+            "POST", url, content=payload,
+            # identity: os bytes chegam prontos para repassar (o middleware comprime se preciso)
+            headers={**bearer_headers(key), "Content-Type": "application/json", "Accept-Encoding": "identity"}
+        )
+
+    async with scheduler.slot(lane):
+        async with router.open_upstream(model, tokens, build) as (response, lease):
+            upstream_headers = header_dict(response.headers)
+            headers = {name: upstream_headers[name] for name in PASSTHROUGH_HEADERS if name in upstream_headers}
+            if "content-encoding" in upstream_headers:
+                # Provedor comprimiu mesmo assim: o httpx descomprime, o tamanho muda
+                headers.pop("content-length", None)
+            yield response.status_code, headers
+            parts, tail, events = [], b"", 0
+            # Com identity o decodificador do httpx devolve os mesmos bytes, sem cópia
+            async for chunk in response.aiter_bytes():
+                yield chunk
+                if stream:
+                    tail = (tail + chunk)[-STREAM_TAIL_BYTES:]
+                    events += chunk.count(b"data: ")
+                else:
+                    parts.append(chunk)
+            if response.status_code != 200:
+                metrics.record_request(model, "error")
+                metrics.record_api_error(config.models[model]["provider"], f"http_{response.status_code}")
+                return
+            # Uso lido depois que o último byte já foi para o cliente
+            usage = stream_usage(tail) if stream else None
+            if stream and usage is None:
+                # Cliente não pediu include_usage: ~1 token por evento (menos o papel e o [DONE])
+                result = ModelResult(text="", tokens_used=0, input_tokens=len(payload) // 4,
+                                     output_tokens=max(events - 2, 0))
+                result.tokens_used = result.input_tokens + result.output_tokens
+            elif stream:
+                result = router.parse_openai({"choices": [{"message": {"content": ""}}], "usage": usage})
+            else:
+                try:
+                    result = router.parse_openai(jsoncodec.loads(b"".join(parts)))
+                except (ValueError, KeyError, IndexError, TypeError):
+                    result = ModelResult(text="", tokens_used=0)
+            lease.tokens = result.tokens_used
+    router.count_call(model)
+    record_compat_usage(user_id, model, reasoning, result, started)
+
+async def translate_call(model: str, messages, system: Optional[str], body: Dict[str, Any], lane: str,
+                         user_id: str) -> ModelResult:
+    """Chamada traduzida sem streaming (prazo e desconexão cancelam, como no /chat)"""
+    sent = False
+    try:
+        async with scheduler.slot(lane):
+            sent = True
+            return await router.call_model(
+                model, messages=messages, system=system,
+                max_tokens=body.get("max_tokens") or body.get("max_completion_tokens") or 1000,
+                temperature=body.get("temperature", 0.7)
+            )
+    except DeadlineExceeded:
+        record_cancellation(user_id, model, "deadline", messages, system, sent)
+        raise
+    except asyncio.CancelledError:
+        record_cancellation(user_id, model, "cancelled", messages, system, sent)
+        raise
+
+async def translate_stream(model: str, messages, system: Optional[str], body: Dict[str, Any], lane: str,
+                           user_id: str, reasoning: str, started: float):
+    """Streaming de Anthropic/Google traduzido para chunks chat.completion.chunk"""
+    chunk_id, created = completion_id(), int(time.time())
+    async with scheduler.slot(lane):
+        deltas = router.stream_model(model, messages, system, body.get("max_tokens") or body.get("max_completion_tokens")
+                                     or 1000, body.get("temperature", 0.7))
+        try:
+            # O primeiro trecho chega antes do 200: erro do provedor ainda vira 502
+            item = await deltas.__anext__()
+            yield 200, {"content-type": "text/event-stream", "cache-control": "no-cache"}
+            yield chunk_event(chunk_id, created, model, {"role": "assistant", "content": ""})
+            while not isinstance(item, ModelResult):
+                yield chunk_event(chunk_id, created, model, {"content": item})
+                item = await deltas.__anext__()
+        finally:
+            await deltas.aclose()
+    result = item
+    finish_reason = FINISH_REASONS.get(result.finish_reason, result.finish_reason or "stop")
+    yield chunk_event(chunk_id, created, model, {}, finish_reason)
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield chunk_event(chunk_id, created, model, {}, usage=usage_body(result))
+    yield SSE_DONE
+    record_compat_usage(user_id, model, reasoning, result, started)
+
+async def scoped_stream(chunks, model: str, table, deadline: Optional[float]):
+    """
+    Itera a resposta do /v1 com o catálogo fixado e o prazo da requisição
+    O StreamingResponse roda o gerador depois que o handler saiu do `with
+    config.pin(), deadline_scope(...)`: cada passo reentra nos dois
+    """
+    started = False
+    try:
+        while True:
+            with config.pin(table), deadline_at(deadline):
+                try:
+                    chunk = await within_deadline(chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+                except DeadlineExceeded:
+                    if not started:
+                        raise
+                    # Cabeçalhos já foram: só resta encerrar o stream
+                    logger.warning(f"⏳ Prazo esgotado no meio do stream de {model}")
+                    metrics.record_request(model, "deadline")
+                    return
+            started = True
+            yield chunk
+    finally:
+        with config.pin(table):
+            await chunks.aclose()
+
+async def read_proxied(chunks) -> tuple:
+    """Repasse sem streaming: (status, cabeçalhos, corpo), com os trechos juntados sem parse"""
+    status_code, headers = await chunks.__anext__()
+    return status_code, headers, b"".join([chunk async for chunk in chunks])
+
+@app.get("/v1/models")
+async def list_models_v1():
+    """🔌 Modelos no formato da OpenAI ("auto" = o roteador escolhe)"""
+    created = int(config.table.loaded_at)
+    data = [{"id": "auto", "object": "model", "created": created, "owned_by": "routerllm"}]
+    data.extend({"id": name, "object": "model", "created": created, "owned_by": model_config["provider"]}
+                for name, model_config in config.get_available_models().items())
+    return {"object": "list", "data": data}
+
+@app.post("/v1/chat/completions")
+async def openai_chat_completions(http_request: Request):
+    """
+    🔌 /chat/completions da OpenAI na frente do roteador
+    Provedor compatível: pedido e resposta repassados byte a byte (só o "model" é trocado);
+    demais provedores: formato traduzido, com streaming
+    """
+    started = time.monotonic()
+    raw = await http_request.body()
+    try:
+        body = jsoncodec.loads(raw)
+    except ValueError:
+        return openai_error(400, "Corpo não é um JSON válido")
+    if not isinstance(body, dict) or not isinstance(body.get("messages"), list) or not body["messages"]:
+        return openai_error(400, "'messages' é obrigatório")
+    authorization = http_request.headers.get("authorization")
+    bearer = authorization[7:] if authorization and authorization[:7].lower() == "bearer " else None
+    lane = API_KEY_LANES.get(bearer, INTERACTIVE) if bearer else INTERACTIVE
+    user_id = body.get("user") or "anonymous"
+    stream = bool(body.get("stream"))
+    try:
+        timeout = request_timeout(None, http_request.headers.get("x-timeout-ms"))
+    except HTTPException as e:
+        return openai_error(400, e.detail)
+
+    # Mesmo prazo do /chat (fila + provedor) para todo o pedido
+    with config.pin(), deadline_scope(timeout):
+        try:
+            model, reasoning = resolve_compat_model(body, user_id)
+            if model == "error":
+                return openai_error(503, reasoning, "api_error", "no_model_available")
+            if router.is_openai_compatible(model):
+                requested, api_model = body.get("model"), config.models[model]["api_model"]
+                payload = raw
+                if requested != api_model:
+                    payload = replace_model(raw, requested, api_model) or jsoncodec.dumps({**body, "model": api_model})
+                tokens = len(raw) // 4 + (body.get("max_tokens") or body.get("max_completion_tokens") or 0)
+                chunks = proxy_openai(model, payload, tokens, stream, lane, user_id, reasoning, started)
+                if not stream:
+                    # Corpo pequeno: lido inteiro aqui dentro (prazo e desconexão valem até o último byte)
+                    try:
+                        status_code, headers, content = await cancel_on_disconnect(
+                            http_request, within_deadline(read_proxied(chunks)))
+                    except DeadlineExceeded:
+                        return openai_error(504, "Prazo da requisição esgotado", "api_error")
+                    except HTTPException:
+                        raise
+                    except Exception as e:
+                        logger.error(f"Erro no /v1/chat/completions ({model}): {e}")
+                        metrics.record_request(model, "error")
+                        return openai_error(502, f"Erro do provedor: {e}", "api_error")
+                    headers["X-RouterLLM-Model"] = model
+                    return Response(content=content, status_code=status_code, headers=headers)
+            else:
+                messages, system = to_internal(body)
+                if not stream:
+                    try:
+                        result = await cancel_on_disconnect(http_request, translate_call(
+                            model, messages, system, body, lane, user_id))
+                    except DeadlineExceeded:
+                        return openai_error(504, "Prazo da requisição esgotado", "api_error")
+                    if result.error:
+                        metrics.record_request(model, "error")
+                        return openai_error(502, f"Erro do provedor: {result.error}", "api_error")
+                    record_compat_usage(user_id, model, reasoning, result, started)
+                    response = FastJSONResponse(completion_body(model, result))
+                    response.headers["X-RouterLLM-Model"] = model
+                    return response
+                chunks = translate_stream(model, messages, system, body, lane, user_id, reasoning, started)
+        except CompatError as e:
+            return openai_error(e.status_code, str(e), code=e.code)
+
+        # O corpo do stream roda fora deste bloco: leva junto o catálogo fixado e o prazo
+        chunks = scoped_stream(chunks, model, config.table, current_deadline())
+        try:
+            status_code, headers = await chunks.__anext__()
+        except DeadlineExceeded:
+            return openai_error(504, "Prazo da requisição esgotado", "api_error")
+        except Exception as e:
+            logger.error(f"Erro no /v1/chat/completions ({model}): {e}")
+            metrics.record_request(model, "error")
+            return openai_error(502, f"Erro do provedor: {e}", "api_error")
+    headers["X-RouterLLM-Model"] = model
+    return StreamingResponse(chunks, status_code=status_code, headers=headers)
+
+@app.post("/admin/reload")
+async def admin_reload(x_admin_token: Optional[str] = Header(None)):
+    """🔄 Recarrega catálogo e chaves de API sem reiniciar o processo"""
+    require_admin(x_admin_token)
+    try:
+        table = reload_catalog()
+    except CatalogError as e:
+        raise HTTPException(status_code=422, detail=f"Catálogo inválido, tabela anterior mantida: {e}")
+    except Exception as e:
+        logger.exception("❌ Falha ao recarregar o catálogo")
+        raise HTTPException(status_code=500, detail=f"Falha ao recarregar: {e}")
+    return {
+        "success": True,
+        "version": table.version,
+        "models": list(table.models.keys()),
+        "available_providers": list(table.available_providers),
+        "default_model": table.default_model
+    }
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 10.0, interval_ms: float = 5.0,
+                        x_admin_token: Optional[str] = Header(None)):
+    """
+    🔬 Profiler por amostragem do event loop por N segundos (até 60)
+    Devolve pilhas "collapsed" para flamegraph.pl / speedscope
+    """
+    require_admin(x_admin_token)
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Já existe um perfil em andamento")
+    seconds = min(max(seconds, 0.1), 60.0)
+    interval = min(max(interval_ms, 1.0), 100.0) / 1000
+    async with _profile_lock:
+        # A amostragem roda em outra thread e observa a thread do loop
+        counts = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds, interval)
+    filename = f"routerllm-{datetime.now():%Y%m%d-%H%M%S}.folded"
+    return Response(
+        content=collapsed(counts),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def parse_time(value: Optional[str], default: float) -> float:
+    """Epoch em segundos ou data ISO ('2024-05-01', '2024-05-01T12:00'); sem fuso = UTC"""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Data inválida: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+@app.get("/usage")
+async def get_usage(start: Optional[str] = None, end: Optional[str] = None,
+                    user_id: Optional[str] = None, model: Optional[str] = None,
+                    granularity: Optional[Literal["minute", "hour", "day"]] = None,
+                    group_by: str = "user_id,model",
+                    x_admin_token: Optional[str] = Header(None)):
+    """
+    💰 Gasto e tokens por período, usuário e modelo (só admin)
+    Padrão: últimas 24 h; a granularidade sai do tamanho do intervalo
+    """
+    require_admin(x_admin_token)
+    if not usage_ledger.enabled:
+        raise HTTPException(status_code=503, detail="Livro-razão desativado: configure USAGE_DB_PATH")
+    now = time.time()
+    end_ts = parse_time(end, now)
+    start_ts = parse_time(start, end_ts - 86400)
+    if start_ts >= end_ts:
+        raise HTTPException(status_code=400, detail="'start' deve ser anterior a 'end'")
+    if granularity is None:
+        span = end_ts - start_ts
+        granularity = "minute" if span <= 6 * 3600 else "hour" if span <= 14 * 86400 else "day"
+    groups = [g.strip() for g in group_by.split(",") if g.strip()]
+    unknown = [g for g in groups if g not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"group_by aceita {', '.join(GROUP_COLUMNS)}")
+
+    rows = await usage_ledger.query(granularity, start_ts, end_ts, user_id, model, groups)
+    totals = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "cost": 0.0}
+    for row in rows:
+        for key in totals:
+            totals[key] += row[key]
+        row["bucket"] = datetime.fromtimestamp(row["bucket"], timezone.utc).isoformat()
+    return {
+        "start": datetime.fromtimestamp(start_ts, timezone.utc).isoformat(),
+        "end": datetime.fromtimestamp(end_ts, timezone.utc).isoformat(),
+        "granularity": granularity,
+        "bucket_seconds": GRANULARITIES[granularity],
+        "totals": totals,
+        "rows": rows
+    }
+
 @app.get("/stats")
 async def get_stats():
     """Estatísticas de uso do roteador"""
-    return router.get_stats()
+    return {**router.get_stats(), "sessions": session_store.stats(), "jobs": job_queue.stats(),
+            "scheduler": scheduler.stats(), "event_loop": loop_monitor.stats(),
+            "usage_ledger": usage_ledger.stats(), "embeddings": embedding_batcher.stats(),
+            "batches": batch_runner.stats(),
+            "api_keys": router.key_pools.stats(config.get_key_pools()),
+            "throttle": router.throttle.stats(config.get_key_pools()),
+            "endpoints": router.endpoints.stats(config.model_endpoints),
+            "shadow": shadow_router.stats() if shadow_router.enabled else None,
+            "admission": admission.stats() if router.degrade_check is not None else None}
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, user_id: str = "anonymous"):
+    """Histórico guardado de uma sessão"""
+    session = await session_store.get(session_id)
+    if session is None or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    data = session.to_dict()
+    data["turns"] = len(session.messages)
+    return data
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, user_id: str = "anonymous"):
+    """Apaga uma sessão (memória e disco)"""
+    session = await session_store.get(session_id)
+    if session is None or session.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Sessão não encontrada")
+    await session_store.delete(session_id)
+    return {"success": True}
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Página inicial com chat integrado"""
-    return templates.TemplateResponse("home.html", {"request": request})
+    return get_templates().TemplateResponse("home.html", {"request": request})
 
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request):
     """Dashboard web do RouterLLM"""
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    return get_templates().TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/metrics")
 async def get_metrics():
     """Endpoint de métricas para Prometheus"""
-    return Response(metrics.get_metrics(), media_type=CONTENT_TYPE_LATEST)
+    if router.degrade_check is not None:
+        admission.export()
+    return Response(metrics.get_metrics(), media_type=metrics.content_type)
 
 @app.get("/api-config", response_class=HTMLResponse)
 async def api_config(request: Request):
     """Tela de configuração de APIs"""
-    return templates.TemplateResponse("api_config.html", {"request": request})
+    return get_templates().TemplateResponse("api_config.html", {"request": request})
 
 @app.get("/api-config/status")
 async def get_api_status_config():
@@ -229,15 +1197,18 @@ async def get_api_status_config():
     return {
         "openai": {
             "available": bool(openai_key and openai_key.strip() and not openai_key.startswith('sk-...')),
-            "key": openai_key[:10] + "..." + openai_key[-4:] if openai_key else None
+            "key": mask_key(openai_key),
+            "pool_size": len(config.get_api_keys("openai"))
         },
         "anthropic": {
             "available": bool(anthropic_key and anthropic_key.strip() and not anthropic_key.startswith('sk-ant-...')),
-            "key": anthropic_key[:10] + "..." + anthropic_key[-4:] if anthropic_key else None
+            "key": mask_key(anthropic_key),
+            "pool_size": len(config.get_api_keys("anthropic"))
         },
         "google": {
             "available": bool(google_key and google_key.strip() and google_key != '...'),
-            "key": google_key[:10] + "..." + google_key[-4:] if google_key else None
+            "key": mask_key(google_key),
+            "pool_size": len(config.get_api_keys("google"))
         }
     }
 
@@ -250,49 +1221,17 @@ async def test_api_key(request: dict):
     if not provider or not api_key:
         return {"success": False, "error": "Provider e API key são obrigatórios"}
     
-    try:
-        if provider == "openai":
-            # Teste simples da OpenAI
-            headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
-            payload = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "test"}], "max_tokens": 5}
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                return {"success": True, "message": "Chave OpenAI válida"}
-            else:
-                return {"success": False, "error": f"Erro OpenAI: {response.status_code}"}
-                
-        elif provider == "anthropic":
-            # Teste simples da Anthropic
-            headers = {"x-api-key": api_key, "Content-Type": "application/json", "anthropic-version": "2023-06-01"}
-            payload = {"model": "claude-3-haiku-20240307", "max_tokens": 5, "messages": [{"role": "user", "content": "test"}]}
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post("https://api.anthropic.com/v1/messages", headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                return {"success": True, "message": "Chave Anthropic válida"}
-            else:
-                return {"success": False, "error": f"Erro Anthropic: {response.status_code}"}
-                
-        elif provider == "google":
-            # Teste simples do Google
-            payload = {"contents": [{"parts": [{"text": "test"}]}], "generationConfig": {"maxOutputTokens": 5}}
-            
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-pro:generateContent?key={api_key}", json=payload)
-            
-            if response.status_code == 200:
-                return {"success": True, "message": "Chave Google válida"}
-            else:
-                return {"success": False, "error": f"Erro Google: {response.status_code}"}
-        else:
-            return {"success": False, "error": "Provider não suportado"}
-            
-    except Exception as e:
-        return {"success": False, "error": f"Erro de conexão: {str(e)}"}
+    provider_config = config.get_provider(provider)
+    if not provider_config:
+        return {"success": False, "error": "Provider não suportado"}
+
+    # Chamada barata (listar modelos): não gera tokens nem gasta cota de chat
+    result = await check_key(router.get_client(), provider, provider_config["base_url"], api_key, timeout=10.0)
+    if result["ok"]:
+        return {"success": True, "message": f"Chave {provider} válida", "latency_ms": round(result["latency"] * 1000, 1)}
+    if not result["reachable"] and result["status_code"] is None:
+        return {"success": False, "error": f"Erro de conexão: {result['error']}"}
+    return {"success": False, "error": f"Erro {provider}: {result['error']}"}
 
 @app.post("/api-config/save")
 async def save_api_key(request: dict):
@@ -335,5 +1274,6 @@ async def save_all_api_keys(request: dict):
     }
 
 if __name__ == "__main__":
+    import uvicorn
     print("🚀 Iniciando RouterLLM...")
     uvicorn.run(app, host="0.0.0.0", port=8000)
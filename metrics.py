@@ -4,12 +4,16 @@
 Monitoramento em tempo real de performance e custos
 """
 
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
 from typing import Dict, Any
 import time
 
 class RouterMetrics:
     def __init__(self):
+        # Import tardio: o prometheus_client só carrega quando a primeira métrica é registrada
+        from prometheus_client import Counter, Histogram, Gauge, CONTENT_TYPE_LATEST
+        self.content_type = CONTENT_TYPE_LATEST
+        self._children = {}
+
         # Contadores
         self.total_requests = Counter(
             'router_llm_requests_total',
@@ -20,7 +24,7 @@ class RouterMetrics:
         self.total_tokens = Counter(
             'router_llm_tokens_total',
             'Total tokens processed',
-            ['model', 'type']  # type: input/output
+            ['model', 'type']  # type: input/output/cached_input/cache_write
         )
         
         self.total_cost = Counter(
@@ -75,26 +79,323 @@ class RouterMetrics:
             ['provider', 'error_type']
         )
 
+        # Livro-razão de uso
+        self.usage_dropped = Counter(
+            'router_llm_usage_events_dropped_total',
+            'Usage ledger events lost (buffer overflow or batch given up after repeated write failures)'
+        )
+
+        # Jobs assíncronos
+        self.job_queue_depth = Gauge(
+            'router_llm_job_queue_depth',
+            'Number of jobs waiting in the queue'
+        )
+
+        self.jobs_total = Counter(
+            'router_llm_jobs_total',
+            'Total jobs by final status',
+            ['status']  # submitted/rejected/done/failed
+        )
+
+        self.job_latency = Histogram(
+            'router_llm_job_latency_seconds',
+            'Job latency from submission to completion',
+            ['status'],
+            buckets=[1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0]
+        )
+
+        self.job_queue_wait = Histogram(
+            'router_llm_job_queue_wait_seconds',
+            'Time a job waited in the queue before a worker picked it up',
+            buckets=[0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0]
+        )
+
+        # Faixas de prioridade (interativo x lote)
+        self.lane_queue_time = Histogram(
+            'router_llm_lane_queue_seconds',
+            'Time a provider call waited for a slot in its priority lane',
+            ['lane'],
+            buckets=[0.0, 0.005, 0.025, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0]
+        )
+
+        self.lane_waiting = Gauge(
+            'router_llm_lane_waiting',
+            'Provider calls waiting for a slot, by priority lane',
+            ['lane']
+        )
+
+        self.lane_in_flight = Gauge(
+            'router_llm_lane_in_flight',
+            'Provider calls in flight, by priority lane',
+            ['lane']
+        )
+
+        # Chamadas canceladas (prazo esgotado ou cliente desconectou)
+        self.cancelled_requests = Counter(
+            'router_llm_cancelled_requests_total',
+            'Provider calls cancelled before completion',
+            ['model', 'reason']
+        )
+
+        self.cancelled_tokens = Counter(
+            'router_llm_cancelled_tokens_total',
+            'Estimated input tokens already sent to the provider when the call was cancelled',
+            ['model', 'reason']
+        )
+
+        self.cancelled_cost = Counter(
+            'router_llm_cancelled_cost_total',
+            'Estimated cost in USD spent on cancelled calls',
+            ['model', 'reason']
+        )
+
+        # Cascata barato → premium
+        self.cascade_outcomes = Counter(
+            'router_llm_cascade_total',
+            'Cascade attempts by category and outcome (accepted or failure reason)',
+            ['category', 'outcome']
+        )
+
+        # Sondas ativas dos provedores
+        self.probes_total = Counter(
+            'router_llm_provider_probes_total',
+            'Health probes sent to each provider, by result',
+            ['provider', 'result']
+        )
+
+        self.probe_latency = Histogram(
+            'router_llm_provider_probe_seconds',
+            'Latency of successful provider health probes',
+            ['provider'],
+            buckets=[0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0]
+        )
+
+        # Saúde do event loop
+        self.loop_lag = Histogram(
+            'router_llm_event_loop_lag_seconds',
+            'Event loop scheduling delay measured by the lag monitor',
+            buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0]
+        )
+
+        self.loop_stalls = Counter(
+            'router_llm_event_loop_stalls_total',
+            'Times the event loop was blocked longer than the stall threshold'
+        )
+
+        self.phase_duration = Histogram(
+            'router_llm_phase_seconds',
+            'Per-phase request duration when profiling is enabled',
+            ['phase'],
+            buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+        )
+
+        # Pool de chaves de API (chave mascarada no rótulo)
+        self.api_key_requests = Counter(
+            'router_llm_api_key_requests_total',
+            'Upstream calls per API key (masked) and HTTP status',
+            ['provider', 'key', 'status']
+        )
+
+        self.api_key_tokens = Counter(
+            'router_llm_api_key_tokens_total',
+            'Tokens consumed per API key (masked)',
+            ['provider', 'key']
+        )
+
+        self.api_key_remaining = Gauge(
+            'router_llm_api_key_remaining',
+            'Remaining rate-limit budget reported by the provider for each API key',
+            ['provider', 'key', 'kind']
+        )
+
+        self.api_key_cooldowns = Counter(
+            'router_llm_api_key_cooldowns_total',
+            'Times an API key was put in cool-down after a 429',
+            ['provider', 'key']
+        )
+
+        # Ritmo adaptativo por provedor
+        self.provider_headroom = Gauge(
+            'router_llm_provider_rate_limit_headroom',
+            'Fraction of the provider rate limit still available (1 = unknown or full)',
+            ['provider']
+        )
+
+        self.throttle_wait = Histogram(
+            'router_llm_throttle_wait_seconds',
+            'Time calls were held by the client-side leaky bucket before going upstream',
+            ['provider'],
+            buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+        )
+
+        # Balanceamento entre endpoints do mesmo modelo
+        self.endpoint_requests = Counter(
+            'router_llm_endpoint_requests_total',
+            'Upstream calls per model endpoint by outcome (success/error/failure)',
+            ['model', 'endpoint', 'outcome']
+        )
+
+        self.endpoint_latency = Histogram(
+            'router_llm_endpoint_latency_seconds',
+            'Upstream call latency per model endpoint',
+            ['model', 'endpoint'],
+            buckets=[0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0]
+        )
+
+        self.endpoint_in_flight = Gauge(
+            'router_llm_endpoint_in_flight',
+            'Calls in flight per model endpoint',
+            ['model', 'endpoint']
+        )
+
+        self.endpoint_ejections = Counter(
+            'router_llm_endpoint_ejections_total',
+            'Times an endpoint was ejected from rotation after consecutive failures',
+            ['model', 'endpoint']
+        )
+
+        # Transbordo para o servidor próprio quando os provedores da categoria estão sem folga
+        self.spillovers = Counter(
+            'router_llm_spillover_total',
+            'Requests routed to a local model because the category models were throttled or down',
+            ['category', 'model']
+        )
+
+        # max_tokens adaptativo (teto previsto pelo tamanho das respostas)
+        self.max_tokens_saved = Counter(
+            'router_llm_max_tokens_saved_total',
+            'max_tokens reservation avoided by the output-length predictor',
+            ['category', 'model']
+        )
+
+        self.output_truncations = Counter(
+            'router_llm_output_truncations_total',
+            'Responses that hit the predicted max_tokens and were continued',
+            ['category', 'model']
+        )
+
+        self.continuation_input_tokens = Counter(
+            'router_llm_continuation_input_tokens_total',
+            'Input tokens re-sent to continue responses cut at the predicted cap',
+            ['category', 'model']
+        )
+
+        # Roteamento em sombra (políticas candidatas)
+        self.shadow_decisions = Counter(
+            'router_llm_shadow_decisions_total',
+            'Shadow policy decisions compared with the live routing decision',
+            ['policy', 'outcome']
+        )
+
+        # Gauge: o delta acumulado pode ser negativo (economia)
+        self.shadow_cost_delta = Gauge(
+            'router_llm_shadow_projected_cost_delta_usd',
+            'Projected cost (USD) of the shadow decision minus the live cost; negative values are savings',
+            ['policy']
+        )
+
+        self.shadow_call_cost = Counter(
+            'router_llm_shadow_call_cost_total',
+            'USD spent on sampled calls to the shadow model',
+            ['policy', 'model']
+        )
+
+        self.shadow_latency_delta = Histogram(
+            'router_llm_shadow_latency_delta_seconds',
+            'Shadow model latency minus live latency on sampled calls',
+            ['policy'],
+            buckets=[-10.0, -5.0, -2.0, -1.0, -0.5, -0.1, 0.0, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0]
+        )
+
+        # Controle de admissão (sobrecarga)
+        self.admission_decisions = Counter(
+            'router_llm_admission_total',
+            'Admission decisions (admitted, degraded or shed) by lane and the signal that triggered them',
+            ['lane', 'decision', 'reason']
+        )
+
+        self.admission_level = Gauge(
+            'router_llm_admission_level',
+            'Current admission level (0=ok, 1=degrade, 2=shed)'
+        )
+
+        self.saturation = Gauge(
+            'router_llm_saturation',
+            'Highest ratio of a saturation signal to its shed threshold (>= 1 means shedding)'
+        )
+
+        self.queue_delay = Gauge(
+            'router_llm_queue_delay_seconds',
+            'Age of the oldest request waiting for a provider slot',
+            ['lane']
+        )
+
+        # Modo offline (Batch API dos provedores)
+        self.batch_submissions = Counter(
+            'router_llm_batch_submissions_total',
+            'Provider batch-API submissions by provider and outcome',
+            ['provider', 'outcome']
+        )
+
+        # Embeddings em micro-lotes
+        self.embedding_batch_size = Histogram(
+            'router_llm_embedding_batch_size',
+            'Distinct texts per upstream embedding batch',
+            ['model'],
+            buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048]
+        )
+
+        self.embedding_texts = Counter(
+            'router_llm_embedding_texts_total',
+            'Embedding texts by source (upstream, cache or dedup)',
+            ['model', 'source']
+        )
+
+        self.cascade_escalation_latency = Histogram(
+            'router_llm_cascade_escalation_seconds',
+            'Latency added by the rejected cheap attempt when the cascade escalates',
+            ['category'],
+            buckets=[0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0]
+        )
+
+    def _child(self, metric, *label_values):
+        """
+        labels() é caro no caminho quente (valida e monta a chave a cada chamada):
+        guarda o filho de cada combinação de rótulos, na ordem declarada na métrica
+        """
+        key = (metric._name, label_values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = metric.labels(*label_values)
+        return child
+
     def record_request(self, model: str, status: str = "success"):
         """Registra uma requisição"""
-        self.total_requests.labels(model=model, status=status).inc()
+        self._child(self.total_requests, model, status).inc()
 
     def record_tokens(self, model: str, input_tokens: int, output_tokens: int):
         """Registra tokens processados"""
-        self.total_tokens.labels(model=model, type="input").inc(input_tokens)
-        self.total_tokens.labels(model=model, type="output").inc(output_tokens)
+        self._child(self.total_tokens, model, "input").inc(input_tokens)
+        self._child(self.total_tokens, model, "output").inc(output_tokens)
+
+    def record_cache_tokens(self, model: str, cached_tokens: int, cache_write_tokens: int):
+        """Registra tokens de entrada lidos do cache e gravados no cache do provedor"""
+        if cached_tokens:
+            self._child(self.total_tokens, model, "cached_input").inc(cached_tokens)
+        if cache_write_tokens:
+            self._child(self.total_tokens, model, "cache_write").inc(cache_write_tokens)
 
     def record_cost(self, model: str, cost: float):
         """Registra custo da requisição"""
-        self.total_cost.labels(model=model).inc(cost)
+        self._child(self.total_cost, model).inc(cost)
 
     def record_duration(self, model: str, duration: float):
         """Registra duração da requisição"""
-        self.request_duration.labels(model=model).observe(duration)
+        self._child(self.request_duration, model).observe(duration)
 
     def record_response_time(self, model: str, response_time: float):
         """Registra tempo de resposta"""
-        self.response_time.labels(model=model).observe(response_time)
+        self._child(self.response_time, model).observe(response_time)
 
     def set_active_requests(self, count: int):
         """Define número de requisições ativas"""
@@ -104,20 +405,170 @@ class RouterMetrics:
         """Define disponibilidade do modelo"""
         self.model_availability.labels(model=model).set(1 if available else 0)
 
+    def set_cost_per_hour(self, model: str, cost: float):
+        """Define o custo da última hora (vem do livro-razão de uso)"""
+        self.cost_per_hour.labels(model=model).set(cost)
+
     def record_routing_decision(self, reasoning: str, model_selected: str):
         """Registra decisão de roteamento"""
-        self.routing_decisions.labels(
-            reasoning=reasoning, 
-            model_selected=model_selected
-        ).inc()
+        self._child(self.routing_decisions, reasoning, model_selected).inc()
 
     def record_api_error(self, provider: str, error_type: str):
         """Registra erro de API"""
         self.api_errors.labels(provider=provider, error_type=error_type).inc()
 
+    def record_usage_dropped(self, count: int):
+        """Conta eventos do livro-razão que não foram gravados"""
+        self.usage_dropped.inc(count)
+
+    def set_job_queue_depth(self, depth: int):
+        """Define o tamanho atual da fila de jobs"""
+        self.job_queue_depth.set(depth)
+
+    def record_job(self, status: str, latency: float = None, queue_wait: float = None):
+        """Registra um job (e sua latência/espera quando terminou)"""
+        self.jobs_total.labels(status=status).inc()
+        if latency is not None:
+            self.job_latency.labels(status=status).observe(latency)
+        if queue_wait is not None:
+            self.job_queue_wait.observe(queue_wait)
+
+    def record_lane_wait(self, lane: str, seconds: float):
+        """Registra quanto uma chamada esperou na faixa de prioridade"""
+        self._child(self.lane_queue_time, lane).observe(seconds)
+
+    def set_lane_state(self, lane: str, waiting: int, in_flight: int):
+        """Define chamadas esperando e em andamento na faixa"""
+        self._child(self.lane_waiting, lane).set(waiting)
+        self._child(self.lane_in_flight, lane).set(in_flight)
+
+    def record_cancelled(self, model: str, reason: str, wasted_tokens: int, wasted_cost: float):
+        """Registra uma chamada cancelada e o desperdício estimado"""
+        self.cancelled_requests.labels(model=model, reason=reason).inc()
+        self.cancelled_tokens.labels(model=model, reason=reason).inc(wasted_tokens)
+        self.cancelled_cost.labels(model=model, reason=reason).inc(wasted_cost)
+
+    def record_cascade(self, category: str, outcome: str, added_latency: float = None):
+        """Registra o desfecho da cascata (e a latência somada quando escalou)"""
+        self.cascade_outcomes.labels(category=category, outcome=outcome).inc()
+        if added_latency is not None:
+            self.cascade_escalation_latency.labels(category=category).observe(added_latency)
+
+    def record_phase(self, phase: str, seconds: float):
+        """Registra a duração de uma fase da requisição (perfil opcional)"""
+        self._child(self.phase_duration, phase).observe(seconds)
+
+    def record_probe(self, provider: str, ok: bool, latency: float):
+        """Registra uma sonda de saúde do provedor"""
+        self.probes_total.labels(provider=provider, result="ok" if ok else "failed").inc()
+        if ok:
+            self.probe_latency.labels(provider=provider).observe(latency)
+
+    def record_api_key_request(self, provider: str, key: str, status: str, tokens: int):
+        """Registra uma chamada feita com uma chave do pool"""
+        self._child(self.api_key_requests, provider, key, status).inc()
+        if tokens:
+            self._child(self.api_key_tokens, provider, key).inc(tokens)
+
+    def set_api_key_remaining(self, provider: str, key: str, kind: str, value: int):
+        """Folga restante informada pelo provedor (requests ou tokens)"""
+        self._child(self.api_key_remaining, provider, key, kind).set(value)
+
+    def record_api_key_cooldown(self, provider: str, key: str):
+        """Conta uma chave posta em cooldown por 429"""
+        self.api_key_cooldowns.labels(provider=provider, key=key).inc()
+
+    def set_provider_headroom(self, provider: str, headroom: float):
+        """Folga do rate limit do provedor (soma das chaves)"""
+        self._child(self.provider_headroom, provider).set(headroom)
+
+    def record_throttle_wait(self, provider: str, seconds: float):
+        """Registra uma espera imposta pelo ritmo adaptativo"""
+        self.throttle_wait.labels(provider=provider).observe(seconds)
+
+    def record_endpoint_request(self, model: str, endpoint: str, outcome: str, latency: float):
+        """Registra uma chamada num endpoint do modelo"""
+        self._child(self.endpoint_requests, model, endpoint, outcome).inc()
+        self._child(self.endpoint_latency, model, endpoint).observe(latency)
+
+    def set_endpoint_in_flight(self, model: str, endpoint: str, count: int):
+        """Chamadas em andamento no endpoint"""
+        self._child(self.endpoint_in_flight, model, endpoint).set(count)
+
+    def record_endpoint_ejection(self, model: str, endpoint: str):
+        """Conta um endpoint tirado da rotação"""
+        self.endpoint_ejections.labels(model=model, endpoint=endpoint).inc()
+
+    def record_spillover(self, category: str, model: str):
+        """Conta um pedido desviado para o modelo local"""
+        self.spillovers.labels(category=category, model=model).inc()
+
+    def record_output_budget(self, category: str, model: str, saved: int, truncated: bool,
+                             continuation_input_tokens: int):
+        """Registra o efeito do max_tokens previsto numa resposta"""
+        if saved:
+            self._child(self.max_tokens_saved, category, model).inc(saved)
+        if truncated:
+            self._child(self.output_truncations, category, model).inc()
+        if continuation_input_tokens:
+            self._child(self.continuation_input_tokens, category, model).inc(continuation_input_tokens)
+
+    def record_shadow_decision(self, policy: str, agreed: bool, cost_delta: float):
+        """Registra a decisão de uma política em sombra"""
+        self._child(self.shadow_decisions, policy, "agree" if agreed else "disagree").inc()
+        self._child(self.shadow_cost_delta, policy).inc(cost_delta)
+
+    def record_shadow_call(self, policy: str, model: str, cost: float, latency_delta: float):
+        """Registra uma chamada sorteada ao modelo da sombra"""
+        self.shadow_call_cost.labels(policy=policy, model=model).inc(cost)
+        self.shadow_latency_delta.labels(policy=policy).observe(latency_delta)
+
+    def record_admission(self, decision: str, reason: str, lane: str):
+        """Conta uma decisão do controle de admissão"""
+        self._child(self.admission_decisions, lane, decision, reason).inc()
+
+    def set_admission_state(self, level: int, saturation: float, queue_delays: Dict[str, float]):
+        """Nível de admissão, saturação e espera na fila (lidos a cada raspagem)"""
+        self.admission_level.set(level)
+        self.saturation.set(saturation)
+        for lane, delay in queue_delays.items():
+            self._child(self.queue_delay, lane).set(delay)
+
+    def record_batch_submission(self, provider: str, outcome: str):
+        """Conta submissões à Batch API (submitted, failed ou estado final do provedor)"""
+        self.batch_submissions.labels(provider=provider, outcome=outcome).inc()
+
+    def record_embedding_batch(self, model: str, size: int):
+        """Registra o tamanho de um lote de embeddings enviado ao provedor"""
+        self.embedding_batch_size.labels(model=model).observe(size)
+
+    def record_embedding_texts(self, model: str, source: str, count: int):
+        """Conta textos de embedding atendidos pelo provedor, cache ou deduplicação"""
+        self.embedding_texts.labels(model=model, source=source).inc(count)
+
+    def record_loop_lag(self, seconds: float):
+        """Registra o atraso de agendamento do event loop"""
+        self.loop_lag.observe(seconds)
+
+    def record_loop_stall(self):
+        """Conta um travamento do event loop acima do limite"""
+        self.loop_stalls.inc()
+
     def get_metrics(self) -> str:
         """Retorna métricas no formato Prometheus"""
+        from prometheus_client import generate_latest
         return generate_latest()
 
+class LazyMetrics:
+    """Proxy que só cria o RouterMetrics no primeiro uso (cold start mais rápido)"""
+
+    def __init__(self):
+        self._instance = None
+
+    def __getattr__(self, name: str):
+        if self._instance is None:
+            self._instance = RouterMetrics()
+        return getattr(self._instance, name)
+
 # Instância global das métricas
-metrics = RouterMetrics()
+metrics = LazyMetrics()
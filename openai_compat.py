@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+🔌 Formato da API da OpenAI para o /v1/chat/completions
+Conversão entre o formato OpenAI e o interno (provedores que não falam
+OpenAI), montagem de chunks SSE e leitura do uso (tokens) das respostas
+repassadas sem parse. O repasse em si fica no main.py/router.py
+"""
+
+import re
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import jsoncodec
+from conversation import Message, text_part
+
+# Motivo de parada de cada provedor → finish_reason da OpenAI
+FINISH_REASONS = {
+    "end_turn": "stop", "stop_sequence": "stop", "max_tokens": "length", "tool_use": "tool_calls",
+    "STOP": "stop", "MAX_TOKENS": "length", "SAFETY": "content_filter", "RECITATION": "content_filter",
+}
+
+class CompatError(ValueError):
+    """Pedido que não dá para atender no formato OpenAI (vira erro 400/404)"""
+
+    def __init__(self, message: str, status_code: int = 400, code: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+
+def error_body(message: str, error_type: str = "invalid_request_error", code: Optional[str] = None) -> Dict[str, Any]:
+    """Corpo de erro no formato que os SDKs da OpenAI esperam"""
+    return {"error": {"message": message, "type": error_type, "param": None, "code": code}}
+
+def to_internal(body: Dict[str, Any]) -> Tuple[List[Message], Optional[str]]:
+    """
+    Mensagens OpenAI → (mensagens internas, system prompt)
+    Só texto: ferramentas e imagens precisam de um provedor compatível (repasse direto)
+    """
+    if body.get("tools") or body.get("functions"):
+        raise CompatError("'tools' só é suportado em modelos de provedores compatíveis com OpenAI")
+    systems, messages = [], []
+    for message in body.get("messages") or []:
+        if not isinstance(message, dict):
+            raise CompatError("Cada item de 'messages' deve ser um objeto")
+        role, content = message.get("role"), message.get("content")
+        if isinstance(content, list):
+            if not all(isinstance(part, dict) for part in content):
+                raise CompatError("Cada parte de 'content' deve ser um objeto")
+            if any(part.get("type") != "text" for part in content):
+                raise CompatError("Só partes do tipo 'text' são suportadas neste modelo")
+            texts = [part.get("text", "") for part in content]
+        else:
+            texts = [content or ""]
+        if not all(isinstance(text, str) for text in texts):
+            raise CompatError("O texto das mensagens deve ser uma string")
+        if role in ("system", "developer"):
+            systems.extend(texts)
+        elif role in ("user", "assistant"):
+            messages.append({"role": role, "content": [text_part(text) for text in texts]})
+        else:
+            raise CompatError(f"Papel '{role}' não suportado neste modelo")
+    if not messages:
+        raise CompatError("'messages' precisa de ao menos uma mensagem de usuário")
+    return messages, "\n\n".join(systems) or None
+
+def completion_id() -> str:
+    return f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+def usage_body(result) -> Dict[str, Any]:
+    usage = {
+        "prompt_tokens": result.input_tokens,
+        "completion_tokens": result.output_tokens,
+        "total_tokens": result.tokens_used,
+    }
+    if result.cached_tokens:
+        usage["prompt_tokens_details"] = {"cached_tokens": result.cached_tokens}
+    return usage
+
+def completion_body(model: str, result) -> Dict[str, Any]:
+    """ModelResult → chat.completion"""
+    return {
+        "id": completion_id(),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": result.text},
+            "finish_reason": FINISH_REASONS.get(result.finish_reason, result.finish_reason or "stop"),
+        }],
+        "usage": usage_body(result),
+    }
+
+def chunk_event(chunk_id: str, created: int, model: str, delta: Dict[str, Any],
+                finish_reason: Optional[str] = None, usage: Optional[Dict[str, Any]] = None) -> bytes:
+    """Um evento SSE chat.completion.chunk (usage: chunk final sem choices)"""
+    chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+             "choices": [] if usage is not None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+    if usage is not None:
+        chunk["usage"] = usage
+    return b"data: " + jsoncodec.dumps(chunk) + b"\n\n"
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+def replace_model(body: bytes, old: str, new: str) -> Optional[bytes]:
+    """
+    Troca o valor de "model" direto nos bytes, sem reserializar o pedido
+    None se o campo não for achado exatamente uma vez (quem chama reserializa)
+    """
+    pattern = re.compile(rb'("model"\s*:\s*)' + re.escape(jsoncodec.dumps(old)))
+    replaced, count = pattern.subn(lambda m: m.group(1) + jsoncodec.dumps(new), body)
+    return replaced if count == 1 else None
+
+def stream_usage(tail: bytes) -> Optional[Dict[str, Any]]:
+    """Uso no último chunk com "usage" (quando o cliente pediu stream_options.include_usage)"""
+    for line in reversed(tail.split(b"\n")):
+        if line.startswith(b"data: {") and b'"usage"' in line:
+            try:
+                usage = jsoncodec.loads(line[6:]).get("usage")
+            except ValueError:
+                continue  # linha cortada no começo do trecho guardado
+            if usage:
+                return usage
+    return None
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+📐 max_tokens adaptativo pelo tamanho de resposta observado
+Os provedores reservam capacidade (e cota de rate limit) pelo `max_tokens`,
+não pelo que a resposta usa. Aqui cada (categoria, modelo) guarda os tamanhos
+das últimas respostas e o teto da próxima chamada vira um quantil deles
+(com folga). Resposta cortada no teto previsto é continuada pelo roteador
+até o `max_tokens` pedido pelo cliente, que continua sendo o limite real
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from metrics import metrics
+
+# finish_reason de resposta cortada pelo max_tokens (OpenAI, Anthropic, Google)
+TRUNCATED = ("length", "max_tokens", "MAX_TOKENS")
+
+def is_truncated(finish_reason: Optional[str]) -> bool:
+    return finish_reason in TRUNCATED
+
+def _percentile(values, fraction: float) -> int:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class OutputBudget:
+    """
+    `quantile`: fração das respostas que deve caber no teto (ex.: 0.95)
+    `margin`: multiplicador de folga sobre o quantil; `floor`: teto mínimo
+    `min_samples`: respostas observadas antes de apertar o teto
+    `window`: respostas recentes consideradas; `max_continuations`: continuações por pedido
+    """
+
+    def __init__(self, quantile: float = 0.95, margin: float = 1.2, min_samples: int = 50,
+                 window: int = 500, floor: int = 64, max_continuations: int = 2):
+        self.quantile = quantile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.window = window
+        self.floor = floor
+        self.max_continuations = max_continuations
+        self._lock = threading.Lock()
+        self._samples: Dict[Tuple[str, str], Deque[int]] = {}
+        self._caps: Dict[Tuple[str, str], Optional[int]] = {}  # teto calculado (limpo a cada amostra)
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _cap(self, key: Tuple[str, str]) -> Optional[int]:
+        if key not in self._caps:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < self.min_samples:
+                self._caps[key] = None
+            else:
+                self._caps[key] = max(self.floor, math.ceil(_percentile(samples, self.quantile) * self.margin))
+        return self._caps[key]
+
+    def suggest(self, category: str, model: str, max_tokens: int) -> int:
+        """Teto da próxima chamada: o previsto, nunca acima do pedido pelo cliente"""
+        with self._lock:
+            cap = self._cap((category, model))
+        return min(cap, max_tokens) if cap is not None else max_tokens
+
+    def record(self, category: str, model: str, requested: int, cap: int, output_tokens: int,
+               truncated: bool, continuations: int, continuation_input_tokens: int):
+        """
+        Uma resposta completa (já somadas as continuações)
+        `truncated`: a primeira chamada bateu no teto previsto; `continuation_input_tokens`:
+        entrada reenviada nas continuações (o custo extra de cortar cedo)
+        """
+        key = (category, model)
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(output_tokens)
+            self._caps.pop(key, None)
+            stats = self._stats.setdefault(key, {
+                "requests": 0,
+                "predicted": 0,
+                "reserved_tokens_saved": 0,
+                "truncated": 0,
+                "continuations": 0,
+                "continuation_input_tokens": 0,
+            })
+            stats["requests"] += 1
+            if cap < requested:
+                stats["predicted"] += 1
+                stats["reserved_tokens_saved"] += requested - cap
+            stats["truncated"] += int(truncated)
+            stats["continuations"] += continuations
+            stats["continuation_input_tokens"] += continuation_input_tokens
+        metrics.record_output_budget(category, model, max(0, requested - cap), truncated, continuation_input_tokens)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Por categoria e modelo: teto atual, economia de reserva e taxa de corte"""
+        with self._lock:
+            result: Dict[str, Dict[str, Any]] = {}
+            for (category, model), stats in self._stats.items():
+                predicted = stats["predicted"]
+                result.setdefault(category, {})[model] = {
+                    **stats,
+                    "samples": len(self._samples.get((category, model), ())),
+                    "current_cap": self._cap((category, model)),
+                    "truncation_rate": stats["truncated"] / predicted if predicted else 0.0,
+                    # Reserva evitada menos a entrada reenviada nas continuações
+                    "net_tokens_saved": stats["reserved_tokens_saved"] - stats["continuation_input_tokens"],
+                }
+            return result
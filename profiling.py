@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+⏱️ Perfil por requisição do RouterLLM (opcional: PROFILING_ENABLED=1)
+Mede as fases do caminho quente com relógio monotônico: roteamento, fila,
+conexão, tempo até o primeiro byte, download, parse e métricas.
+Desligado, cada `span()` custa uma leitura de contextvar
+"""
+
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from metrics import metrics
+
+ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes", "on")
+
+# Fases da requisição atual (None = sem perfil)
+_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("routerllm_profile", default=None)
+_NOOP = nullcontext()
+
+class _Span:
+    __slots__ = ("phases", "name", "start")
+
+    def __init__(self, phases: Dict[str, float], name: str):
+        self.phases = phases
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.phases[self.name] = self.phases.get(self.name, 0.0) + elapsed
+
+def span(name: str):
+    """Mede o bloco na fase `name` (acumula se a fase se repetir, ex.: cascata)"""
+    phases = _phases.get()
+    if phases is None:
+        return _NOOP
+    return _Span(phases, name)
+
+def add(name: str, seconds: float):
+    """Soma uma duração medida fora de um bloco `span()`"""
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+@contextmanager
+def profile_request(enabled: Optional[bool] = None):
+    """
+    Abre o perfil da requisição; ao sair, exporta as fases nos histogramas.
+    Entrega o dict de fases (ou None se desligado) para montar o Server-Timing
+    """
+    if not (ENABLED if enabled is None else enabled):
+        yield None
+        return
+    phases: Dict[str, float] = {}
+    token = _phases.set(phases)
+    start = time.perf_counter()
+    try:
+        yield phases
+    finally:
+        _phases.reset(token)
+        phases["total"] = time.perf_counter() - start
+        for name, seconds in phases.items():
+            metrics.record_phase(name, seconds)
+
+def server_timing(phases: Dict[str, float]) -> str:
+    """{'routing': 0.0012} → 'routing;dur=1.20' (milissegundos, formato Server-Timing)"""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items())
+
+def httpx_extensions() -> Dict:
+    """
+    Extensão `trace` do httpx para separar conexão, espera pelo primeiro byte
+    e download da resposta do provedor ({} quando não há perfil)
+    """
+    phases = _phases.get()
+    if phases is None:
+        return {}
+    started: Dict[str, float] = {}
+    created = time.perf_counter()
+    first_event = True
+
+    async def trace(event: str, info: Dict):
+        nonlocal first_event
+        now = time.perf_counter()
+        _, _, name = event.partition(".")
+        if name.endswith(".started"):
+            step = name[:-len(".started")]
+            if first_event:
+                # Até o primeiro evento: espera por uma conexão livre no pool
+                first_event = False
+                phases["pool"] = phases.get("pool", 0.0) + (now - created)
+            if step == "send_request_headers":
+                started["request"] = now
+            started[step] = now
+            return
+        step = name.rsplit(".", 1)[0]
+        begin = started.pop(step, None)
+        if begin is None:
+            return
+        if step in ("connect_tcp", "start_tls"):
+            phases["connect"] = phases.get("connect", 0.0) + (now - begin)
+        elif step == "receive_response_headers":
+            # Envio do corpo + processamento no provedor até os cabeçalhos
+            phases["ttfb"] = phases.get("ttfb", 0.0) + (now - started.pop("request", begin))
+        elif step == "receive_response_body":
+            phases["download"] = phases.get("download", 0.0) + (now - begin)
+
+    return {"trace": trace}
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+📤 Camada HTTP rápida do RouterLLM
+Respostas e parse de requisições com o codec JSON rápido,
+e compressão negociada (brotli/gzip) para respostas grandes
+"""
+
+import zlib
+from typing import Any, Callable, List, Optional
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+
+import jsoncodec
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependência opcional
+    brotli = None
+
+class FastJSONResponse(JSONResponse):
+    """Resposta JSON serializada pelo codec rápido (estilo ORJSONResponse)"""
+
+    def render(self, content: Any) -> bytes:
+        return jsoncodec.dumps(content)
+
+class FastJSONRequest(Request):
+    """Request cujo .json() usa o codec rápido"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = jsoncodec.loads(await self.body())
+        return self._json
+
+class FastJSONRoute(APIRoute):
+    """Rota do FastAPI que faz o parse do corpo com o codec rápido"""
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def fast_json_handler(request: Request):
+            return await handler(FastJSONRequest(request.scope, request.receive))
+
+        return fast_json_handler
+
+def _accepted_encodings(header: str) -> List[str]:
+    """Codificações aceitas pelo cliente (ignora as com q=0)"""
+    accepted = []
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.append(name.strip().lower())
+    return accepted
+
+class _Compressor:
+    """Interface comum para gzip e brotli, com flush por chunk (streaming)"""
+
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._obj = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress_all(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.finish()
+        return self._obj.compress(data) + self._obj.flush()
+
+    def compress_chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._obj.finish() if self.encoding == "br" else self._obj.flush()
+
+class CompressionMiddleware:
+    """
+    🗜️ Comprime respostas >= minimum_size com brotli (se instalado) ou gzip
+    Respostas em streaming são comprimidas chunk a chunk com flush;
+    Server-Sent Events ficam de fora para não atrasar os eventos
+    """
+
+    EXCLUDED_TYPES = ("text/event-stream",)
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope) -> Optional[str]:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        encoding = self._choose_encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                skip = (
+                    "content-encoding" in headers
+                    or content_type.startswith(self.EXCLUDED_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)
+                )
+                if skip:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body:
+                    body = compressor.compress_all(body)
+                    headers["Content-Length"] = str(len(body))
+                    start_message["headers"] = headers.raw
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                # Streaming: tamanho final desconhecido
+                del headers["Content-Length"]
+                start_message["headers"] = headers.raw
+                await send(start_message)
+
+            if more_body:
+                chunk = compressor.compress_chunk(body)
+            else:
+                chunk = compressor.compress_chunk(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """
 🔄 Script para reiniciar o servidor RouterLLM
+Se o servidor estiver no ar, tenta primeiro o reload a quente (POST /admin/reload)
 """
 
 import subprocess
@@ -10,6 +11,22 @@ import os
 import signal
 import sys
 
+def hot_reload():
+    """Recarrega catálogo e chaves sem derrubar o processo (requer ADMIN_TOKEN)"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return False
+    try:
+        response = requests.post('http://localhost:8000/admin/reload',
+                                 headers={'X-Admin-Token': token}, timeout=5)
+        if response.status_code == 200:
+            print(f"✅ Reload a quente concluído (versão {response.json()['version']})")
+            return True
+        print(f"⚠️  Reload a quente falhou: {response.status_code} {response.text}")
+    except Exception as e:
+        print(f"⚠️  Servidor não respondeu ao reload: {e}")
+    return False
+
 def kill_existing_server():
     """Mata processos Python existentes"""
     try:
@@ -51,6 +68,10 @@ def test_server():
 def main():
     print("🔄 Reiniciando RouterLLM...")
     
+    # 0. Sem restart se o reload a quente resolver
+    if "--force" not in sys.argv and hot_reload():
+        return
+    
     # 1. Finalizar processos existentes
     kill_existing_server()
     time.sleep(2)
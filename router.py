@@ -5,15 +5,51 @@ Aqui acontece a mágica do roteamento inteligente
 """
 
 import re
-import httpx
 import asyncio
 import os
-from typing import Tuple, Dict, Any
+import time
+from typing import Tuple, Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Union
 import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from datetime import datetime
 
+import jsoncodec
+import profiling
+from cascade import CascadeStats, check_answer
+from deadlines import DeadlineExceeded, within_deadline
+from endpoints import EndpointBalancer
+from keypool import KeyLease, KeyPools, bearer_headers
+from metrics import metrics
+from output_budget import OutputBudget, is_truncated
+from throttle import AdaptiveThrottle
+from conversation import (
+    Message, PrefixCacheTracker, conversation_text, estimate_tokens, normalize_messages, text_part
+)
+
 logger = logging.getLogger(__name__)
 
+@dataclass
+class ModelResult:
+    """📦 Resultado de uma chamada a um modelo"""
+    text: str
+    tokens_used: int
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0        # tokens de entrada lidos do cache do provedor
+    cache_write_tokens: int = 0   # tokens de entrada gravados no cache (Anthropic)
+    finish_reason: Optional[str] = None
+    error: Optional[str] = None
+    avg_logprob: Optional[float] = None  # média dos logprobs da saída (só OpenAI, quando pedido)
+
+@dataclass
+class Attempt:
+    """🪜 Uma tentativa de resposta (a cascata pode fazer duas)"""
+    model: str
+    result: ModelResult
+    failure: Optional[str] = None  # motivo da reprovação na checagem de qualidade
+    latency: float = 0.0
+
 class LLMRouter:
     def __init__(self, config):
         self.config = config
@@ -23,6 +59,117 @@ class LLMRouter:
             "total_cost": 0.0,
             "avg_response_time": 0.0
         }
+        # Pool de conexões HTTP compartilhado, criado no primeiro uso
+        self._client = None
+        # 🧮 Classificador aprendido opcional (ROUTER_MODEL_PATH); sem ele, só regras
+        self.classifier = self._load_classifier()
+        # ♨️ Prefixos de prompt que estão quentes no cache de cada provedor
+        self.prefix_cache = PrefixCacheTracker(config.table.settings.get("prompt_cache_ttl_seconds", 300))
+        # 🪜 Estatísticas da cascata barato → premium
+        self.cascade_stats = CascadeStats()
+        # 🩺 Saúde dos provedores (sondagem ativa); None = não filtra
+        self.health_check: Optional[Callable[[str], bool]] = None
+        # 🧯 Sobrecarga (controle de admissão): True = preferir modelos baratos e rápidos
+        self.degrade_check: Optional[Callable[[], bool]] = None
+        # 🔑 Rotação entre as chaves de cada provedor (OPENAI_API_KEYS=sk-a,sk-b)
+        self.key_pools = KeyPools(cooldown=float(os.getenv("API_KEY_COOLDOWN_SECONDS", "30")))
+        # 🚦 Ritmo pelos limites que os provedores informam (sem rajadas até o 429)
+        self.throttle = AdaptiveThrottle(
+            self.key_pools,
+            near_limit=float(os.getenv("THROTTLE_NEAR_LIMIT", "0.1")),
+            burst=int(os.getenv("THROTTLE_BURST", "5")),
+            max_wait=float(os.getenv("THROTTLE_MAX_WAIT_SECONDS", "10"))
+        )
+        # ⚖️ Escolha entre os endpoints de cada modelo (peso, latência, ejeção por falhas)
+        self.endpoints = EndpointBalancer(
+            strategy=os.getenv("ENDPOINT_BALANCER", "p2c"),
+            eject_after=int(os.getenv("ENDPOINT_EJECT_AFTER", "5")),
+            eject_seconds=float(os.getenv("ENDPOINT_EJECT_SECONDS", "30")),
+            max_ejected_fraction=float(os.getenv("ENDPOINT_MAX_EJECTED_PERCENT", "50")) / 100
+        )
+        # 📐 max_tokens previsto pelo tamanho das respostas (opcional); None = usa o pedido
+        self.output_budget: Optional[OutputBudget] = None
+        if os.getenv("MAX_TOKENS_PREDICTOR", "false").lower() in ("1", "true", "yes"):
+            self.output_budget = OutputBudget(
+                quantile=float(os.getenv("MAX_TOKENS_QUANTILE", "0.95")),
+                margin=float(os.getenv("MAX_TOKENS_MARGIN", "1.2")),
+                min_samples=int(os.getenv("MAX_TOKENS_MIN_SAMPLES", "50")),
+                floor=int(os.getenv("MAX_TOKENS_FLOOR", "64")),
+                max_continuations=int(os.getenv("MAX_TOKENS_MAX_CONTINUATIONS", "2"))
+            )
+
+    def _load_classifier(self):
+        """Carrega o classificador só se configurado (NumPy é dependência opcional)"""
+        if not os.getenv("ROUTER_MODEL_PATH"):
+            return None
+        try:
+            from classifier import load_learned_router
+        except ImportError as e:
+            logger.error(f"❌ ROUTER_MODEL_PATH definido, mas o classificador não carregou ({e}); usando só as regras")
+            return None
+        return load_learned_router()
+
+    def reload(self):
+        """🔄 Recarrega catálogo, chaves de API e classificador sem reiniciar"""
+        table = self.config.reload()
+        self.classifier = self._load_classifier()
+        logger.info(f"🔄 Tabela de roteamento recarregada (versão {table.version}, provedores: {', '.join(table.available_providers) or 'nenhum'})")
+        return table
+
+    def get_client(self):
+        """
+        🔌 Retorna o cliente HTTP compartilhado (keep-alive entre chamadas)
+        O httpx só é importado aqui, fora do caminho de cold start
+        """
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                timeout=self.config.timeout_seconds,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+        return self._client
+
+    async def aclose(self):
+        """🔌 Fecha o pool de conexões"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def get_routable_models(self) -> Dict[str, Any]:
+        """
+        Modelos com chave configurada, provedor respondendo às sondas e com folga
+        no rate limit (e nos endpoints com `max_concurrency`, vaga livre);
+        cada filtro que esvaziaria a lista é ignorado (melhor tentar do que recusar)
+        """
+        available = self.config.get_available_models()
+        if self.health_check is not None:
+            healthy = {name: model for name, model in available.items() if self.health_check(model["provider"])}
+            available = healthy or available
+        near_limit = {
+            provider for provider in {model["provider"] for model in available.values()}
+            if self.throttle.near_limit(provider, self.config.get_api_keys(provider))
+        }
+        full = {name for name in available if self.endpoints.saturated(name, self.config.get_endpoints(name))}
+        if not near_limit and not full:
+            return available
+        roomy = {name: model for name, model in available.items()
+                 if model["provider"] not in near_limit and name not in full}
+        return roomy or available
+
+    def _spillover_model(self, available_model_names: List[str]) -> Optional[str]:
+        """🏠 Modelo de servidor próprio que pode absorver o excedente (o mais barato)"""
+        local = [name for name in available_model_names if self.config.is_local(self.config.models[name]["provider"])]
+        return min(local, key=lambda m: self.config.models[m]["cost_per_1k_tokens"]) if local else None
+
+    def _degraded_model(self, category: Optional[str], available_model_names: List[str]) -> Optional[str]:
+        """🧯 Sob sobrecarga: o modelo rápido mais barato da categoria (ou de todos)"""
+        models = self.config.models
+        preferred = self.config.routing_categories[category]["preferred"] if category is not None else ()
+        for pool in ([m for m in preferred if m in available_model_names], available_model_names):
+            fast = [m for m in pool if models[m].get("speed") == "fast"] or pool
+            if fast:
+                return min(fast, key=lambda m: models[m]["cost_per_1k_tokens"])
+        return None
 
     def get_available_models(self) -> Dict[str, bool]:
         """
@@ -37,64 +184,77 @@ class LLMRouter:
         
         return available
 
-    def route_request(self, message: str, user_id: str = "anonymous") -> Tuple[str, str]:
+    def _categorize_by_rules(self, message: str) -> Optional[str]:
         """
-        🎯 Coração do roteador - decide qual modelo usar com fallback inteligente
-        Agora usa configuração flexível baseada nas APIs disponíveis
+        📏 Regras manuais - retorna a categoria ou None (usar modelo padrão)
         """
+        rules = self.config.routing_rules
         message_lower = message.lower()
         message_length = len(message)
-        available_models_config = self.config.get_available_models()
-        
-        # Se nenhum modelo disponível, retorna erro
-        if not available_models_config:
-            return "error", "❌ Nenhuma API configurada. Configure pelo menos uma chave de API no arquivo .env"
-        
-        # Lista de preferências por categoria
-        preferred_models = []
-        reasoning = ""
 
-        # Filtrar apenas modelos disponíveis para as preferências
-        available_model_names = list(available_models_config.keys())
-        
         # Regra 1: Código/Programação → Modelo premium
-        code_keywords = ['código', 'code', 'python', 'javascript', 'sql', 'debug', 'erro', 'função', 'class', 'import']
-        if any(keyword in message_lower for keyword in code_keywords):
-            all_preferred = ["gpt-4", "claude-3-5-sonnet", "gpt-4o-mini"]
-            preferred_models = [m for m in all_preferred if m in available_model_names]
-            reasoning = "🔧 Detectei programação - priorizando modelos premium"
+        if any(keyword in message_lower for keyword in rules["code_keywords"]):
+            return "code"
 
         # Regra 2: Perguntas curtas e simples → Modelo econômico
-        elif message_length < 100:
-            simple_patterns = ['o que é', 'como', 'quando', 'onde', 'quem', 'sim ou não', 'verdadeiro ou falso']
-            if any(pattern in message_lower for pattern in simple_patterns):
-                all_preferred = ["gpt-4o-mini", "claude-3-haiku", "gpt-4"]
-                preferred_models = [m for m in all_preferred if m in available_model_names]
-                reasoning = "⚡ Pergunta simples - priorizando modelos rápidos"
+        elif message_length < rules["simple_text_threshold"]:
+            if any(pattern in message_lower for pattern in rules["simple_patterns"]):
+                return "simple"
+            return None
 
         # Regra 3: Textos longos/análises → Modelo com contexto grande
-        elif message_length > 1000:
-            all_preferred = ["claude-3-5-sonnet", "gemini-1.5-pro", "gpt-4"]
-            preferred_models = [m for m in all_preferred if m in available_model_names]
-            reasoning = "📄 Texto longo - priorizando modelos com contexto extenso"
+        elif message_length > rules["long_text_threshold"]:
+            return "long_text"
 
         # Regra 4: Criatividade/Marketing → Modelo criativo
-        elif any(keyword in message_lower for keyword in ['criativo', 'marketing', 'copy', 'slogan', 'história', 'poema', 'roteiro']):
-            all_preferred = ["gemini-1.5-pro", "claude-3-5-sonnet", "gpt-4"]
-            preferred_models = [m for m in all_preferred if m in available_model_names]
-            reasoning = "🎨 Conteúdo criativo - priorizando modelos criativos"
+        elif any(keyword in message_lower for keyword in rules["creative_keywords"]):
+            return "creative"
 
         # Regra 5: Padrão → Modelo balanceado
-        else:
-            all_preferred = ["claude-3-haiku", "gpt-4o-mini", "gpt-4"]
-            preferred_models = [m for m in all_preferred if m in available_model_names]
-            reasoning = "⚖️ Caso geral - priorizando modelos balanceados"
-
-        # Escolher o primeiro modelo disponível da lista de preferências
-        if preferred_models:
-            selected_model = preferred_models[0]
-            return selected_model, f"{reasoning} (usando {selected_model})"
-        
+        return "general"
+
+    def categorize(self, message: str) -> Tuple[Optional[str], str]:
+        """
+        🧮 Decide a categoria da mensagem
+        Usa o classificador aprendido quando confiante, senão as regras manuais
+        Retorna (categoria, origem) com origem "classifier" ou "rules"
+        """
+        if self.classifier is not None:
+            return self._accept_prediction(message, *self.classifier.predict(message))
+        return self._categorize_by_rules(message), "rules"
+
+    def _accept_prediction(self, message: str, category: Optional[str], confidence: float) -> Tuple[Optional[str], str]:
+        """Previsão do classificador se confiante e de categoria conhecida, senão as regras"""
+        if confidence >= self.classifier.threshold and category in self.config.routing_categories:
+            return category, "classifier"
+        return self._categorize_by_rules(message), "rules"
+
+    def _select_model(self, category: Optional[str], source: str, available_model_names: List[str],
+                      warm_model: Optional[str] = None, record: bool = True) -> Tuple[str, str]:
+        """
+        Escolhe o primeiro modelo disponível da lista de preferências da categoria
+        Se algum modelo da lista já tem o prefixo do prompt em cache, ele tem prioridade
+        `record=False` não conta métricas (decisões em sombra)
+        """
+        if category is not None:
+            rule = self.config.routing_categories[category]
+            preferred_models = [m for m in rule["preferred"] if m in available_model_names]
+            if preferred_models:
+                selected_model = preferred_models[0]
+                origin = ", via classificador" if source == "classifier" else ""
+                if warm_model in preferred_models:
+                    selected_model = warm_model
+                    origin += ", prefixo em cache"
+                return selected_model, f"{rule['reasoning']} (usando {selected_model}{origin})"
+            # Nenhum preferido com folga/no ar: transborda para o servidor próprio
+            spillover = self._spillover_model(available_model_names)
+            if spillover is not None:
+                if record:
+                    metrics.record_spillover(category, spillover)
+                return spillover, f"🏠 Modelos de '{category}' sem folga ou fora do ar (usando {spillover}, servidor próprio)"
+        elif warm_model in available_model_names:
+            return warm_model, f"♨️ Usando {warm_model} (prefixo do prompt em cache)"
+
         # Fallback: usar o modelo padrão da configuração
         default_model = self.config.default_model
         if default_model in available_model_names:
@@ -108,170 +268,644 @@ class LLMRouter:
         # Se nenhum modelo disponível (não deveria chegar aqui devido à verificação anterior)
         return "error", "❌ Nenhuma chave de API configurada! Configure pelo menos uma chave no arquivo .env"
 
-    async def call_model(self, model: str, message: str, max_tokens: int = 1000, temperature: float = 0.7) -> Tuple[str, int]:
+    def route_request(self, message: str, user_id: str = "anonymous",
+                      prefix_key: Optional[str] = None, record: bool = True,
+                      categorized: Optional[Tuple[Optional[str], str]] = None) -> Tuple[str, str]:
+        """
+        🎯 Coração do roteador - decide qual modelo usar com fallback inteligente
+        Agora usa configuração flexível baseada nas APIs disponíveis
+        `prefix_key` identifica o template do prompt para preferir um cache quente
+        `record=False` decide sem contar métricas (políticas em sombra)
+        `categorized`: resultado de categorize() já calculado pelo chamador
+        """
+        available_models_config = self.get_routable_models()
+        
+        # Se nenhum modelo disponível, retorna erro
+        if not available_models_config:
+            return "error", "❌ Nenhuma API configurada. Configure pelo menos uma chave de API no arquivo .env"
+
+        category, source = categorized or self.categorize(message)
+        return self._route_category(category, source, list(available_models_config.keys()),
+                                    self.prefix_cache.warm_model(prefix_key), record)
+
+    def _route_category(self, category: Optional[str], source: str, names: List[str],
+                        warm_model: Optional[str] = None, record: bool = True) -> Tuple[str, str]:
+        """Decisão a partir da categoria, entre os modelos roteáveis (sob sobrecarga, o mais barato)"""
+        if self.degrade_check is not None and self.degrade_check():
+            degraded = self._degraded_model(category, names)
+            if degraded is not None:
+                return degraded, f"🧯 Roteador sobrecarregado (usando {degraded}, o mais barato e rápido)"
+        return self._select_model(category, source, names, warm_model, record)
+
+    def plan_cascade(self, message: str, selected_model: str,
+                     categorized: Optional[Tuple[Optional[str], str]] = None) -> Optional[Tuple[str, str]]:
+        """
+        🪜 Modelo barato a tentar antes de `selected_model` (ou None)
+        Só nas categorias com cascata ativa no catálogo e quando há um modelo mais barato
+        """
+        cascade = self.config.cascade
+        if not cascade.get("enabled"):
+            return None
+        # Sob sobrecarga nada de segunda chamada: o modelo já é o barato
+        if self.degrade_check is not None and self.degrade_check():
+            return None
+        category, _ = categorized or self.categorize(message)
+        if category not in cascade.get("categories", ()):
+            return None
+        available = self.get_routable_models()
+        candidates = [m for m in self.config.routing_categories[category]["preferred"] if m in available]
+        if not candidates or selected_model not in available:
+            return None
+        cost = lambda m: self.config.models[m]["cost_per_1k_tokens"]
+        cheap_model = min(candidates, key=cost)
+        if cost(cheap_model) >= cost(selected_model):
+            return None
+        return cheap_model, category
+
+    async def call_with_cascade(self, cheap_model: str, premium_model: str, category: str,
+                                **call_kwargs) -> List[Attempt]:
+        """
+        Chama o modelo barato e só escala para o premium se a checagem reprovar
+        Devolve todas as tentativas, na ordem
+        """
+        cascade = self.config.cascade
+        use_logprobs = bool(cascade.get("use_logprobs"))
+        start = time.monotonic()
+        first = await self.call_model(cheap_model, logprobs=use_logprobs, category=category, **call_kwargs)
+        elapsed = time.monotonic() - start
+        failure = "erro" if first.error else check_answer(first.text, first.avg_logprob, cascade)
+        cheap_cost = self.result_cost(cheap_model, first)
+        if failure is None:
+            # Economia estimada: o mesmo volume de tokens no modelo premium
+            saved = self.calculate_cost(premium_model, first.tokens_used) - cheap_cost
+            self.cascade_stats.record(category, None, saved, 0.0)
+            return [Attempt(cheap_model, first, None, elapsed)]
+        logger.info(f"🪜 {cheap_model} reprovado ({failure}), escalando para {premium_model}")
+        start = time.monotonic()
+        second = await self.call_model(premium_model, category=category, **call_kwargs)
+        self.cascade_stats.record(category, failure, -cheap_cost, elapsed)
+        return [Attempt(cheap_model, first, failure, elapsed),
+                Attempt(premium_model, second, None, time.monotonic() - start)]
+
+    def route_batch(self, messages: List[str]) -> List[Tuple[str, str]]:
+        """
+        📦 Roteia um lote de mensagens de uma vez
+        Com classificador, a pontuação é vetorizada; as de baixa confiança caem nas regras
+        """
+        available_models_config = self.get_routable_models()
+        if not available_models_config:
+            return [self.route_request(message) for message in messages]
+
+        # Mesmos filtros e sobrecarga do route_request; os modelos roteáveis saem uma vez só
+        names = list(available_models_config.keys())
+        if self.classifier is not None:
+            categorized = [self._accept_prediction(message, *prediction)
+                           for message, prediction in zip(messages, self.classifier.predict_batch(messages))]
+        else:
+            categorized = [(self._categorize_by_rules(message), "rules") for message in messages]
+        return [self._route_category(category, source, names) for category, source in categorized]
+
+    async def call_model(self, model: str, message: Optional[str] = None, max_tokens: int = 1000,
+                         temperature: float = 0.7, messages: Optional[List[Message]] = None,
+                         system: Optional[str] = None, logprobs: bool = False,
+                         category: Optional[str] = None) -> ModelResult:
         """
         📡 Faz a chamada real para o modelo escolhido
+        Aceita uma mensagem simples ou a conversa completa (`messages`) + system prompt
+        `logprobs` pede a média dos logprobs da saída (ignorado por quem não suporta)
+        `category` (categoria de roteamento) liga o max_tokens previsto, se configurado
         """
         model_config = self.config.models.get(model)
         if not model_config:
             raise ValueError(f"Modelo {model} não configurado")
 
-        provider = model_config["provider"]
-        
+        if messages is None:
+            messages = normalize_messages(message)
+        if category is not None and self.output_budget is not None and max_tokens:
+            result = await self._call_with_budget(model, category, messages, system, max_tokens, temperature, logprobs)
+        else:
+            result = await self._call_once(model, messages, system, max_tokens, temperature, logprobs)
+        # Uma requisição do cliente conta uma vez, mesmo que o teto tenha gerado continuações
+        self.count_call(model)
+        return result
+
+    async def _call_once(self, model: str, messages: List[Message], system: Optional[str],
+                         max_tokens: int, temperature: float, logprobs: bool = False) -> ModelResult:
+        """Uma chamada ao provedor, sem contabilidade; erro vira resposta simulada (exceto prazo)"""
+        provider = self.config.models[model]["provider"]
         try:
-            if provider == "openai":
-                response_text, tokens_used = await self._call_openai(model, message, max_tokens, temperature)
-            elif provider == "anthropic":
-                response_text, tokens_used = await self._call_anthropic(model, message, max_tokens, temperature)
-            elif provider == "google":
-                response_text, tokens_used = await self._call_google(model, message, max_tokens, temperature)
-            else:
-                raise ValueError(f"Provider {provider} não implementado")
-                
+            # O prazo do cliente vale aqui: estourou, a chamada é cancelada
+            with profiling.span("upstream"):
+                result = await within_deadline(
+                    self._call_provider(provider, model, messages, system, max_tokens, temperature, logprobs)
+                )
+        except DeadlineExceeded:
+            # Não vira resposta simulada: quem chamou devolve 504
+            logger.warning(f"⏳ Prazo esgotado chamando {model}")
+            raise
         except Exception as e:
             logger.error(f"Erro ao chamar {model}: {e}")
             # Fallback para simulação em caso de erro
             await asyncio.sleep(0.5)
-            response_text = f"⚠️ [ERRO] Não foi possível conectar com {model}. Verifique sua chave de API."
-            tokens_used = len(message.split()) * 2
+            prompt_text = conversation_text(messages, system)
+            result = ModelResult(
+                text=f"⚠️ [ERRO] Não foi possível conectar com {model}. Verifique sua chave de API.",
+                tokens_used=len(prompt_text.split()) * 2,
+                error=str(e)
+            )
+        return result
+
+    async def _call_with_budget(self, model: str, category: str, messages: List[Message],
+                                system: Optional[str], max_tokens: int, temperature: float,
+                                logprobs: bool) -> ModelResult:
+        """
+        📐 Chama com o teto previsto; cortada nele, a resposta é continuada
+        (o max_tokens do cliente continua sendo o limite da saída somada)
+        """
+        budget = self.output_budget
+        cap = budget.suggest(category, model, max_tokens)
+        first = await self._call_once(model, messages, system, cap, temperature, logprobs)
+        if first.error:
+            return first
+        prefill = self.config.models[model]["provider"] == "anthropic"
+        truncated = cap < max_tokens and is_truncated(first.finish_reason)
+        parts, text = [first], first.text
+        while (is_truncated(parts[-1].finish_reason) and len(parts) <= budget.max_continuations
+               and sum(p.output_tokens for p in parts) < max_tokens and cap < max_tokens):
+            if prefill:
+                # Anthropic continua a própria resposta (prefill), que não pode terminar em espaço
+                text = text.rstrip()
+                continuation = messages + [{"role": "assistant", "content": [text_part(text)]}]
+            else:
+                continuation = messages + [
+                    {"role": "assistant", "content": [text_part(text)]},
+                    {"role": "user", "content": [text_part("Continue exatamente de onde parou, sem repetir nada.")]},
+                ]
+            result = await self._call_once(model, continuation, system,
+                                           max_tokens - sum(p.output_tokens for p in parts), temperature)
+            if result.error:
+                logger.warning(f"📐 Continuação de {model} falhou, devolvendo a resposta cortada: {result.error}")
+                break
+            parts.append(result)
+            text += result.text
+        extra = parts[1:]
+        merged = ModelResult(
+            text=text,
+            tokens_used=sum(p.tokens_used for p in parts),
+            input_tokens=sum(p.input_tokens for p in parts),
+            output_tokens=sum(p.output_tokens for p in parts),
+            cached_tokens=sum(p.cached_tokens for p in parts),
+            cache_write_tokens=sum(p.cache_write_tokens for p in parts),
+            finish_reason=parts[-1].finish_reason,
+            avg_logprob=first.avg_logprob,
+        )
+        budget.record(category, model, max_tokens, cap, merged.output_tokens, truncated,
+                      len(extra), sum(p.input_tokens for p in extra))
+        return merged
 
-        # Atualizar estatísticas
+    def count_call(self, model: str):
+        """Atualiza as estatísticas de uso (chamadas feitas por fora do call_model também contam)"""
         self.stats["total_requests"] += 1
         self.stats["model_usage"][model] = self.stats["model_usage"].get(model, 0) + 1
 
-        return response_text, tokens_used
+    async def _call_provider(self, provider: str, model: str, messages: List[Message],
+                             system: Optional[str], max_tokens: int, temperature: float,
+                             logprobs: bool = False) -> ModelResult:
+        # Provedor local ou marcado "openai_compatible" usa o mesmo adaptador da OpenAI
+        api = provider if provider in ("anthropic", "google") else "openai" if self.is_openai_compatible(model) else None
+        if api is None:
+            raise ValueError(f"Provider {provider} não implementado")
+        endpoints = self.config.get_endpoints(model)
+        if not endpoints:
+            raise ValueError(f"Chave de {provider} não configurada")
+        # ⚖️ Endpoint escolhido pelo balanceador; 🔑 dentro dele, a chave menos carregada.
+        # 429 põe a chave em cooldown e a chamada é refeita com outra chave livre
+        # (ou noutro endpoint); 5xx/erro de rede é refeito noutro endpoint ainda não tentado
+        tokens = estimate_tokens(conversation_text(messages, system)) + max_tokens
+        tried: List[str] = []
+        attempts = max(len(e["keys"]) for e in endpoints) + len(endpoints) - 1
+        for attempt in range(attempts):
+            with self.endpoints.pick(model, endpoints, exclude=tried) as pick:
+                endpoint = pick.endpoint
+                keys = endpoint["keys"]
+                await self.throttle.pace(endpoint["pool"], keys, tokens)
+                pick.started = time.monotonic()  # a espera do ritmo não conta como latência do endpoint
+                with self.key_pools.lease(endpoint["pool"], keys) as lease:
+                    try:
+                        if api == "openai":
+                            # logprobs só na API da OpenAI: servidores compatíveis podem recusar o campo
+                            result = await self._call_openai(model, messages, system, max_tokens, temperature,
+                                                             lease, endpoint["base_url"],
+                                                             logprobs and provider == "openai")
+                        elif api == "anthropic":
+                            result = await self._call_anthropic(model, messages, system, max_tokens, temperature,
+                                                                lease, endpoint["base_url"])
+                        else:
+                            result = await self._call_google(model, messages, system, max_tokens, temperature,
+                                                             lease, endpoint["base_url"])
+                    except Exception:
+                        pick.fail(lease.status)
+                        if attempt + 1 < attempts and self._retry_elsewhere(model, pick, lease, endpoints, tried):
+                            continue
+                        raise
+                    lease.tokens = result.tokens_used
+            return result
+
+    async def call_with_key(self, pool: str, keys, tokens: int, call: Callable[[KeyLease], Awaitable[Any]]):
+        """
+        🔑 Ritmo + chave do pool para chamadas fora do chat (ex.: embeddings), como em _call_provider:
+        espera a vez no balde do provedor e, em 429, refaz com outra chave livre
+        """
+        for attempt in range(max(1, len(keys))):
+            await self.throttle.pace(pool, keys, tokens)
+            with self.key_pools.lease(pool, keys) as lease:
+                try:
+                    return await call(lease)
+                except Exception:
+                    if attempt + 1 < len(keys) and lease.status == 429 and self.key_pools.has_ready(keys):
+                        logger.warning(f"🔑 {pool}: chave {lease.state.label} limitada (429), tentando outra")
+                        continue
+                    raise
+
+    def _retry_elsewhere(self, model: str, pick, lease: KeyLease, endpoints, tried: List[str]) -> bool:
+        """
+        A chamada que falhou pode ser refeita? 429 com outra chave livre no mesmo endpoint,
+        ou 429/5xx/erro de rede com outro endpoint ainda não tentado (vai para `tried`)
+        """
+        endpoint = pick.endpoint
+        if lease.status == 429 and self.key_pools.has_ready(endpoint["keys"]):
+            logger.warning(f"🔑 {endpoint['pool']}: chave {lease.state.label} limitada (429), tentando outra")
+            return True
+        if (lease.status == 429 or pick.endpoint_failure) and len(tried) + 1 < len(endpoints):
+            logger.warning(f"⚖️ {model}: endpoint {endpoint['name']} falhou "
+                           f"({lease.status or 'sem resposta'}), tentando outro")
+            tried.append(endpoint["name"])
+            return True
+        return False
+
+    def is_openai_compatible(self, model: str) -> bool:
+        """Provedor que fala o /chat/completions da OpenAI (o /v1 repassa os bytes direto)"""
+        provider = self.config.models[model]["provider"]
+        return provider == "openai" or bool(self.config.get_provider(provider).get("openai_compatible"))
+
+    @asynccontextmanager
+    async def open_upstream(self, model: str, tokens: int, build_request: Callable[[Any, str], Any]):
+        """
+        🔀 Abre a resposta do provedor em streaming, no endpoint e chave escolhidos
+        `build_request(endpoint, key)` monta o httpx.Request; 429/5xx antes do corpo
+        são refeitos noutra chave/endpoint como em _call_provider (a última resposta,
+        mesmo de erro, é entregue). Quem chama lê o corpo dentro do `async with`
+        """
+        endpoints = self.config.get_endpoints(model)
+        if not endpoints:
+            raise ValueError(f"Chave de {self.config.models[model]['provider']} não configurada")
+        client = self.get_client()
+        tried: List[str] = []
+        attempts = max(len(e["keys"]) for e in endpoints) + len(endpoints) - 1
+        for attempt in range(attempts):
+            with self.endpoints.pick(model, endpoints, exclude=tried) as pick:
+                endpoint = pick.endpoint
+                await self.throttle.pace(endpoint["pool"], endpoint["keys"], tokens)
+                pick.started = time.monotonic()
+                with self.key_pools.lease(endpoint["pool"], endpoint["keys"]) as lease:
+                    try:
+                        # Só até os cabeçalhos: o corpo é lido por quem chama, também dentro do prazo
+                        response = await within_deadline(
+                            client.send(build_request(endpoint, lease.key), stream=True))
+                    except DeadlineExceeded:
+                        raise
+                    except Exception:
+                        pick.fail(None)
+                        if attempt + 1 < attempts and self._retry_elsewhere(model, pick, lease, endpoints, tried):
+                            continue
+                        raise
+                    lease.observe(response)
+                    if response.status_code != 200:
+                        pick.fail(response.status_code)
+                        if attempt + 1 < attempts and self._retry_elsewhere(model, pick, lease, endpoints, tried):
+                            await response.aclose()
+                            continue
+                    try:
+                        yield response, lease
+                    finally:
+                        await response.aclose()
+                return
+
+    async def stream_model(self, model: str, messages: List[Message], system: Optional[str],
+                           max_tokens: int, temperature: float) -> AsyncIterator[Union[str, ModelResult]]:
+        """
+        🌊 Resposta em streaming de Anthropic/Google: rende trechos de texto e,
+        por último, o ModelResult com o uso. Erro do provedor vira exceção antes do primeiro trecho
+        """
+        provider = self.config.models[model]["provider"]
+        if provider == "anthropic":
+            payload = {**self.anthropic_payload(model, messages, system, max_tokens, temperature), "stream": True}
+            build = lambda endpoint, key: self.get_client().build_request(
+                "POST", f"{endpoint['base_url']}/messages", content=jsoncodec.dumps(payload),
+                headers={"x-api-key": key, "Content-Type": "application/json", "anthropic-version": "2023-06-01"})
+        elif provider == "google":
+            payload = self.google_payload(model, messages, system, max_tokens, temperature)
+            api_model = self.config.models[model]["api_model"]
+            build = lambda endpoint, key: self.get_client().build_request(
+                "POST", f"{endpoint['base_url']}/models/{api_model}:streamGenerateContent?alt=sse&key={key}",
+                content=jsoncodec.dumps(payload), headers={"Content-Type": "application/json"})
+        else:
+            raise ValueError(f"Streaming traduzido não implementado para {provider}")
+
+        tokens = estimate_tokens(conversation_text(messages, system)) + max_tokens
+        async with self.open_upstream(model, tokens, build) as (response, lease):
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"{provider} API erro {response.status_code}: {response.text}")
+            texts: List[str] = []
+            usage: Dict[str, Any] = {}
+            finish_reason = None
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = jsoncodec.loads(line[5:])
+                if provider == "anthropic":
+                    kind = event.get("type")
+                    if kind == "message_start":
+                        usage.update(event["message"].get("usage") or {})
+                    elif kind == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                        texts.append(event["delta"]["text"])
+                        yield event["delta"]["text"]
+                    elif kind == "message_delta":
+                        usage.update(event.get("usage") or {})
+                        finish_reason = event.get("delta", {}).get("stop_reason") or finish_reason
+                    elif kind == "error":
+                        raise Exception(f"Anthropic API erro no stream: {event.get('error')}")
+                else:
+                    candidate = (event.get("candidates") or [{}])[0]
+                    text = "".join(p.get("text", "") for p in (candidate.get("content") or {}).get("parts", []))
+                    if text:
+                        texts.append(text)
+                        yield text
+                    finish_reason = candidate.get("finishReason") or finish_reason
+                    usage = event.get("usageMetadata") or usage
+            if provider == "anthropic":
+                result = self.parse_anthropic({"content": [{"text": "".join(texts)}],
+                                               "usage": {"input_tokens": 0, "output_tokens": 0, **usage},
+                                               "stop_reason": finish_reason})
+            else:
+                result = self.parse_google({"candidates": [{"content": {"parts": [{"text": "".join(texts)}]},
+                                                            "finishReason": finish_reason}],
+                                            "usageMetadata": usage or None}, messages, system)
+            lease.tokens = result.tokens_used
+        self.count_call(model)
+        yield result
 
-    async def _call_openai(self, model: str, message: str, max_tokens: int, temperature: float) -> Tuple[str, int]:
+    async def _call_openai(self, model: str, messages: List[Message], system: Optional[str],
+                           max_tokens: int, temperature: float, lease: KeyLease, base_url: str,
+                           logprobs: bool = False) -> ModelResult:
         """
         🤖 Chama a API da OpenAI
+        O cache de prompt da OpenAI é automático para prefixos longos e idênticos
         """
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key or api_key == "sk-...":
-            raise ValueError("Chave da OpenAI não configurada")
-            
         headers = {
-            "Authorization": f"Bearer {api_key}",
+            **bearer_headers(lease.key),
             "Content-Type": "application/json"
         }
         
-        # Mapear modelo para nome da API
-        api_model = "gpt-4" if model == "gpt-4" else "gpt-4o-mini"
+        payload = self.openai_payload(model, messages, system, max_tokens, temperature, logprobs)
         
-        payload = {
-            "model": api_model,
-            "messages": [{"role": "user", "content": message}],
-            "max_tokens": max_tokens,
-            "temperature": temperature
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
+        response = await self.get_client().post(
+            f"{base_url}/chat/completions",
+            headers=headers,
+            content=jsoncodec.dumps(payload),
+            extensions=profiling.httpx_extensions()
+        )
+        lease.observe(response)
             
         if response.status_code != 200:
             raise Exception(f"OpenAI API erro {response.status_code}: {response.text}")
             
-        data = response.json()
-        response_text = data["choices"][0]["message"]["content"]
-        tokens_used = data["usage"]["total_tokens"]
+        with profiling.span("parse"):
+            data = jsoncodec.loads(response.content)
+        return self.parse_openai(data)
+
+    def openai_payload(self, model: str, messages: List[Message], system: Optional[str],
+                       max_tokens: int, temperature: float, logprobs: bool = False) -> Dict[str, Any]:
+        """Corpo do /chat/completions (também usado nas linhas da Batch API)"""
+        api_model = self.config.models[model]["api_model"]
         
-        return response_text, tokens_used
+        # System prompt primeiro: o prefixo estável precisa vir antes do que muda
+        openai_messages = [{"role": "system", "content": system}] if system else []
+        for m in messages:
+            parts = [{"type": "text", "text": p["text"]} for p in m["content"]]
+            content = parts[0]["text"] if len(parts) == 1 else parts
+            openai_messages.append({"role": m["role"], "content": content})
+        
+        payload = {
+            "model": api_model,
+            "messages": openai_messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        if logprobs:
+            payload["logprobs"] = True
+        return payload
 
-    async def _call_anthropic(self, model: str, message: str, max_tokens: int, temperature: float) -> Tuple[str, int]:
+    @staticmethod
+    def parse_openai(data: Dict[str, Any]) -> ModelResult:
+        usage = data["usage"]
+        token_logprobs = [t["logprob"] for t in ((data["choices"][0].get("logprobs") or {}).get("content") or [])]
+        return ModelResult(
+            text=data["choices"][0]["message"]["content"],
+            tokens_used=usage["total_tokens"],
+            input_tokens=usage.get("prompt_tokens", 0),
+            output_tokens=usage.get("completion_tokens", 0),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            finish_reason=data["choices"][0].get("finish_reason"),
+            avg_logprob=sum(token_logprobs) / len(token_logprobs) if token_logprobs else None
+        )
+
+    async def _call_anthropic(self, model: str, messages: List[Message], system: Optional[str],
+                              max_tokens: int, temperature: float, lease: KeyLease, base_url: str) -> ModelResult:
         """
         🧠 Chama a API da Anthropic (Claude)
+        Marca prefixos estáveis com cache_control para reaproveitar o cache de prompt
         """
-        api_key = os.getenv("ANTHROPIC_API_KEY")
-        if not api_key or api_key == "sk-ant-...":
-            raise ValueError("Chave da Anthropic não configurada")
-            
         headers = {
-            "x-api-key": api_key,
+            "x-api-key": lease.key,
             "Content-Type": "application/json",
             "anthropic-version": "2023-06-01"
         }
         
-        # Mapear modelo para nome da API
-        api_model = "claude-3-haiku-20240307" if model == "claude-3-haiku" else "claude-3-5-sonnet-20241022"
+        payload = self.anthropic_payload(model, messages, system, max_tokens, temperature)
         
-        payload = {
-            "model": api_model,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "messages": [{"role": "user", "content": message}]
-        }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://api.anthropic.com/v1/messages",
-                headers=headers,
-                json=payload
-            )
+        response = await self.get_client().post(
+            f"{base_url}/messages",
+            headers=headers,
+            content=jsoncodec.dumps(payload),
+            extensions=profiling.httpx_extensions()
+        )
+        lease.observe(response)
             
         if response.status_code != 200:
             raise Exception(f"Anthropic API erro {response.status_code}: {response.text}")
             
-        data = response.json()
-        response_text = data["content"][0]["text"]
-        tokens_used = data["usage"]["input_tokens"] + data["usage"]["output_tokens"]
-        
-        return response_text, tokens_used
+        with profiling.span("parse"):
+            data = jsoncodec.loads(response.content)
+        return self.parse_anthropic(data)
+
+    def anthropic_payload(self, model: str, messages: List[Message], system: Optional[str],
+                          max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """Corpo do /messages (também usado nos `params` da Message Batches API)"""
+        payload = {
+            "model": self.config.models[model]["api_model"],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "messages": self._anthropic_messages(messages)
+        }
+        if system:
+            payload["system"] = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        return payload
+
+    @staticmethod
+    def parse_anthropic(data: Dict[str, Any]) -> ModelResult:
+        usage = data["usage"]
+        # Na Anthropic, input_tokens NÃO inclui os tokens lidos/gravados no cache
+        cached_tokens = usage.get("cache_read_input_tokens") or 0
+        cache_write_tokens = usage.get("cache_creation_input_tokens") or 0
+        input_tokens = usage["input_tokens"] + cached_tokens + cache_write_tokens
+        return ModelResult(
+            text=data["content"][0]["text"],
+            tokens_used=input_tokens + usage["output_tokens"],
+            input_tokens=input_tokens,
+            output_tokens=usage["output_tokens"],
+            cached_tokens=cached_tokens,
+            cache_write_tokens=cache_write_tokens,
+            finish_reason=data.get("stop_reason")
+        )
+
+    @staticmethod
+    def _anthropic_messages(messages: List[Message]) -> List[Dict[str, Any]]:
+        """
+        Converte para o formato da Anthropic com breakpoints de cache
+        (máximo de 4 por requisição, um já reservado ao system prompt):
+        partes marcadas pelo cliente e o fim do histórico antes do último turno
+        """
+        breakpoints_left = 3
+        converted = []
+        for index, m in enumerate(messages):
+            blocks = []
+            for part in m["content"]:
+                block = {"type": "text", "text": part["text"]}
+                if part.get("cache") and breakpoints_left > 1:
+                    block["cache_control"] = {"type": "ephemeral"}
+                    breakpoints_left -= 1
+                blocks.append(block)
+            if index == len(messages) - 2 and breakpoints_left and "cache_control" not in blocks[-1]:
+                # Tudo até o penúltimo turno é estável na próxima chamada da conversa
+                blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            converted.append({"role": m["role"], "content": blocks})
+        return converted
 
-    async def _call_google(self, model: str, message: str, max_tokens: int, temperature: float) -> Tuple[str, int]:
+    async def _call_google(self, model: str, messages: List[Message], system: Optional[str],
+                           max_tokens: int, temperature: float, lease: KeyLease, base_url: str) -> ModelResult:
         """
         🌟 Chama a API do Google (Gemini)
         """
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key or api_key == "...":
-            raise ValueError("Chave do Google não configurada")
-            
         headers = {
             "Content-Type": "application/json"
         }
         
-        # Mapear modelo para nome da API
-        api_model = "gemini-1.5-pro"
+        api_model = self.config.models[model]["api_model"]
+        payload = self.google_payload(model, messages, system, max_tokens, temperature)
         
+        response = await self.get_client().post(
+            f"{base_url}/models/{api_model}:generateContent?key={lease.key}",
+            headers=headers,
+            content=jsoncodec.dumps(payload),
+            extensions=profiling.httpx_extensions()
+        )
+        lease.observe(response)
+            
+        if response.status_code != 200:
+            raise Exception(f"Google API erro {response.status_code}: {response.text}")
+            
+        with profiling.span("parse"):
+            data = jsoncodec.loads(response.content)
+        return self.parse_google(data, messages, system)
+
+    def google_payload(self, model: str, messages: List[Message], system: Optional[str],
+                       max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """Corpo do :generateContent (e do :streamGenerateContent)"""
         payload = {
-            "contents": [{
-                "parts": [{"text": message}]
-            }],
+            "contents": [
+                {
+                    "role": "model" if m["role"] == "assistant" else "user",
+                    "parts": [{"text": p["text"]} for p in m["content"]]
+                }
+                for m in messages
+            ],
             "generationConfig": {
                 "maxOutputTokens": max_tokens,
                 "temperature": temperature
             }
         }
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"https://generativelanguage.googleapis.com/v1beta/models/{api_model}:generateContent?key={api_key}",
-                headers=headers,
-                json=payload
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        return payload
+
+    @staticmethod
+    def parse_google(data: Dict[str, Any], messages: List[Message], system: Optional[str]) -> ModelResult:
+        candidate = data["candidates"][0]
+        response_text = candidate["content"]["parts"][0]["text"]
+        usage = data.get("usageMetadata")
+        if usage:
+            return ModelResult(
+                text=response_text,
+                tokens_used=usage.get("totalTokenCount", 0),
+                input_tokens=usage.get("promptTokenCount", 0),
+                output_tokens=usage.get("candidatesTokenCount", 0),
+                cached_tokens=usage.get("cachedContentTokenCount", 0),
+                finish_reason=candidate.get("finishReason")
             )
-            
-        if response.status_code != 200:
-            raise Exception(f"Google API erro {response.status_code}: {response.text}")
-            
-        data = response.json()
-        response_text = data["candidates"][0]["content"]["parts"][0]["text"]
-        # Estimativa de tokens (Google não retorna contagem exata)
-        tokens_used = len(message.split()) + len(response_text.split())
-        
-        return response_text, tokens_used
+        # Estimativa de tokens (respostas antigas não trazem usageMetadata)
+        input_tokens = len(conversation_text(messages, system).split())
+        output_tokens = len(response_text.split())
+        return ModelResult(
+            text=response_text,
+            tokens_used=input_tokens + output_tokens,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            finish_reason=candidate.get("finishReason")
+        )
 
-    def calculate_cost(self, model: str, tokens_used: int) -> float:
-        """💰 Calcula o custo estimado da chamada"""
+    def calculate_cost(self, model: str, tokens_used: int, cached_tokens: int = 0,
+                       cache_write_tokens: int = 0) -> float:
+        """
+        💰 Calcula o custo estimado da chamada
+        Tokens lidos do cache e gravados no cache têm preço próprio (multiplicadores do catálogo)
+        """
         model_config = self.config.models.get(model, {})
         cost_per_1k = model_config.get("cost_per_1k_tokens", 0.001)
-        return (tokens_used / 1000) * cost_per_1k
+        regular_tokens = max(0, tokens_used - cached_tokens - cache_write_tokens)
+        billed_tokens = (
+            regular_tokens
+            + cached_tokens * model_config.get("cached_input_multiplier", 1.0)
+            + cache_write_tokens * model_config.get("cache_write_multiplier", 1.0)
+        )
+        return (billed_tokens / 1000) * cost_per_1k
+
+    def result_cost(self, model: str, result: ModelResult) -> float:
+        """💰 Custo de um ModelResult (considera os tokens de cache)"""
+        return self.calculate_cost(model, result.tokens_used, result.cached_tokens, result.cache_write_tokens)
+
+    def batch_cost(self, model: str, result: ModelResult) -> float:
+        """💰 Custo pela Batch API: preço normal com o desconto do provedor (`batch_cost_multiplier`)"""
+        provider = self.config.get_provider(self.config.models[model]["provider"])
+        return self.result_cost(model, result) * provider.get("batch_cost_multiplier", 1.0)
 
     def get_stats(self) -> Dict[str, Any]:
         """📊 Retorna estatísticas de uso"""
         return {
             **self.stats,
+            "cascade": self.cascade_stats.snapshot(),
+            "max_tokens": self.output_budget.snapshot() if self.output_budget is not None else None,
             "timestamp": datetime.now().isoformat(),
             "most_used_model": max(self.stats["model_usage"], key=self.stats["model_usage"].get) if self.stats["model_usage"] else None
         }
@@ -0,0 +1,12 @@
+"""
+🧰 Ferramentas de linha de comando do RouterLLM
+Uso: python -m routerllm.<ferramenta> (ex.: python -m routerllm.bulk)
+"""
+
+import os
+import sys
+
+# Os módulos do roteador (router, config, ...) ficam na raiz do repositório
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
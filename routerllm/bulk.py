@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+📦 Processamento em massa de prompts, sem HTTP
+Lê um JSONL de ChatRequest sob demanda, roteia e chama os modelos no
+próprio processo com concorrência assíncrona e grava as respostas na
+ordem da entrada. O progresso fica num checkpoint ao lado da saída:
+se o processo cair, rodar o mesmo comando continua de onde parou.
+
+    python -m routerllm.bulk entrada.jsonl saida.jsonl --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from routerllm import _ROOT  # noqa: F401  (garante os módulos da raiz no sys.path)
+
+from config import RouterConfig
+from conversation import last_user_text, normalize_messages
+from deadlines import DeadlineExceeded, deadline_scope
+from router import LLMRouter
+
+logger = logging.getLogger("routerllm.bulk")
+
+class Checkpoint:
+    """
+    💾 Posição segura para retomar: itens gravados, bytes da saída e da entrada
+    Gravado de forma atômica e só depois do fsync da saída
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, state: Dict[str, Any]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+class Progress:
+    """📈 Vazão, custo e ETA (pela fração dos bytes da entrada já lida)"""
+
+    def __init__(self, total_bytes: int, start_bytes: int, done: int, cost: float, errors: int):
+        self.total_bytes = total_bytes
+        self.start_bytes = start_bytes
+        self.start_done = done
+        self.done = done
+        self.cost = cost
+        self.errors = errors
+        self.bytes_done = start_bytes
+        self.started_at = time.monotonic()
+        self._last_render = 0.0
+        self._tty = sys.stderr.isatty()
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.started_at, 1e-6)
+        rate = (self.done - self.start_done) / elapsed
+        byte_rate = (self.bytes_done - self.start_bytes) / elapsed
+        remaining = self.total_bytes - self.bytes_done
+        eta = _format_duration(remaining / byte_rate) if byte_rate > 0 else "--:--:--"
+        percent = self.bytes_done / self.total_bytes * 100 if self.total_bytes else 100.0
+        return (f"📦 {self.done} itens ({percent:.1f}%) | {rate:.1f} itens/s | "
+                f"💰 ${self.cost:.4f} | ❌ {self.errors} erros | ETA {eta}")
+
+    def render(self, force: bool = False):
+        now = time.monotonic()
+        # No terminal atualiza a mesma linha; em log (pipe), uma linha a cada 10 s
+        interval = 0.5 if self._tty else 10.0
+        if not force and now - self._last_render < interval:
+            return
+        self._last_render = now
+        if self._tty:
+            sys.stderr.write(f"\r{self.line()}\033[K")
+        else:
+            sys.stderr.write(f"{self.line()}\n")
+        sys.stderr.flush()
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+# Campos do ChatRequest que o bulk usa, com o tipo esperado
+FIELD_TYPES = {
+    "message": str,
+    "system": str,
+    "user_id": str,
+    "force_model": str,
+    "max_tokens": int,
+    "temperature": (int, float),
+}
+
+def parse_item(line: bytes):
+    """Linha do JSONL → (item, mensagens); ValueError se não for um ChatRequest válido"""
+    item = json.loads(line)
+    if not isinstance(item, dict):
+        raise ValueError("cada linha deve ser um objeto JSON")
+    for field, expected in FIELD_TYPES.items():
+        if item.get(field) is not None and not isinstance(item[field], expected):
+            raise ValueError(f"'{field}' com tipo inválido")
+    if item.get("messages") is not None and not isinstance(item["messages"], list):
+        raise ValueError("'messages' deve ser uma lista")
+    try:
+        messages = normalize_messages(item.get("message"), item.get("messages"))
+    except (TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"'messages' mal formado ({type(e).__name__}: {e})") from e
+    if not messages:
+        raise ValueError("Informe 'message' ou 'messages'")
+    return item, messages
+
+async def process_item(router: LLMRouter, line: bytes, index: int,
+                       timeout: Optional[float]) -> Dict[str, Any]:
+    """Mesmo caminho do /chat (rotear + chamar), direto no processo"""
+    try:
+        item, messages = parse_item(line)
+    except ValueError as e:
+        return {"index": index, "error": f"linha inválida: {e}"}
+
+    output: Dict[str, Any] = {"index": index}
+    if "id" in item:
+        output["id"] = item["id"]
+    forced = item.get("force_model")
+    if forced and forced in router.config.get_available_models():
+        model, reasoning = forced, f"Modelo forçado pelo usuário: {forced}"
+    else:
+        model, reasoning = router.route_request(last_user_text(messages), item.get("user_id") or "anonymous")
+    if model == "error":
+        return {**output, "error": reasoning}
+
+    try:
+        with deadline_scope(timeout):
+            result = await router.call_model(
+                model,
+                messages=messages,
+                system=item.get("system"),
+                max_tokens=item.get("max_tokens") or 1000,
+                temperature=item.get("temperature", 0.7),
+            )
+    except DeadlineExceeded:
+        return {**output, "model_used": model, "error": "prazo esgotado"}
+    return {
+        **output,
+        "model_used": model,
+        "reasoning": reasoning,
+        "response": result.text,
+        "tokens_used": result.tokens_used,
+        "cost_estimate": router.result_cost(model, result),
+        "error": result.error,
+    }
+
+async def run_bulk(input_path: str, output_path: str, concurrency: int = 16,
+                   reorder_window: Optional[int] = None, timeout: Optional[float] = None,
+                   checkpoint_seconds: float = 2.0, restart: bool = False,
+                   router: Optional[LLMRouter] = None) -> Dict[str, Any]:
+    """
+    Processa `input_path` e grava `output_path` na ordem da entrada
+    `reorder_window` limita quantos itens podem estar à frente do próximo a ser
+    gravado (padrão: 4x a concorrência), então a memória não cresce com um item lento
+    """
+    window = reorder_window or concurrency * 4
+    checkpoint = Checkpoint(f"{output_path}.ckpt")
+    state = None if restart or not os.path.exists(output_path) else checkpoint.load()
+    if state is None:
+        state = {"input_offset": 0, "output_bytes": 0, "next_index": 0, "cost": 0.0, "errors": 0,
+                 "completed": False}
+    elif state.get("completed"):
+        print(f"✅ {output_path} já está completo ({state['next_index']} itens). Use --restart para refazer.",
+              file=sys.stderr)
+        return state
+    else:
+        print(f"↩️ Retomando do item {state['next_index']}", file=sys.stderr)
+
+    own_router = router is None
+    if own_router:
+        router = LLMRouter(RouterConfig())
+
+    source = open(input_path, "rb")
+    source.seek(state["input_offset"])
+    # Descarta o que foi escrito depois do último checkpoint (será refeito)
+    sink = open(output_path, "r+b" if state["output_bytes"] else "wb")
+    sink.truncate(state["output_bytes"])
+    sink.seek(state["output_bytes"])
+
+    progress = Progress(os.path.getsize(input_path), state["input_offset"], state["next_index"],
+                        state["cost"], state["errors"])
+    next_read = state["next_index"]
+    next_write = state["next_index"]
+    read_offset = state["input_offset"]
+    pending: Dict[int, tuple] = {}  # índice → (linha de saída, offset da entrada após o item)
+    room = asyncio.Condition()
+    last_checkpoint = time.monotonic()
+
+    def save_checkpoint(completed: bool = False):
+        sink.flush()
+        os.fsync(sink.fileno())
+        state["completed"] = completed
+        checkpoint.save(state)
+
+    def next_line():
+        """Leitura sob demanda: a entrada nunca é carregada inteira"""
+        nonlocal next_read, read_offset
+        while True:
+            line = source.readline()
+            if not line:
+                return None
+            read_offset += len(line)
+            if line.strip():
+                index = next_read
+                next_read += 1
+                return index, line, read_offset
+
+    async def worker():
+        nonlocal next_write, last_checkpoint
+        while True:
+            async with room:
+                # Janela de reordenação cheia: espera o item mais antigo ser gravado
+                await room.wait_for(lambda: next_read < next_write + window)
+                entry = next_line()
+            if entry is None:
+                return
+            index, line, end_offset = entry
+            try:
+                result = await process_item(router, line, index, timeout)
+            except Exception as e:
+                # Um item com problema vira uma linha de erro; nunca para a execução
+                logger.warning(f"Item {index} falhou: {e}")
+                result = {"index": index, "error": f"{type(e).__name__}: {e}"}
+            async with room:
+                pending[index] = (json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n",
+                                  end_offset, result)
+                while next_write in pending:
+                    data, offset, written = pending.pop(next_write)
+                    sink.write(data)
+                    next_write += 1
+                    state["next_index"] = next_write
+                    state["input_offset"] = offset
+                    state["output_bytes"] += len(data)
+                    state["cost"] += written.get("cost_estimate") or 0.0
+                    state["errors"] += 1 if written.get("error") else 0
+                    progress.done, progress.cost, progress.errors = next_write, state["cost"], state["errors"]
+                    progress.bytes_done = offset
+                if time.monotonic() - last_checkpoint >= checkpoint_seconds:
+                    last_checkpoint = time.monotonic()
+                    save_checkpoint()
+                room.notify_all()
+            progress.render()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*workers)
+        save_checkpoint(completed=True)
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if not state["completed"]:
+            save_checkpoint()
+        source.close()
+        sink.close()
+        if own_router:
+            await router.aclose()
+        progress.render(force=True)
+        sys.stderr.write("\n")
+    return state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m routerllm.bulk",
+        description="Processa um JSONL de ChatRequest pelo roteador, sem HTTP, com retomada automática"
+    )
+    parser.add_argument("input", help="JSONL de entrada (um ChatRequest por linha)")
+    parser.add_argument("output", help="JSONL de saída (uma resposta por linha, na ordem da entrada)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="chamadas simultâneas (padrão 16)")
+    parser.add_argument("--window", type=int, default=None,
+                        help="máximo de itens à frente do próximo a gravar (padrão 4x a concorrência)")
+    parser.add_argument("--timeout", type=float, default=None, help="prazo por item, em segundos")
+    parser.add_argument("--checkpoint-seconds", type=float, default=2.0, help="intervalo do checkpoint (padrão 2)")
+    parser.add_argument("--restart", action="store_true", help="ignora o checkpoint e começa do zero")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    # Logs do roteador só para avisos: a linha de progresso fica legível
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper(),
+                        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    started = time.monotonic()
+    try:
+        state = asyncio.run(run_bulk(args.input, args.output, args.concurrency, args.window,
+                                     args.timeout, args.checkpoint_seconds, args.restart))
+    except KeyboardInterrupt:
+        print("⏸️ Interrompido. Rode o mesmo comando para continuar.", file=sys.stderr)
+        sys.exit(130)
+    elapsed = time.monotonic() - started
+    print(f"✅ {state['next_index']} itens em {_format_duration(elapsed)} | "
+          f"💰 ${state['cost']:.4f} | ❌ {state['errors']} erros → {args.output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
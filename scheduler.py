@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+🚦 Faixas de prioridade do RouterLLM
+Separa tráfego interativo (chat da interface) de tráfego em lote na frente
+das chamadas aos provedores: capacidade reservada para o interativo,
+prioridade estrita ou ponderada e envelhecimento para o lote nunca morrer de fome
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional, Tuple
+
+import profiling
+from deadlines import DeadlineExceeded, within_deadline
+from metrics import metrics
+
+INTERACTIVE, BULK = "interactive", "bulk"
+LANES = (INTERACTIVE, BULK)
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'interactive=4,bulk=1' → {'interactive': 4.0, 'bulk': 1.0}"""
+    weights = {INTERACTIVE: 4.0, BULK: 1.0}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        lane, _, value = item.partition("=")
+        if lane in weights and value:
+            weights[lane] = max(float(value), 0.01)
+    return weights
+
+class PriorityScheduler:
+    """
+    Controla quantas chamadas aos provedores rodam ao mesmo tempo (`capacity`)
+    - `reserved_interactive`: fração da capacidade que o lote nunca ocupa
+    - `mode`: "strict" (interativo sempre primeiro) ou "weighted" (round-robin ponderado)
+    - `aging_seconds`: lote esperando mais que isso passa na frente e pode usar a reserva
+    """
+
+    def __init__(self, capacity: int = 32, mode: str = "weighted",
+                 weights: Optional[Dict[str, float]] = None,
+                 reserved_interactive: float = 0.25, aging_seconds: float = 10.0):
+        self.capacity = max(1, capacity)
+        self.mode = mode if mode in ("strict", "weighted") else "weighted"
+        self.weights = weights or parse_weights("")
+        self.reserved_slots = min(self.capacity - 1, int(round(self.capacity * reserved_interactive)))
+        self.aging_seconds = aging_seconds
+        self._waiters: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {lane: deque() for lane in LANES}
+        self._in_use: Dict[str, int] = {lane: 0 for lane in LANES}
+        self._credits: Dict[str, float] = {lane: 0.0 for lane in LANES}
+        self._aging_timer: Optional[asyncio.TimerHandle] = None
+        self.promoted = 0
+
+    @property
+    def in_use(self) -> int:
+        return sum(self._in_use.values())
+
+    def queue_delay(self, lane: str = INTERACTIVE) -> float:
+        """Há quanto tempo (s) o pedido mais antigo da faixa espera vaga (0 sem fila)"""
+        oldest = self._oldest(lane if lane in LANES else INTERACTIVE)
+        return time.monotonic() - oldest[1] if oldest else 0.0
+
+    def _can_run(self, lane: str, promoted: bool) -> bool:
+        if self.in_use >= self.capacity:
+            return False
+        if lane == BULK and not promoted:
+            return self._in_use[BULK] < self.capacity - self.reserved_slots
+        return True
+
+    def _oldest(self, lane: str) -> Optional[Tuple[asyncio.Future, float]]:
+        waiters = self._waiters[lane]
+        # Futures cancelados (cliente desistiu) são descartados aqui
+        while waiters and waiters[0][0].done():
+            waiters.popleft()
+        return waiters[0] if waiters else None
+
+    def _pick_lane(self, now: float) -> Optional[Tuple[str, bool]]:
+        candidates = []
+        for lane in LANES:
+            oldest = self._oldest(lane)
+            if oldest is None:
+                continue
+            promoted = lane == BULK and now - oldest[1] >= self.aging_seconds
+            if self._can_run(lane, promoted):
+                candidates.append((lane, promoted))
+        if not candidates:
+            return None
+        for lane, promoted in candidates:
+            if promoted:
+                return lane, True
+        if len(candidates) == 1 or self.mode == "strict":
+            return candidates[0]
+        # Round-robin ponderado suave (estilo nginx)
+        total = sum(self.weights[lane] for lane, _ in candidates)
+        for lane, _ in candidates:
+            self._credits[lane] += self.weights[lane]
+        best = max(candidates, key=lambda c: self._credits[c[0]])
+        self._credits[best[0]] -= total
+        return best
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while True:
+            picked = self._pick_lane(now)
+            if picked is None:
+                break
+            lane, promoted = picked
+            future, enqueued_at = self._waiters[lane].popleft()
+            self._in_use[lane] += 1
+            if promoted:
+                self.promoted += 1
+            future.set_result(None)
+            metrics.record_lane_wait(lane, now - enqueued_at)
+        self._schedule_aging(now)
+        for lane in LANES:
+            metrics.set_lane_state(lane, len(self._waiters[lane]), self._in_use[lane])
+
+    def _schedule_aging(self, now: float):
+        """Lote barrado só pela reserva precisa ser reavaliado quando envelhecer"""
+        oldest = self._oldest(BULK)
+        if oldest is None or self.in_use >= self.capacity or self._aging_timer is not None:
+            return
+        delay = max(0.0, oldest[1] + self.aging_seconds - now)
+        self._aging_timer = asyncio.get_running_loop().call_later(delay, self._on_aging_timer)
+
+    def _on_aging_timer(self):
+        self._aging_timer = None
+        self._dispatch()
+
+    def _release(self, lane: str):
+        self._in_use[lane] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: str = INTERACTIVE):
+        """Espera uma vaga na faixa (até o prazo da requisição) e a libera ao sair do bloco"""
+        lane = lane if lane in LANES else INTERACTIVE
+        if self._oldest(lane) is None and self._can_run(lane, promoted=False):
+            self._in_use[lane] += 1
+            metrics.record_lane_wait(lane, 0.0)
+            metrics.set_lane_state(lane, 0, self._in_use[lane])
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters[lane].append((future, time.monotonic()))
+            self._dispatch()
+            try:
+                with profiling.span("queue"):
+                    await within_deadline(future)
+            except (asyncio.CancelledError, DeadlineExceeded):
+                if future.done() and not future.cancelled():
+                    # A vaga chegou junto com o cancelamento: devolve
+                    self._release(lane)
+                else:
+                    future.cancel()
+                raise
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self) -> Dict:
+        return {
+            "capacity": self.capacity,
+            "mode": self.mode,
+            "reserved_interactive_slots": self.reserved_slots,
+            "aging_seconds": self.aging_seconds,
+            "promoted_by_aging": self.promoted,
+            "lanes": {
+                lane: {"in_flight": self._in_use[lane], "waiting": len(self._waiters[lane])}
+                for lane in LANES
+            },
+        }
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+🗂️ Sessões de conversa do RouterLLM
+Histórico guardado no servidor (LRU em memória + spill opcional em disco)
+e compactado para caber em um orçamento de tokens antes de cada chamada
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from conversation import Message, estimate_tokens, message_text, text_part
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX = "[Resumo da conversa anterior]"
+
+@dataclass
+class Session:
+    session_id: str
+    user_id: str = "anonymous"
+    messages: List[Message] = field(default_factory=list)
+    system: Optional[str] = None
+    model: Optional[str] = None      # modelo fixo da sessão (aproveita o cache do provedor)
+    summary: str = ""                # resumo dos turnos que saíram do histórico
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "messages": self.messages,
+            "system": self.system,
+            "model": self.model,
+            "summary": self.summary,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Session":
+        return cls(**data)
+
+class SessionStore:
+    """
+    💾 Guarda até `max_sessions` sessões em memória (LRU)
+    As menos usadas vão para `spill_dir` (se configurado) em vez de serem perdidas
+    """
+
+    def __init__(self, max_sessions: int = 1000, spill_dir: Optional[str] = None):
+        self.max_sessions = max_sessions
+        self.spill_dir = spill_dir
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.evictions = 0
+
+    def _spill_path(self, session_id: str) -> str:
+        name = hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.spill_dir, f"{name}.json")
+
+    def _write_spill(self, data: Dict):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = self._spill_path(data["session_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _read_spill(self, session_id: str) -> Optional[Dict]:
+        path = self._spill_path(session_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        os.remove(path)
+        return data
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            return session
+        if not self.spill_dir:
+            return None
+        data = await asyncio.to_thread(self._read_spill, session_id)
+        if data is None:
+            return None
+        # Outra requisição pode ter recarregado a mesma sessão enquanto líamos o disco
+        session = self._sessions.get(session_id) or Session.from_dict(data)
+        await self._put(session)
+        return session
+
+    async def get_or_create(self, session_id: str, user_id: str = "anonymous") -> Session:
+        session = await self.get(session_id)
+        if session is None:
+            session = Session(session_id=session_id, user_id=user_id)
+            await self._put(session)
+        return session
+
+    async def _put(self, session: Session):
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.max_sessions:
+            _, evicted = self._sessions.popitem(last=False)
+            self.evictions += 1
+            if self.spill_dir:
+                await asyncio.to_thread(self._write_spill, evicted.to_dict())
+
+    async def delete(self, session_id: str) -> bool:
+        found = self._sessions.pop(session_id, None) is not None
+        if self.spill_dir:
+            found = await asyncio.to_thread(self._read_spill, session_id) is not None or found
+        return found
+
+    def stats(self) -> Dict:
+        return {
+            "in_memory": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "evictions": self.evictions,
+            "spill_enabled": bool(self.spill_dir),
+        }
+
+def _first_sentence(text: str, limit: int = 160) -> str:
+    text = " ".join(text.split())
+    if text.startswith(SUMMARY_PREFIX):
+        text = text[len(SUMMARY_PREFIX):].strip()
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    return sentence if len(sentence) <= limit else sentence[:limit - 1] + "…"
+
+def history_tokens(messages: List[Message], summary: str = "") -> int:
+    return sum(estimate_tokens(message_text(m)) for m in messages) + estimate_tokens(summary)
+
+def compact_history(messages: List[Message], summary: str, budget_tokens: int,
+                    target_ratio: float = 0.75) -> Tuple[List[Message], str]:
+    """
+    ✂️ Mantém o histórico dentro do orçamento de tokens
+    Descarta os turnos mais antigos (sempre preservando o último turno do usuário)
+    até `target_ratio` do orçamento - a folga evita recompactar a cada chamada,
+    o que quebraria o cache de prefixo do provedor. Os turnos descartados viram
+    um resumo extrativo curto (primeira frase de cada turno).
+    """
+    if history_tokens(messages, summary) <= budget_tokens:
+        return messages, summary
+
+    target = int(budget_tokens * target_ratio)
+    summary_budget = max(1, budget_tokens // 5)
+    kept = list(messages)
+    dropped = []
+    while len(kept) > 1 and history_tokens(kept) > target - summary_budget:
+        dropped.append(kept.pop(0))
+    # A conversa enviada ao provedor deve começar com o usuário
+    while len(kept) > 1 and kept[0]["role"] != "user":
+        dropped.append(kept.pop(0))
+
+    lines = [summary] if summary else []
+    for m in dropped:
+        speaker = "Usuário" if m["role"] == "user" else "Assistente"
+        lines.append(f"{speaker}: {_first_sentence(message_text(m))}")
+    new_summary = "\n".join(lines)
+    # Se o resumo estourar sua fatia, as linhas mais antigas saem primeiro
+    while estimate_tokens(new_summary) > summary_budget and "\n" in new_summary:
+        new_summary = new_summary.split("\n", 1)[1]
+    if estimate_tokens(new_summary) > summary_budget:
+        new_summary = new_summary[-summary_budget * 4:]
+    return kept, new_summary
+
+def with_summary(messages: List[Message], summary: str) -> List[Message]:
+    """Coloca o resumo como primeira parte da primeira mensagem do usuário"""
+    if not summary or not messages:
+        return messages
+    first = dict(messages[0])
+    first["content"] = [text_part(f"{SUMMARY_PREFIX}\n{summary}")] + list(first["content"])
+    return [first] + messages[1:]
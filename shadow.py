@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+👥 Roteamento em sombra: políticas candidatas avaliadas no tráfego real
+Cada política é um catálogo alternativo (regras, categorias, preços) que
+decide em segundo plano, depois que a resposta já saiu, para o mesmo pedido.
+A decisão fica ao lado da decisão real: concordância e custo projetado
+(os tokens da resposta real no preço do modelo da sombra). Uma fração
+sorteada dos pedidos vai de fato ao modelo da sombra, dentro de um teto de
+gasto por dia, para medir a latência
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Set
+
+from catalog import CatalogError, RoutingTable, load_table
+from conversation import Message
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def parse_policies(spec: str) -> Dict[str, str]:
+    """SHADOW_POLICIES='regras-v2=routing.v2.json,barato.json' → {nome: caminho} (sem nome = nome do arquivo)"""
+    policies = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, path = item.rpartition("=")
+        path = path.strip()
+        policies[name.strip() or os.path.splitext(os.path.basename(path))[0]] = path
+    return policies
+
+class ShadowRouter:
+    """
+    `policies`: {nome: caminho do catálogo candidato}
+    `sample_rate`: fração dos pedidos que também chama o modelo da sombra (quando discorda)
+    `budget_usd`: gasto máximo por dia com essas chamadas; `max_concurrency`: chamadas de sombra simultâneas
+    """
+
+    def __init__(self, router, config, policies: Dict[str, str], sample_rate: float = 0.0,
+                 budget_usd: float = 1.0, max_concurrency: int = 2):
+        self.router = router
+        self.config = config
+        self.paths = policies
+        self.sample_rate = sample_rate
+        self.budget_usd = budget_usd
+        self.max_concurrency = max_concurrency
+        self._tables: Dict[str, RoutingTable] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._spent_day = date.today()
+        self._spent = 0.0
+        self._random = random.Random()
+        self.reload()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._tables)
+
+    def reload(self):
+        """Recompila os catálogos candidatos (inválido = mantém o anterior, ou fica de fora)"""
+        for name, path in self.paths.items():
+            try:
+                self._tables[name] = load_table(path)
+            except CatalogError as e:
+                logger.error(f"👥 Política em sombra '{name}' inválida: {e}")
+
+    def submit(self, message: str, prefix_key: Optional[str], live_model: str, live_cost: float,
+               tokens_used: int, live_latency: float, messages: List[Message], system: Optional[str],
+               max_tokens: int, temperature: float):
+        """Agenda a avaliação das políticas (não espera nada: a resposta real já foi montada)"""
+        if not self._tables:
+            return
+        task = asyncio.get_running_loop().create_task(self._evaluate(
+            message, prefix_key, live_model, live_cost, tokens_used, live_latency,
+            messages, system, max_tokens, temperature))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _evaluate(self, message: str, prefix_key: Optional[str], live_model: str, live_cost: float,
+                        tokens_used: int, live_latency: float, messages: List[Message],
+                        system: Optional[str], max_tokens: int, temperature: float):
+        for name, table in list(self._tables.items()):
+            try:
+                # A tabela candidata vale só dentro desta tarefa (contextvar)
+                with self.config.pin(table):
+                    model, _ = self.router.route_request(message, prefix_key=prefix_key, record=False)
+                    if model == "error":
+                        continue
+                    agree = model == live_model
+                    projected = live_cost if agree else self.router.calculate_cost(model, tokens_used)
+                    self._record_decision(name, live_model, model, live_cost, projected)
+                    if not agree and self._should_sample(model):
+                        await self._call_shadow(name, model, live_latency, messages, system, max_tokens, temperature)
+            except Exception as e:
+                logger.warning(f"👥 Política em sombra '{name}' falhou: {e}")
+
+    def _policy_stats(self, name: str) -> Dict[str, Any]:
+        return self._stats.setdefault(name, {
+            "decisions": 0,
+            "agreements": 0,
+            "live_cost": 0.0,
+            "projected_cost": 0.0,
+            "sampled": 0,
+            "sample_errors": 0,
+            "skipped_budget": 0,
+            "shadow_cost": 0.0,
+            "latency_delta_sum": 0.0,
+            "disagreements": {},
+        })
+
+    def _record_decision(self, name: str, live_model: str, model: str, live_cost: float, projected: float):
+        with self._lock:
+            stats = self._policy_stats(name)
+            stats["decisions"] += 1
+            stats["live_cost"] += live_cost
+            stats["projected_cost"] += projected
+            if model == live_model:
+                stats["agreements"] += 1
+            else:
+                pair = f"{live_model} → {model}"
+                stats["disagreements"][pair] = stats["disagreements"].get(pair, 0) + 1
+        metrics.record_shadow_decision(name, model == live_model, projected - live_cost)
+
+    def _should_sample(self, model: str) -> bool:
+        """Sorteio, vaga livre, teto do dia e provedor com folga (a sombra não come a cota do tráfego real)"""
+        if self.sample_rate <= 0 or self._random.random() >= self.sample_rate:
+            return False
+        if self._in_flight >= self.max_concurrency:
+            return False
+        provider = self.config.models[model]["provider"]
+        if self.router.throttle.near_limit(provider, self.config.get_api_keys(provider)):
+            return False
+        return True
+
+    def _budget_left(self) -> float:
+        today = date.today()
+        if today != self._spent_day:
+            self._spent_day, self._spent = today, 0.0
+        return self.budget_usd - self._spent
+
+    async def _call_shadow(self, name: str, model: str, live_latency: float, messages: List[Message],
+                           system: Optional[str], max_tokens: int, temperature: float):
+        # Reserva o pior caso (max_tokens inteiro) antes de chamar: o teto nunca é furado
+        reserve = self.router.calculate_cost(model, max_tokens)
+        if self._budget_left() < reserve:
+            with self._lock:
+                self._policy_stats(name)["skipped_budget"] += 1
+            return
+        self._spent += reserve
+        self._in_flight += 1
+        provider = self.config.models[model]["provider"]
+        start = time.monotonic()
+        try:
+            # Direto no provedor: chamada de sombra não entra nas estatísticas do tráfego real
+            result = await self.router._call_provider(provider, model, messages, system, max_tokens, temperature)
+        except Exception as e:
+            self._spent -= reserve
+            with self._lock:
+                stats = self._policy_stats(name)
+                stats["sample_errors"] += 1
+            logger.debug(f"👥 Chamada de sombra ({name}, {model}) falhou: {e}")
+            return
+        finally:
+            self._in_flight -= 1
+        latency = time.monotonic() - start
+        cost = self.router.result_cost(model, result)
+        self._spent += cost - reserve
+        with self._lock:
+            stats = self._policy_stats(name)
+            stats["sampled"] += 1
+            stats["shadow_cost"] += cost
+            stats["latency_delta_sum"] += latency - live_latency
+        metrics.record_shadow_call(name, model, cost, latency - live_latency)
+
+    async def drain(self):
+        """Espera as avaliações pendentes (desligamento e testes)"""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Por política: concordância, custo projetado x real e latência das chamadas sorteadas"""
+        with self._lock:
+            policies = {}
+            for name, stats in self._stats.items():
+                decisions, sampled = stats["decisions"], stats["sampled"]
+                delta = stats["projected_cost"] - stats["live_cost"]
+                disagreements = sorted(stats["disagreements"].items(), key=lambda item: -item[1])[:10]
+                policies[name] = {
+                    "decisions": decisions,
+                    "agreement_rate": round(stats["agreements"] / decisions, 4) if decisions else None,
+                    "live_cost": round(stats["live_cost"], 6),
+                    "projected_cost": round(stats["projected_cost"], 6),
+                    "projected_cost_delta": round(delta, 6),
+                    "projected_cost_delta_percent": round(100 * delta / stats["live_cost"], 2)
+                    if stats["live_cost"] else None,
+                    "sampled": sampled,
+                    "sample_errors": stats["sample_errors"],
+                    "skipped_budget": stats["skipped_budget"],
+                    "shadow_cost": round(stats["shadow_cost"], 6),
+                    "latency_delta_ms": round(1000 * stats["latency_delta_sum"] / sampled, 1) if sampled else None,
+                    "top_disagreements": dict(disagreements),
+                }
+            return {
+                "policies": policies,
+                "sample_rate": self.sample_rate,
+                "budget_usd_per_day": self.budget_usd,
+                "spent_today_usd": round(max(0.0, self.budget_usd - self._budget_left()), 6),
+            }
@@ -29,28 +29,17 @@ def show_routing_rules():
     print(f"\n🎯 REGRAS DE ROTEAMENTO:")
     print("=" * 50)
     
-    print("\n1. 🔧 CÓDIGO/PROGRAMAÇÃO")
-    print("   Palavras-chave: código, code, python, javascript, sql, debug, erro, função, class, import")
-    print("   Prioridade: gpt-4 → claude-3-5-sonnet → gpt-4o-mini")
-    print("   Motivo: Precisão máxima para programação")
-    
-    print("\n2. ⚡ PERGUNTAS SIMPLES (< 100 caracteres)")
-    print("   Padrões: 'o que é', 'como', 'quando', 'onde', 'quem', 'sim ou não'")
-    print("   Prioridade: gpt-4o-mini → claude-3-haiku → gpt-4")
-    print("   Motivo: Rápido e econômico para perguntas simples")
-    
-    print("\n3. 📄 TEXTOS LONGOS (> 1000 caracteres)")
-    print("   Prioridade: claude-3-5-sonnet → gemini-1.5-pro → gpt-4")
-    print("   Motivo: Contexto extenso para análises profundas")
-    
-    print("\n4. 🎨 CONTEÚDO CRIATIVO")
-    print("   Palavras-chave: criativo, marketing, copy, slogan, história, poema, roteiro")
-    print("   Prioridade: gemini-1.5-pro → claude-3-5-sonnet → gpt-4")
-    print("   Motivo: Fluidez e criatividade")
-    
-    print("\n5. ⚖️ CASO GERAL")
-    print("   Prioridade: claude-3-haiku → gpt-4o-mini → gpt-4")
-    print("   Motivo: Balanceado entre qualidade e custo")
+    rules = config.routing_rules
+    print(f"\n📚 Catálogo: {config.catalog_path} (versão {config.table.version})")
+    print(f"   Código: {', '.join(rules['code_keywords'])}")
+    print(f"   Perguntas simples (< {rules['simple_text_threshold']} caracteres): {', '.join(rules['simple_patterns'])}")
+    print(f"   Textos longos: > {rules['long_text_threshold']} caracteres")
+    print(f"   Criativo: {', '.join(rules['creative_keywords'])}")
+
+    for index, (category, rule) in enumerate(config.routing_categories.items(), 1):
+        print(f"\n{index}. {rule['reasoning']}")
+        print(f"   Categoria: {category}")
+        print(f"   Prioridade: {' → '.join(rule['preferred'])}")
     
     # Testar exemplos
     print(f"\n🧪 EXEMPLOS DE ROTEAMENTO:")
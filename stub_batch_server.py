@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+🧪 Servidor local que imita as Batch APIs da OpenAI e da Anthropic
+Para testar o modo offline sem gastar: os lotes "terminam" depois de
+STUB_BATCH_DELAY_SECONDS e cada resposta ecoa o começo do prompt.
+
+    uvicorn stub_batch_server:app --port 9100
+    OPENAI_BATCH_BASE_URL=http://localhost:9100/v1 \\
+    ANTHROPIC_BATCH_BASE_URL=http://localhost:9100/v1 python main.py
+"""
+
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import Response
+
+app = FastAPI(title="Stub Batch API")
+
+DELAY = float(os.getenv("STUB_BATCH_DELAY_SECONDS", "2"))
+files = {}
+openai_batches = {}
+anthropic_batches = {}
+
+def _prompt_text(messages) -> str:
+    last = messages[-1]["content"]
+    if isinstance(last, list):
+        last = " ".join(part.get("text", "") for part in last)
+    return last
+
+def _ready(batch) -> bool:
+    return time.time() - batch["created_at"] >= DELAY
+
+@app.post("/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    files[file_id] = await file.read()
+    return {"id": file_id, "object": "file", "purpose": purpose, "bytes": len(files[file_id])}
+
+@app.post("/v1/batches")
+async def create_openai_batch(body: dict):
+    if body.get("input_file_id") not in files:
+        raise HTTPException(status_code=404, detail="arquivo não encontrado")
+    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+    openai_batches[batch_id] = {"id": batch_id, "input_file_id": body["input_file_id"], "created_at": time.time()}
+    return {"id": batch_id, "object": "batch", "status": "validating"}
+
+@app.get("/v1/batches/{batch_id}")
+async def get_openai_batch(batch_id: str):
+    batch = openai_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="lote não encontrado")
+    if not _ready(batch):
+        return {"id": batch_id, "status": "in_progress"}
+    if "output_file_id" not in batch:
+        lines = []
+        for line in files[batch["input_file_id"]].splitlines():
+            row = json.loads(line)
+            body = row["body"]
+            text = f"[stub] {_prompt_text(body['messages'])[:60]}"
+            lines.append(json.dumps({"custom_id": row["custom_id"], "error": None, "response": {
+                "status_code": 200,
+                "body": {
+                    "choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 20, "completion_tokens": 10, "total_tokens": 30},
+                },
+            }}))
+        batch["output_file_id"] = f"file-{uuid.uuid4().hex[:12]}"
+        files[batch["output_file_id"]] = "\n".join(lines).encode()
+    return {"id": batch_id, "status": "completed", "output_file_id": batch["output_file_id"], "error_file_id": None}
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="arquivo não encontrado")
+    return Response(content=files[file_id], media_type="application/jsonl")
+
+@app.post("/v1/messages/batches")
+async def create_anthropic_batch(body: dict):
+    batch_id = f"msgbatch_{uuid.uuid4().hex[:12]}"
+    anthropic_batches[batch_id] = {"requests": body["requests"], "created_at": time.time()}
+    return {"id": batch_id, "type": "message_batch", "processing_status": "in_progress"}
+
+@app.get("/v1/messages/batches/{batch_id}")
+async def get_anthropic_batch(batch_id: str, request: Request):
+    batch = anthropic_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="lote não encontrado")
+    if not _ready(batch):
+        return {"id": batch_id, "processing_status": "in_progress", "results_url": None}
+    return {"id": batch_id, "processing_status": "ended",
+            "results_url": str(request.url_for("anthropic_results", batch_id=batch_id))}
+
+@app.get("/v1/messages/batches/{batch_id}/results", name="anthropic_results")
+async def anthropic_results(batch_id: str):
+    batch = anthropic_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="lote não encontrado")
+    lines = []
+    for item in batch["requests"]:
+        messages = [{"content": m["content"]} for m in item["params"]["messages"]]
+        text = f"[stub] {_prompt_text(messages)[:60]}"
+        lines.append(json.dumps({"custom_id": item["custom_id"], "result": {"type": "succeeded", "message": {
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "usage": {"input_tokens": 20, "output_tokens": 10},
+        }}}))
+    return Response(content="\n".join(lines).encode(), media_type="application/jsonl")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_BATCH_PORT", "9100")))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+🧪 Servidor local que imita um servidor de inferência compatível com OpenAI
+(vLLM, llama.cpp, Ollama...) para testar o provedor "local" sem GPU:
+responde /v1/models (a sonda de saúde) e /v1/chat/completions, com ou sem
+streaming, ecoando o começo do prompt depois de STUB_LOCAL_DELAY_MS.
+
+    uvicorn stub_local_server:app --port 9200
+    LOCAL_LLM_BASE_URL=http://localhost:9200/v1 python main.py
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+app = FastAPI(title="Stub Local LLM")
+
+DELAY = float(os.getenv("STUB_LOCAL_DELAY_MS", "50")) / 1000
+MODEL = os.getenv("STUB_LOCAL_MODEL", "llama-3.1-8b-instruct")
+
+def _prompt_text(messages) -> str:
+    last = messages[-1]["content"] if messages else ""
+    if isinstance(last, list):
+        last = " ".join(part.get("text", "") for part in last)
+    return last or ""
+
+def _usage(prompt: str, text: str) -> dict:
+    prompt_tokens, completion_tokens = max(1, len(prompt) // 4), max(1, len(text) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": MODEL, "object": "model", "owned_by": "stub"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    prompt = _prompt_text(body.get("messages") or [])
+    text = f"[local] {prompt[:60]}"
+    completion_id, created, model = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()), body.get("model", MODEL)
+    await asyncio.sleep(DELAY)
+    if not body.get("stream"):
+        return {"id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": "stop"}],
+                "usage": _usage(prompt, text)}
+
+    async def events():
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        for word in text.split(" "):
+            delta = {"content": word + " "}
+            yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]})}\n\n"
+        yield f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({**chunk, 'choices': [], 'usage': _usage(prompt, text)})}\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_LOCAL_PORT", "9200")))
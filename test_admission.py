@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do controle de admissão (degradar / recusar sob sobrecarga)
+"""
+
+import asyncio
+
+import httpx
+
+from admission import DEGRADE, OK, SHED, AdmissionController, AdmissionMiddleware
+
+class Signals:
+    def __init__(self):
+        self.queue = {"interactive": 0.0, "bulk": 0.0}
+        self.lag = 0.0
+
+    def controller(self, **kwargs) -> AdmissionController:
+        return AdmissionController(lambda lane: self.queue[lane], lambda: self.lag, **kwargs)
+
+def test_levels_follow_each_signal():
+    signals = Signals()
+    admission = signals.controller(max_in_flight=4, degrade_in_flight=2)
+    assert admission.level() == (OK, None)
+
+    admission.in_flight = 2
+    assert admission.level() == (DEGRADE, "in_flight")
+    admission.in_flight = 4
+    assert admission.level() == (SHED, "in_flight")
+    admission.in_flight = 0
+
+    signals.queue["bulk"] = 0.6
+    assert admission.level("bulk") == (DEGRADE, "queue_delay")
+    assert admission.level("interactive") == (OK, None)
+    signals.queue["bulk"] = 0.0
+
+    signals.lag = 0.1
+    assert admission.level() == (DEGRADE, "loop_lag")
+    assert admission.degraded
+    signals.lag = 0.5
+    assert admission.level() == (SHED, "loop_lag")
+    assert admission.saturation() == 1.0
+
+def test_shed_signal_wins_over_earlier_degrade():
+    signals = Signals()
+    admission = signals.controller(max_in_flight=4, degrade_in_flight=2)
+    admission.in_flight = 3
+    signals.lag = 0.6
+    assert admission.level() == (SHED, "loop_lag")
+
+def test_admit_release_and_rejections():
+    signals = Signals()
+    admission = signals.controller(max_in_flight=2, degrade_in_flight=1)
+    assert admission.admit("interactive") is None
+    assert admission.in_flight == 1
+    # Nível "degradar": lote recusado com 429, interativo ainda entra
+    assert admission.admit("bulk") == (429, "in_flight", 1)
+    assert admission.admit("interactive") is None
+    assert admission.admit("interactive") == (503, "in_flight", 1)
+    admission.release()
+    admission.release()
+    assert admission.in_flight == 0
+    decisions = admission.stats()["decisions"]
+    assert decisions == {"admitted": {"-": 1}, "degraded": {"in_flight": 1}, "shed": {"in_flight": 2}}
+
+def test_retry_after_follows_queue_delay():
+    signals = Signals()
+    admission = signals.controller()
+    signals.queue["interactive"] = 3.2
+    assert admission.admit("interactive") == (503, "queue_delay", 4)
+
+def _app(admission, paths=("/chat", "/v1/chat/completions")):
+    entered = asyncio.Event()
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        entered.set()
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    lanes = {"lote": "bulk"}
+    middleware = AdmissionMiddleware(app, admission, paths,
+                                     lane_of=lambda headers: lanes.get(headers.get("x-api-key"), "interactive"))
+    return middleware, entered, release
+
+def test_middleware_counts_in_flight_and_rejects():
+    async def run():
+        signals = Signals()
+        admission = signals.controller(max_in_flight=1)
+        app, entered, release = _app(admission)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            first = asyncio.create_task(client.post("/chat", json={}))
+            await entered.wait()
+            assert admission.in_flight == 1
+            rejected = await client.post("/chat", json={})
+            assert rejected.status_code == 503
+            assert rejected.headers["retry-after"] == "1"
+            assert "saturado" in rejected.json()["detail"]
+            openai = await client.post("/v1/chat/completions", json={})
+            assert openai.status_code == 503 and openai.json()["error"]["code"] == "overloaded"
+            # Fora dos caminhos controlados: passa direto (e não conta)
+            release.set()
+            assert (await client.get("/chat")).status_code == 200
+            assert (await first).status_code == 200
+        assert admission.in_flight == 0
+
+    asyncio.run(run())
+
+def test_middleware_rejects_bulk_lane_when_degraded():
+    async def run():
+        signals = Signals()
+        signals.lag = 0.2
+        admission = signals.controller()
+        app, _, release = _app(admission)
+        release.set()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            assert (await client.post("/chat", headers={"x-api-key": "lote"})).status_code == 429
+            assert (await client.post("/chat")).status_code == 200
+
+    asyncio.run(run())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do balanceamento entre endpoints de um modelo (p2c, menos em andamento, ejeção)
+"""
+
+import pytest
+
+from endpoints import EndpointBalancer
+
+def _endpoints(*names, **extra):
+    return [{"name": name, "weight": 1.0, **extra} for name in names]
+
+def _warm(balancer, model, endpoints):
+    """Uma chamada bem-sucedida em cada endpoint (a ejeção conta só irmãos já vistos)"""
+    for endpoint in endpoints:
+        with balancer.pick(model, [endpoint]):
+            pass
+
+def _fail(balancer, model, endpoints, status=500):
+    with balancer.pick(model, endpoints) as pick:
+        pick.fail(status)
+    return pick.state.name
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        EndpointBalancer(strategy="aleatorio")
+
+def test_p2c_prefers_faster_endpoint():
+    balancer = EndpointBalancer()
+    endpoints = _endpoints("rapido", "lento")
+    balancer._state("m", "rapido").latency_ewma = 0.1
+    balancer._state("m", "lento").latency_ewma = 2.0
+    chosen = set()
+    for _ in range(20):
+        with balancer.pick("m", endpoints) as pick:
+            chosen.add(pick.endpoint["name"])
+    assert chosen == {"rapido"}
+
+def test_least_outstanding_spreads_load():
+    balancer = EndpointBalancer(strategy="least_outstanding")
+    endpoints = _endpoints("a", "b")
+    first = balancer.pick("m", endpoints)
+    second = balancer.pick("m", endpoints)
+    assert {first.endpoint["name"], second.endpoint["name"]} == {"a", "b"}
+    with first, second:
+        pass
+    assert all(s.in_flight == 0 for s in balancer._states.values())
+
+def test_failing_endpoint_is_ejected():
+    balancer = EndpointBalancer(strategy="least_outstanding", eject_after=3)
+    endpoints = _endpoints("a", "b")
+    _warm(balancer, "m", endpoints)
+    for _ in range(3):
+        with balancer.pick("m", endpoints, exclude=["b"]) as pick:
+            pick.fail(502)
+    assert balancer._state("m", "a").ejected_until > 0
+    assert {_fail(balancer, "m", endpoints, status=429) for _ in range(5)} == {"b"}
+    # 4xx/429 não contam contra o endpoint
+    assert balancer._state("m", "b").consecutive_failures == 0
+
+def test_client_errors_and_cancellation_do_not_eject():
+    balancer = EndpointBalancer(eject_after=1)
+    endpoints = _endpoints("a")
+    _fail(balancer, "m", endpoints, status=400)
+    with pytest.raises(KeyError):
+        with balancer.pick("m", endpoints):
+            raise KeyError("erro do pedido")  # exceção sem status: conta como falha de rede
+    state = balancer._state("m", "a")
+    assert state.failures == 1 and state.in_flight == 0
+
+def test_ejection_respects_max_fraction():
+    balancer = EndpointBalancer(eject_after=1, max_ejected_fraction=0.5)
+    endpoints = _endpoints("a", "b")
+    _warm(balancer, "m", endpoints)
+    with balancer.pick("m", endpoints, exclude=["b"]) as pick:
+        pick.fail(None)
+    with balancer.pick("m", endpoints, exclude=["a"]) as pick:
+        pick.fail(503)
+    ejected = [s.name for s in balancer._states.values() if s.ejected_until > 0]
+    assert ejected == ["a"]  # o segundo deixaria o modelo sem metade dos endpoints
+
+def test_saturated_by_max_concurrency():
+    balancer = EndpointBalancer()
+    endpoints = _endpoints("a", "b", max_concurrency=1)
+    assert not balancer.saturated("m", endpoints)
+    first = balancer.pick("m", endpoints)
+    second = balancer.pick("m", endpoints)
+    assert {first.endpoint["name"], second.endpoint["name"]} == {"a", "b"}
+    assert balancer.saturated("m", endpoints)
+    with first:
+        pass
+    assert not balancer.saturated("m", endpoints)
+    with second:
+        pass
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da Batch API sem rede: o provedor é um httpx.MockTransport
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from batches import BatchRunner
+from config import RouterConfig
+from router import LLMRouter
+
+KEYS = ("sk-aaaaaaaaaaaa1111", "sk-bbbbbbbbbbbb2222")
+
+def _runner(monkeypatch, handler):
+    for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "OPENAI_API_KEY",
+                 "LOCAL_LLM_BASE_URL", "ROUTER_MODEL_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEYS", ",".join(KEYS))
+    router = LLMRouter(RouterConfig())
+    router._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def run_direct(item):
+        raise AssertionError("item da OpenAI não deveria rodar direto")
+
+    return BatchRunner(router, run_direct)
+
+def _key(request) -> str:
+    return request.headers["authorization"].removeprefix("Bearer ")
+
+class OpenAIBatches:
+    """Batch API mínima: /files, /batches e o conteúdo do arquivo de saída"""
+
+    def __init__(self, limited=(), failed_downloads=0):
+        self.limited = set(limited)
+        self.failed_downloads = failed_downloads
+        self.calls = []
+
+    def __call__(self, request):
+        path = request.url.path
+        self.calls.append((request.method, path, _key(request)))
+        if _key(request) in self.limited:
+            return httpx.Response(429, json={"error": "rate limit"}, headers={"retry-after": "30"})
+        if request.method == "POST" and path.endswith("/files"):
+            return httpx.Response(200, json={"id": "file-in"})
+        if request.method == "POST" and path.endswith("/batches"):
+            return httpx.Response(200, json={"id": "batch-1", "status": "validating"})
+        if path.endswith("/batches/batch-1"):
+            return httpx.Response(200, json={"id": "batch-1", "status": "completed", "output_file_id": "file-out"})
+        if path.endswith("/files/file-out/content"):
+            if self.failed_downloads:
+                self.failed_downloads -= 1
+                return httpx.Response(500, text="instável")
+            body = {"model": "gpt-4o-mini", "choices": [{"message": {"content": "oi"}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4}}
+            row = {"custom_id": "item-0", "response": {"status_code": 200, "body": body}}
+            return httpx.Response(200, content=json.dumps(row).encode())
+        return httpx.Response(404)
+
+ITEMS = [{"message": "olá", "force_model": "gpt-4o-mini"}]
+
+def test_failed_download_keeps_batch_running_until_next_poll(monkeypatch):
+    provider = OpenAIBatches(failed_downloads=1)
+    runner = _runner(monkeypatch, provider)
+
+    async def run():
+        batch = await runner.submit(ITEMS)
+        with pytest.raises(Exception, match="OpenAI /files erro 500"):
+            await runner.poll(batch)
+        assert batch["results"] == [None]
+        assert batch["submissions"][0]["status"] == "validating"
+        await runner.poll(batch)
+        return batch
+
+    batch = asyncio.run(run())
+    assert batch["status"] == "done"
+    assert batch["results"][0]["response"] == "oi"
+    assert batch["submissions"][0]["status"] == "completed"
+
+def test_limited_key_rotates_and_batch_sticks_to_its_key(monkeypatch):
+    provider = OpenAIBatches(limited={KEYS[0]})
+    runner = _runner(monkeypatch, provider)
+
+    async def run():
+        batch = await runner.submit(ITEMS)
+        await runner.poll(batch)
+        return batch
+
+    batch = asyncio.run(run())
+    assert batch["results"][0]["error"] is None
+    # 429 na primeira chave: o upload refaz com a outra, e o lote inteiro segue nela
+    served = [key for method, path, key in provider.calls if key != KEYS[0]]
+    assert len(served) == len(provider.calls) - 1 == 4
+    assert set(served) == {KEYS[1]}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do processamento em massa (python -m routerllm.bulk), sem rede:
+o provedor é um httpx.MockTransport
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from config import RouterConfig
+from router import LLMRouter
+from routerllm.bulk import parse_item, run_bulk
+
+GOOD = {"id": "a", "message": "o que é DNS?"}
+MALFORMED = [
+    "[1, 2]",
+    "não é json",
+    '{"messages": ["oi"]}',
+    '{"messages": [{"role": "user", "content": ["oi"]}]}',
+    '{"messages": "oi"}',
+    '{"message": 5}',
+    '{"message": "oi", "max_tokens": "muitos"}',
+    "{}",
+]
+
+def fake_openai(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    text = body["messages"][-1]["content"]
+    text = text if isinstance(text, str) else text[0]["text"]
+    return httpx.Response(200, json={
+        "choices": [{"message": {"content": f"eco: {text}"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    })
+
+@pytest.fixture
+def router(monkeypatch):
+    for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "OPENAI_API_KEYS",
+                 "LOCAL_LLM_BASE_URL", "ROUTER_MODEL_PATH", "MAX_TOKENS_PREDICTOR"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test-0000000000000")
+    router = LLMRouter(RouterConfig())
+    router._client = httpx.AsyncClient(transport=httpx.MockTransport(fake_openai))
+    return router
+
+@pytest.mark.parametrize("line", MALFORMED)
+def test_parse_item_rejects_malformed_lines(line):
+    with pytest.raises(ValueError):
+        parse_item(line.encode("utf-8"))
+
+def test_parse_item_accepts_message_and_messages():
+    item, messages = parse_item(json.dumps({
+        "messages": [{"role": "user", "content": [{"type": "text", "text": "oi"}]}],
+        "message": "tudo bem?",
+    }).encode("utf-8"))
+    assert [m["role"] for m in messages] == ["user", "user"]
+    assert messages[-1]["content"][0]["text"] == "tudo bem?"
+
+def _write_input(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+
+def _read_output(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_malformed_line_becomes_error_row(router, tmp_path):
+    source, sink = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    _write_input(source, [json.dumps(GOOD), "[1, 2]", json.dumps({**GOOD, "id": "b"})])
+
+    state = asyncio.run(run_bulk(str(source), str(sink), concurrency=2, router=router))
+
+    rows = _read_output(sink)
+    assert state["completed"] and state["next_index"] == 3 and state["errors"] == 1
+    assert [row["index"] for row in rows] == [0, 1, 2]
+    assert rows[0]["id"] == "a" and rows[0]["error"] is None and rows[0]["response"].startswith("eco:")
+    assert set(rows[1]) == {"index", "error"} and rows[1]["error"].startswith("linha inválida")
+    assert rows[2]["id"] == "b" and rows[2]["error"] is None
+
+def test_resume_through_malformed_line(router, tmp_path):
+    source, sink = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    first = json.dumps(GOOD)
+    _write_input(source, [first, '{"messages": ["oi"]}', json.dumps({**GOOD, "id": "b"})])
+    asyncio.run(run_bulk(str(source), str(sink), concurrency=1, router=router))
+    expected = _read_output(sink)
+
+    # Simula uma queda logo depois do primeiro item: checkpoint parado antes da linha ruim
+    first_row = sink.read_bytes().split(b"\n")[0] + b"\n"
+    checkpoint = tmp_path / "out.jsonl.ckpt"
+    checkpoint.write_text(json.dumps({
+        "input_offset": len(first) + 1, "output_bytes": len(first_row), "next_index": 1,
+        "cost": expected[0]["cost_estimate"], "errors": 0, "completed": False,
+    }), encoding="utf-8")
+    with open(sink, "ab") as f:
+        f.write(b'{"index": 1, "parcial')  # lixo depois do checkpoint é descartado
+
+    state = asyncio.run(run_bulk(str(source), str(sink), concurrency=1, router=router))
+
+    assert state["completed"] and state["next_index"] == 3 and state["errors"] == 1
+    rows = _read_output(sink)
+    assert [row["index"] for row in rows] == [0, 1, 2]
+    assert rows[1] == expected[1]
+    assert rows[2]["id"] == "b" and rows[2]["error"] is None
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes da validação e compilação do catálogo (routing.json)
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from catalog import DEFAULT_CATALOG_PATH, CatalogError, CatalogWatcher, compile_table, load_table, validate_catalog
+from health import probe_request
+
+@pytest.fixture
+def catalog():
+    with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def test_shipped_catalog_is_valid(catalog):
+    assert validate_catalog(catalog) == []
+
+@pytest.mark.parametrize("mutate, problem", [
+    (lambda c: c.pop("models"), "seção 'models'"),
+    (lambda c: c["models"]["gpt-4"].pop("api_model"), "'gpt-4': 'api_model' obrigatório"),
+    (lambda c: c["models"]["gpt-4"].update(api_model=""), "'gpt-4': 'api_model' obrigatório"),
+    (lambda c: c["models"]["gpt-4"].update(provider="nenhum"), "provider 'nenhum' desconhecido"),
+    (lambda c: c["models"]["gpt-4"].update(cost_per_1k_tokens=-1), "'cost_per_1k_tokens'"),
+    (lambda c: c["models"]["gpt-4"].update(max_tokens="muitos"), "'max_tokens'"),
+    (lambda c: c["categories"]["code"].update(preferred=["nao-existe"]), "modelo 'nao-existe' não existe"),
+    (lambda c: c["rules"].update(code_keywords="python"), "'code_keywords'"),
+    (lambda c: c.update(defaults=[]), "seção 'defaults' deve ser um objeto"),
+    (lambda c: c["defaults"].update(default_priority={}), "'default_priority' deve ser uma lista"),
+    (lambda c: c["defaults"].update(default_priority=[["openai", "nao-existe"]]), "entrada inválida"),
+    (lambda c: c.update(settings=3), "seção 'settings' deve ser um objeto"),
+    (lambda c: c["cascade"].update(categories=["nao-existe"]), "cascade: categoria 'nao-existe'"),
+    (lambda c: c["providers"]["local"].update(max_concurrency=0), "'max_concurrency'"),
+    (lambda c: c["categories"].pop("creative"), "categoria 'creative' ausente"),
+])
+def test_invalid_catalog_is_reported(catalog, mutate, problem):
+    mutate(catalog)
+    problems = validate_catalog(catalog)
+    assert any(problem in p for p in problems), problems
+
+def test_non_object_catalog():
+    assert validate_catalog([1, 2]) == ["o catálogo deve ser um objeto JSON"]
+
+def test_compile_resolves_keys_from_env(catalog):
+    table = compile_table(catalog, env={"OPENAI_API_KEYS": "sk-aaaaaaaaaaaa,sk-bbbbbbbbbbbb"})
+    assert table.available_providers == ("openai",)
+    assert table.api_key_pools["openai"] == ("sk-aaaaaaaaaaaa", "sk-bbbbbbbbbbbb")
+    assert set(table.available_models) == {m for m, c in catalog["models"].items() if c["provider"] == "openai"}
+    assert table.models["gpt-4"]["provider"] == "openai"
+
+def test_compile_rejects_invalid_catalog(catalog):
+    del catalog["models"]["gpt-4"]["api_model"]
+    with pytest.raises(CatalogError):
+        compile_table(catalog, env={})
+
+def test_load_table_wraps_every_failure(tmp_path):
+    for content in ("{não é json", "[1, 2]", '{"providers": {}}'):
+        path = tmp_path / "routing.json"
+        path.write_text(content, encoding="utf-8")
+        with pytest.raises(CatalogError):
+            load_table(str(path), env={})
+    with pytest.raises(CatalogError):
+        load_table(str(tmp_path / "nao-existe.json"), env={})
+
+def test_watcher_survives_reload_errors(tmp_path):
+    path = tmp_path / "routing.json"
+    path.write_text("{}", encoding="utf-8")
+    calls = []
+
+    def on_change():
+        calls.append(len(calls))
+        raise RuntimeError("falha inesperada") if len(calls) == 1 else CatalogError("inválido")
+
+    async def run():
+        watcher = CatalogWatcher([str(path)], on_change, interval=0.01)
+        watcher._mtimes = {}  # força "mudou" na primeira volta
+        watcher.start()
+        await asyncio.sleep(0.05)
+        watcher._mtimes = {}
+        await asyncio.sleep(0.05)
+        alive = not watcher._task.done()
+        await watcher.stop()
+        return alive
+
+    assert asyncio.run(run())
+    assert len(calls) == 2
+
+def test_reload_revokes_keys_removed_from_env_file(tmp_path, monkeypatch):
+    from config import RouterConfig
+
+    for name in ("OPENAI_API_KEY", "OPENAI_API_KEYS", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("GOOGLE_API_KEY", "g-do-processo-0000")
+    monkeypatch.chdir(tmp_path)
+    config = RouterConfig(DEFAULT_CATALOG_PATH)
+    env_file = tmp_path / ".env"
+    env_file.write_text("ANTHROPIC_API_KEY=sk-ant-antiga-000000\n", encoding="utf-8")
+    config.reload()
+    assert set(config.available_providers) == {"anthropic", "google"}
+
+    # Chave vazada sai do .env: sai do ambiente também; a variável real do processo fica
+    env_file.write_text("OPENAI_API_KEY=sk-nova-0000000000\n", encoding="utf-8")
+    config.reload()
+    assert set(config.available_providers) == {"openai", "google"}
+
+@pytest.mark.parametrize("env_key, authorization", [(None, None), ("sk-local-000000000", "Bearer sk-local-000000000")])
+def test_local_provider_without_key_sends_no_authorization(monkeypatch, env_key, authorization):
+    from config import RouterConfig
+    from router import LLMRouter
+
+    for name in ("OPENAI_API_KEY", "OPENAI_API_KEYS", "ANTHROPIC_API_KEY", "GOOGLE_API_KEY", "LOCAL_LLM_API_KEY"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("LOCAL_LLM_BASE_URL", "http://llm.interno:8000/v1")
+    if env_key:
+        monkeypatch.setenv("LOCAL_LLM_API_KEY", env_key)
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("authorization"))
+        return httpx.Response(200, json={"choices": [{"message": {"content": "oi"}, "finish_reason": "stop"}],
+                                         "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}})
+
+    router = LLMRouter(RouterConfig())
+    router._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    result = asyncio.run(router.call_model("local-llama", "olá"))
+    assert result.error is None and seen == [authorization]
+    # A sonda de saúde segue a mesma regra
+    key = router.config.get_api_key("local")
+    _, headers = probe_request("local", "http://llm.interno:8000/v1", key)
+    assert headers.get("Authorization") == authorization
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do roteador aprendido (predict / predict_batch) e do route_batch
+"""
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from classifier import LearnedRouter
+from config import RouterConfig
+from router import LLMRouter
+
+EXAMPLES = {
+    "code": ["corrija este bug em python", "função javascript com erro", "refatore a classe java",
+             "erro de sintaxe no código python", "teste unitário da função"],
+    "creative": ["escreva um poema sobre o mar", "crie um slogan para a marca", "uma história de ficção curta",
+                 "poema de amor para o dia", "slogan criativo para campanha"],
+}
+MESSAGES = ["bug na função python", "um poema sobre a lua", "olá", "slogan para a loja"]
+
+@pytest.fixture(scope="module")
+def classifier():
+    messages = [m for examples in EXAMPLES.values() for m in examples]
+    labels = [label for label, examples in EXAMPLES.items() for _ in examples]
+    return LearnedRouter.train(messages, labels, n_features=2 ** 12, epochs=60, threshold=0.6)
+
+@pytest.fixture
+def router(monkeypatch, classifier):
+    for name in ("ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "OPENAI_API_KEYS", "LOCAL_LLM_BASE_URL", "ROUTER_MODEL_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-aaaaaaaaaaaa1111")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-ant-aaaaaaaa1111")
+    router = LLMRouter(RouterConfig())
+    router.classifier = classifier
+    return router
+
+def test_predict_learns_categories_and_batch_matches(classifier):
+    assert classifier.predict("bug na função python")[0] == "code"
+    assert classifier.predict("um poema sobre a lua")[0] == "creative"
+    for single, batched in zip([classifier.predict(m) for m in MESSAGES], classifier.predict_batch(MESSAGES)):
+        assert single[0] == batched[0]
+        assert single[1] == pytest.approx(batched[1], abs=1e-3)
+    assert classifier.predict_batch([]) == []
+
+def test_route_batch_matches_route_request(router):
+    assert router.route_batch(MESSAGES) == [router.route_request(m) for m in MESSAGES]
+    decisions = dict(zip(MESSAGES, router.route_batch(MESSAGES)))
+    assert "via classificador" in decisions["bug na função python"][1]
+
+def test_route_batch_degrades_under_overload(router):
+    router.degrade_check = lambda: True
+    decisions = router.route_batch(MESSAGES)
+    assert decisions == [router.route_request(m) for m in MESSAGES]
+    assert all(reasoning.startswith("🧯") for _, reasoning in decisions)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes dos micro-lotes de embeddings, sem rede: o provedor é um httpx.MockTransport
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from config import RouterConfig
+from embeddings import EmbeddingBatcher, unpack_floats
+from router import LLMRouter
+
+MODEL = "text-embedding-3-small"
+
+def _router(monkeypatch, handler, keys="sk-aaaaaaaaaaaa1111"):
+    for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "OPENAI_API_KEY",
+                 "LOCAL_LLM_BASE_URL", "ROUTER_MODEL_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEYS", keys)
+    router = LLMRouter(RouterConfig())
+    router._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return router
+
+def _vectors(request, drop=0):
+    texts = json.loads(request.content)["input"]
+    data = [{"index": i, "embedding": [float(i), 0.5]} for i in range(len(texts) - drop)]
+    return httpx.Response(200, json={"data": data, "usage": {"prompt_tokens": len(texts)}})
+
+def test_concurrent_calls_share_one_batch(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content)["input"])
+        return _vectors(request)
+
+    batcher = EmbeddingBatcher(_router(monkeypatch, handler), window=0.01)
+
+    async def run():
+        return await asyncio.gather(batcher.embed(MODEL, ["a", "b"]), batcher.embed(MODEL, ["b", "c"]))
+
+    first, second = asyncio.run(run())
+    assert requests == [["a", "b", "c"]]
+    assert [unpack_floats(v)[0] for v in first.vectors] == [0.0, 1.0]
+    assert [unpack_floats(v)[0] for v in second.vectors] == [1.0, 2.0]
+    assert second.deduplicated == 1
+
+def test_short_provider_response_fails_every_text(monkeypatch):
+    batcher = EmbeddingBatcher(_router(monkeypatch, lambda request: _vectors(request, drop=1)), window=0)
+
+    async def run():
+        return await asyncio.wait_for(batcher.embed(MODEL, ["a", "b", "c"]), timeout=2)
+
+    with pytest.raises(ValueError, match="2 vetores para 3 textos"):
+        asyncio.run(run())
+    assert batcher._inflight[MODEL] == {}
+
+def test_interrupted_batch_does_not_hang_callers(monkeypatch):
+    async def handler(request):
+        await asyncio.sleep(10)
+
+    batcher = EmbeddingBatcher(_router(monkeypatch, handler), window=0)
+
+    async def run():
+        waiting = asyncio.ensure_future(batcher.embed(MODEL, ["a"]))
+        await asyncio.sleep(0.01)
+        for task in batcher._tasks:
+            task.cancel()
+        return await asyncio.wait_for(waiting, timeout=2)
+
+    with pytest.raises(RuntimeError, match="interrompido"):
+        asyncio.run(run())
+
+def test_rate_limited_key_is_rotated(monkeypatch):
+    seen = []
+
+    def handler(request):
+        key = request.headers["authorization"][7:]
+        seen.append(key)
+        if key.startswith("sk-a"):
+            return httpx.Response(429, headers={"retry-after": "30"}, json={"error": "rate"})
+        return _vectors(request)
+
+    router = _router(monkeypatch, handler, keys="sk-aaaaaaaaaaaa1111,sk-bbbbbbbbbbbb2222")
+    batcher = EmbeddingBatcher(router, window=0)
+    for text in ("a", "b"):
+        assert len(asyncio.run(batcher.embed(MODEL, [text])).vectors) == 1
+    # A chave limitada descansa: a segunda chamada já vai direto para a outra
+    assert [key[:4] for key in seen] == ["sk-a", "sk-b", "sk-b"]
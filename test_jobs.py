@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+🧪 Teste da API de jobs assíncronos do RouterLLM
+"""
+
+import requests
+
+BASE_URL = "http://localhost:8000"
+
+def test_jobs():
+    print("📬 Testando POST /jobs + long-poll...")
+    try:
+        response = requests.post(f"{BASE_URL}/jobs", json={"message": "Resuma a história da computação"}, timeout=5)
+        if response.status_code == 429:
+            print(f"⚠️  Fila cheia, tente em {response.headers.get('Retry-After')}s")
+            return
+        if response.status_code != 202:
+            print(f"❌ POST /jobs retornou {response.status_code}: {response.text}")
+            return
+
+        job_id = response.json()["job_id"]
+        print(f"✅ Job criado: {job_id}")
+
+        response = requests.get(f"{BASE_URL}/jobs/{job_id}", params={"wait": 30}, timeout=35)
+        data = response.json()
+        print(f"📊 Status: {data['status']}")
+        if data["status"] == "done":
+            print(f"🤖 Modelo: {data['result']['model_used']}")
+            print(f"📝 Resposta: {data['result']['response'][:100]}...")
+        elif data["status"] == "failed":
+            print(f"❌ Erro: {data['error']}")
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+
+if __name__ == "__main__":
+    test_jobs()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do max_tokens adaptativo (OutputBudget)
+"""
+
+import asyncio
+
+import httpx
+
+from config import RouterConfig
+from output_budget import OutputBudget, is_truncated
+from router import LLMRouter
+
+def _feed(budget, sizes, category="general", model="gpt-4"):
+    for size in sizes:
+        budget.record(category, model, requested=1000, cap=1000, output_tokens=size,
+                      truncated=False, continuations=0, continuation_input_tokens=0)
+
+def test_is_truncated():
+    assert is_truncated("length") and is_truncated("max_tokens") and is_truncated("MAX_TOKENS")
+    assert not is_truncated("stop") and not is_truncated(None)
+
+def test_no_cap_before_min_samples():
+    budget = OutputBudget(min_samples=10)
+    _feed(budget, [100] * 9)
+    assert budget.suggest("general", "gpt-4", 1000) == 1000
+
+def test_cap_from_quantile_with_margin():
+    budget = OutputBudget(quantile=0.9, margin=1.5, min_samples=10, floor=16)
+    _feed(budget, range(10, 110, 10))  # 10..100
+    assert budget.suggest("general", "gpt-4", 1000) == 150  # p90 = 100, × 1,5
+    # Nunca acima do pedido pelo cliente; outros modelos/categorias não são afetados
+    assert budget.suggest("general", "gpt-4", 120) == 120
+    assert budget.suggest("code", "gpt-4", 1000) == 1000
+    assert budget.suggest("general", "claude-3-sonnet", 1000) == 1000
+
+def test_floor_and_window():
+    budget = OutputBudget(quantile=0.5, margin=1.0, min_samples=4, window=4, floor=64)
+    _feed(budget, [1000] * 4)
+    assert budget.suggest("general", "gpt-4", 2000) == 1000
+    _feed(budget, [5] * 4)  # a janela só guarda as 4 últimas
+    assert budget.suggest("general", "gpt-4", 2000) == 64
+
+def test_snapshot_accounts_savings_and_truncation():
+    budget = OutputBudget()
+    budget.record("general", "gpt-4", requested=1000, cap=300, output_tokens=300,
+                  truncated=True, continuations=1, continuation_input_tokens=120)
+    budget.record("general", "gpt-4", requested=1000, cap=300, output_tokens=80,
+                  truncated=False, continuations=0, continuation_input_tokens=0)
+    stats = budget.snapshot()["general"]["gpt-4"]
+    assert stats["predicted"] == 2 and stats["reserved_tokens_saved"] == 1400
+    assert stats["truncation_rate"] == 0.5
+    assert stats["net_tokens_saved"] == 1400 - 120
+    assert stats["samples"] == 2 and stats["current_cap"] is None
+
+def test_continuations_count_as_one_request(monkeypatch):
+    for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "OPENAI_API_KEYS",
+                 "LOCAL_LLM_BASE_URL", "ROUTER_MODEL_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-aaaaaaaaaaaa1111")
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        finish = "length" if len(calls) < 3 else "stop"
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": f"parte {len(calls)} "}, "finish_reason": finish}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 50, "total_tokens": 60},
+        })
+
+    router = LLMRouter(RouterConfig())
+    router._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    router.output_budget = OutputBudget(quantile=0.5, margin=1.0, min_samples=1, floor=16)
+    _feed(router.output_budget, [50], model="gpt-4o-mini")
+    result = asyncio.run(router.call_model("gpt-4o-mini", "olá", max_tokens=1000, category="general"))
+    assert len(calls) == 3
+    assert result.text == "parte 1 parte 2 parte 3 " and result.output_tokens == 150
+    # Três chamadas ao provedor, uma requisição do cliente
+    assert router.stats["total_requests"] == 1
+    assert router.stats["model_usage"] == {"gpt-4o-mini": 1}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes das faixas de prioridade (interativo x lote) na frente dos provedores
+"""
+
+import asyncio
+
+from scheduler import BULK, INTERACTIVE, PriorityScheduler, parse_weights
+
+def test_parse_weights():
+    assert parse_weights("") == {INTERACTIVE: 4.0, BULK: 1.0}
+    assert parse_weights("interactive=2, bulk=0, outra=9") == {INTERACTIVE: 2.0, BULK: 0.01}
+
+async def _hold(scheduler, lane, order, release):
+    async with scheduler.slot(lane):
+        order.append(lane)
+        await release.wait()
+
+def test_capacity_and_strict_priority():
+    async def run():
+        scheduler = PriorityScheduler(capacity=2, mode="strict", reserved_interactive=0)
+        release, order = asyncio.Event(), []
+        holders = [asyncio.create_task(_hold(scheduler, BULK, order, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert scheduler.in_use == 2
+        waiting_bulk = asyncio.create_task(_hold(scheduler, BULK, order, asyncio.Event()))
+        await asyncio.sleep(0)
+        waiting_interactive = asyncio.create_task(_hold(scheduler, INTERACTIVE, order, asyncio.Event()))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["lanes"][INTERACTIVE]["waiting"] == 1
+        assert scheduler.queue_delay(INTERACTIVE) > 0
+        release.set()
+        await asyncio.gather(*holders)
+        await asyncio.sleep(0)
+        # Estrito: o interativo que chegou depois passa na frente do lote
+        assert order[2:] == [INTERACTIVE, BULK]
+        for task in (waiting_bulk, waiting_interactive):
+            task.cancel()
+        await asyncio.gather(waiting_bulk, waiting_interactive, return_exceptions=True)
+        assert scheduler.in_use == 0
+        assert scheduler.queue_delay(INTERACTIVE) == 0.0
+
+    asyncio.run(run())
+
+def test_bulk_never_takes_reserved_slots():
+    async def run():
+        scheduler = PriorityScheduler(capacity=4, reserved_interactive=0.25, aging_seconds=60)
+        release, order = asyncio.Event(), []
+        bulk = [asyncio.create_task(_hold(scheduler, BULK, order, release)) for _ in range(4)]
+        await asyncio.sleep(0.01)
+        assert order == [BULK] * 3  # a quarta espera: a última vaga é do interativo
+        interactive = asyncio.create_task(_hold(scheduler, INTERACTIVE, order, release))
+        await asyncio.sleep(0.01)
+        assert order == [BULK] * 3 + [INTERACTIVE]
+        release.set()
+        await asyncio.gather(*bulk, interactive)
+        assert scheduler.in_use == 0
+
+    asyncio.run(run())
+
+def test_aged_bulk_is_promoted():
+    async def run():
+        scheduler = PriorityScheduler(capacity=2, reserved_interactive=0.5, aging_seconds=0.05)
+        release, order = asyncio.Event(), []
+        first = asyncio.create_task(_hold(scheduler, BULK, order, release))
+        second = asyncio.create_task(_hold(scheduler, BULK, order, release))
+        await asyncio.sleep(0.01)
+        assert order == [BULK]  # só a vaga não reservada
+        await asyncio.sleep(0.1)
+        # Envelheceu: pode usar a vaga reservada
+        assert order == [BULK, BULK]
+        assert scheduler.promoted == 1
+        release.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(run())
+
+def test_cancelled_waiter_releases_nothing():
+    async def run():
+        scheduler = PriorityScheduler(capacity=1)
+        release, order = asyncio.Event(), []
+        holder = asyncio.create_task(_hold(scheduler, INTERACTIVE, order, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(scheduler, INTERACTIVE, order, release))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        assert scheduler.in_use == 0
+        assert scheduler.stats()["lanes"][INTERACTIVE] == {"in_flight": 0, "waiting": 0}
+
+    asyncio.run(run())
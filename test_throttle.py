@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do ritmo adaptativo (GCRA) alimentado pelos cabeçalhos de rate limit
+"""
+
+import asyncio
+import types
+
+import pytest
+
+import throttle
+from keypool import KeyPools
+from throttle import AdaptiveThrottle
+
+KEYS = ("sk-aaaaaaaaaaaa", "sk-bbbbbbbbbbbb")
+
+def _observe(pools, key, remaining, limit=100, reset="10s", status=200):
+    state = pools._state("openai", key)
+    pools.observe(state, status, {
+        "x-ratelimit-limit-requests": str(limit),
+        "x-ratelimit-remaining-requests": str(remaining),
+        "x-ratelimit-reset-requests": reset,
+    })
+    return state
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Troca o asyncio.sleep do throttle por um registro das esperas"""
+    waited = []
+
+    async def sleep(seconds):
+        waited.append(seconds)
+
+    monkeypatch.setattr(throttle, "asyncio", types.SimpleNamespace(sleep=sleep))
+    return waited
+
+def test_capacity_without_limits_is_unpaced():
+    cap = AdaptiveThrottle(KeyPools()).capacity("openai", KEYS)
+    assert cap == {"rate": None, "headroom": 1.0, "blocked_until": None, "keys_reporting": 0}
+
+def test_capacity_sums_keys():
+    pools = KeyPools()
+    _observe(pools, KEYS[0], remaining=10)
+    _observe(pools, KEYS[1], remaining=30)
+    cap = AdaptiveThrottle(pools).capacity("openai", KEYS)
+    assert cap["keys_reporting"] == 2
+    assert cap["headroom"] == pytest.approx(40 / 200)
+    assert cap["rate"] == pytest.approx(4.0, rel=0.05)  # 40 pedidos espalhados em ~10s
+
+def test_near_limit():
+    pools = KeyPools()
+    throttle_ = AdaptiveThrottle(pools, near_limit=0.1)
+    _observe(pools, KEYS[0], remaining=50)
+    assert not throttle_.near_limit("openai", KEYS[:1])
+    _observe(pools, KEYS[0], remaining=5)
+    assert throttle_.near_limit("openai", KEYS[:1])
+
+def test_pace_spaces_calls_after_burst(sleeps):
+    pools = KeyPools()
+    _observe(pools, KEYS[0], remaining=10)  # ~1 pedido/s
+    throttle_ = AdaptiveThrottle(pools, burst=2)
+
+    async def run():
+        for _ in range(5):
+            await throttle_.pace("openai", KEYS[:1])
+
+    asyncio.run(run())
+    # A rajada (burst + 1) sai direto; depois, uma chamada por intervalo
+    assert len(sleeps) == 2
+    assert sleeps[0] == pytest.approx(1.0, abs=0.05)
+    assert sleeps[1] == pytest.approx(2.0, abs=0.05)
+    assert throttle_.waits["openai"] == 2
+
+def test_pace_waits_for_cooldown_up_to_max_wait(sleeps):
+    pools = KeyPools(cooldown=60)
+    _observe(pools, KEYS[0], remaining=0, status=429)
+    throttle_ = AdaptiveThrottle(pools, max_wait=3.0)
+    assert throttle_.capacity("openai", KEYS[:1])["headroom"] == 0.0
+    asyncio.run(throttle_.pace("openai", KEYS[:1]))
+    assert sleeps == [3.0]
+    # Uma chave ainda livre: nada a esperar
+    asyncio.run(throttle_.pace("openai", KEYS))
+    assert sleeps == [3.0]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+🧪 Testes do /v1/chat/completions (prazo, catálogo fixado), sem rede:
+o provedor é um httpx.MockTransport
+"""
+
+import asyncio
+import importlib
+import json
+import time
+
+import httpx
+import pytest
+
+from catalog import DEFAULT_CATALOG_PATH, compile_table
+
+MESSAGES = [{"role": "user", "content": "oi"}]
+EVENTS = [b'data: {"choices":[{"delta":{"content":"a"}}]}\n\n',
+          b'data: {"choices":[{"delta":{"content":"b"}}]}\n\n', b"data: [DONE]\n\n"]
+
+class SlowBody(httpx.AsyncByteStream):
+    def __init__(self, parts, delay, on_chunk=None):
+        self.parts, self.delay, self.on_chunk = parts, delay, on_chunk
+
+    async def __aiter__(self):
+        for i, part in enumerate(self.parts):
+            if self.on_chunk:
+                self.on_chunk(i)
+            await asyncio.sleep(self.delay)
+            yield part
+
+@pytest.fixture
+def main(monkeypatch):
+    for name in ("ANTHROPIC_API_KEY", "ANTHROPIC_API_KEYS", "GOOGLE_API_KEY", "OPENAI_API_KEYS",
+                 "LOCAL_LLM_BASE_URL", "ROUTER_MODEL_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test-0000000000000")
+    for name in ("LOG_FILE", "USAGE_DB_PATH", "BATCH_DB_PATH", "JOBS_DB_PATH"):
+        monkeypatch.setenv(name, "")
+    module = importlib.import_module("main")
+    module.config.reload(reload_env=False)
+    yield module
+    module.config.reload(reload_env=False)
+
+def _post(main, upstream, headers=None, stream=False):
+    async def run():
+        main.router._client = httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            started = time.monotonic()
+            response = await client.post("/v1/chat/completions", headers=headers or {},
+                                         json={"model": "gpt-4o-mini", "messages": MESSAGES, "stream": stream})
+            return response, time.monotonic() - started
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_timeout_header_bounds_passthrough(main, stream):
+    async def slow(request):
+        await asyncio.sleep(0.5)
+        return httpx.Response(200, json={"choices": []})
+
+    response, elapsed = _post(main, slow, {"x-timeout-ms": "100"}, stream)
+    assert response.status_code == 504
+    assert elapsed < 0.4
+
+def test_deadline_ends_stream_midway(main):
+    upstream = lambda request: httpx.Response(200, stream=SlowBody(EVENTS, 0.1),
+                                              headers={"content-type": "text/event-stream"})
+    response, elapsed = _post(main, upstream, {"x-timeout-ms": "250"}, stream=True)
+    assert response.status_code == 200
+    assert b"[DONE]" not in response.content and response.content.startswith(b"data: ")
+    assert elapsed < 0.35
+
+def test_stream_keeps_pinned_catalog_across_reload(main):
+    with open(DEFAULT_CATALOG_PATH, encoding="utf-8") as f:
+        without_openai = compile_table(json.load(f), env={"GOOGLE_API_KEY": "g-000000000000"})
+
+    seen = []
+
+    def reload_midway(index):
+        if index == 1:
+            main.config._table = without_openai
+        seen.append("gpt-4o-mini" in main.config.get_available_models())
+
+    upstream = lambda request: httpx.Response(200, stream=SlowBody(EVENTS, 0, reload_midway),
+                                              headers={"content-type": "text/event-stream"})
+    response, _ = _post(main, upstream, stream=True)
+    assert response.status_code == 200 and response.content.endswith(b"data: [DONE]\n\n")
+    # O corpo inteiro roda com o catálogo do início do pedido
+    assert len(seen) == 3 and all(seen)
+
+def test_throttle_wait_longer_than_deadline_is_504(main):
+    state = main.router.key_pools._state("openai", "sk-test-0000000000000")
+    state.cooldown_until = time.time() + 5
+    try:
+        response, elapsed = _post(main, lambda request: httpx.Response(200, json={}), {"x-timeout-ms": "100"})
+    finally:
+        state.cooldown_until = 0.0
+    assert response.status_code == 504
+    assert elapsed < 0.1
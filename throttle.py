@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+🚦 Ritmo adaptativo por provedor (client-side throttling)
+Os cabeçalhos de rate limit (x-ratelimit-*, anthropic-ratelimit-*,
+retry-after) alimentam o estado das chaves no KeyPools; daqui sai um modelo
+vivo da capacidade de cada provedor: quanto sobra e em quanto tempo reseta.
+As chamadas são espaçadas por um balde furado (GCRA) na vazão que cabe no
+que sobra, em vez de estourar em rajada e colher 429. Provedor perto do
+limite sai da frente no roteamento (a lista de preferência segue adiante)
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import deadlines
+import profiling
+from deadlines import DeadlineExceeded
+from metrics import metrics
+
+class AdaptiveThrottle:
+    """
+    `near_limit`: fração de folga abaixo da qual o provedor é evitado no roteamento
+    `burst`: chamadas que podem sair juntas antes do espaçamento valer
+    `max_wait`: espera máxima por chamada (o resto fica por conta do prazo/429)
+    """
+
+    def __init__(self, key_pools, near_limit: float = 0.1, burst: int = 5, max_wait: float = 10.0):
+        self.key_pools = key_pools
+        self.near_limit_fraction = near_limit
+        self.burst = burst
+        self.max_wait = max_wait
+        self._tat: Dict[str, float] = {}  # "theoretical arrival time" do GCRA por provedor
+        self.waits: Dict[str, int] = {}
+        self.wait_seconds: Dict[str, float] = {}
+
+    def capacity(self, provider: str, keys: Sequence[str], tokens: int = 0) -> Dict[str, Any]:
+        """
+        Soma das chaves do provedor: folga, vazão sustentável (req/s) e até quando está bloqueado
+        `rate` = None quando alguma chave livre ainda não informou limites (sem espaçamento)
+        `tokens` estima o custo da chamada no limite de tokens por minuto
+        """
+        now = time.time()
+        states = [self.key_pools.get(key) for key in keys]
+        rate: Optional[float] = 0.0
+        remaining = limit = known = 0
+        for state in states:
+            if state is None or now >= state.budget_reset_at or state.remaining_requests is None:
+                # Chave sem limites conhecidos (ou já resetada): vazão livre
+                if state is None or not state.cooling(now):
+                    rate = None
+                continue
+            known += 1
+            remaining += state.remaining_requests
+            limit += state.limit_requests or state.remaining_requests
+            if rate is None or state.cooling(now):
+                continue
+            # O que sobra, espalhado até o reset
+            window = max(state.budget_reset_at - now, 0.05)
+            key_rate = state.remaining_requests / window
+            if tokens and state.remaining_tokens is not None:
+                key_rate = min(key_rate, state.remaining_tokens / tokens / window)
+            rate += key_rate
+        blocked_until = None
+        if states and all(s is not None and s.cooling(now) for s in states):
+            blocked_until = min(max(s.cooldown_until, s.budget_reset_at) for s in states)
+        if blocked_until is not None:
+            headroom = 0.0
+        elif rate is None or not limit:
+            # Alguma chave livre sem limites conhecidos: conta como folga cheia
+            headroom = 1.0
+        else:
+            headroom = remaining / limit
+        return {"rate": rate, "headroom": headroom, "blocked_until": blocked_until, "keys_reporting": known}
+
+    def near_limit(self, provider: str, keys: Sequence[str]) -> bool:
+        return self.capacity(provider, keys)["headroom"] < self.near_limit_fraction
+
+    async def pace(self, provider: str, keys: Sequence[str], tokens: int = 0):
+        """
+        ⏳ Espera a vez da chamada no balde do provedor
+        Todas as chaves em cooldown: espera a primeira voltar (até `max_wait`)
+        Espera que passaria do prazo da requisição levanta DeadlineExceeded na hora
+        """
+        cap = self.capacity(provider, keys, tokens)
+        metrics.set_provider_headroom(provider, cap["headroom"])
+        now = time.time()
+        wait = interval = 0.0
+        if cap["blocked_until"] is not None:
+            wait = cap["blocked_until"] - now
+        elif cap["rate"]:
+            interval = 1.0 / cap["rate"]
+            tat = max(self._tat.get(provider, now), now)
+            wait = tat - now - self.burst * interval
+            self._tat[provider] = tat + interval
+        elif cap["rate"] is None:
+            # Sem limites conhecidos: nada a espaçar, o balde esvazia
+            self._tat.pop(provider, None)
+        wait = min(max(wait, 0.0), self.max_wait)
+        if wait <= 0:
+            return
+        left = deadlines.remaining()
+        if left is not None and wait >= left:
+            # Não dá tempo: desiste já e devolve a vez no balde a quem ainda pode esperar
+            if interval:
+                self._tat[provider] -= interval
+            raise DeadlineExceeded("Prazo da requisição esgotado esperando o ritmo do provedor")
+        self.waits[provider] = self.waits.get(provider, 0) + 1
+        self.wait_seconds[provider] = self.wait_seconds.get(provider, 0.0) + wait
+        metrics.record_throttle_wait(provider, wait)
+        with profiling.span("throttle"):
+            await asyncio.sleep(wait)
+
+    def stats(self, pools: Dict[str, Sequence[str]]) -> Dict[str, Any]:
+        result = {}
+        for provider, keys in pools.items():
+            cap = self.capacity(provider, keys)
+            result[provider] = {
+                "headroom": round(cap["headroom"], 3),
+                "sustainable_rps": round(cap["rate"], 2) if cap["rate"] is not None else None,
+                "near_limit": cap["headroom"] < self.near_limit_fraction,
+                "blocked_seconds": round(max(0.0, cap["blocked_until"] - time.time()), 1)
+                if cap["blocked_until"] is not None else 0.0,
+                "waits": self.waits.get(provider, 0),
+                "wait_seconds": round(self.wait_seconds.get(provider, 0.0), 3),
+            }
+        return result